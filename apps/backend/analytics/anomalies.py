@@ -0,0 +1,338 @@
+"""
+Detección de anomalías en streaming sobre la carga y la salud de los APs.
+
+Series vigiladas:
+    client_count       por AP (snapshots de APs)
+    cpu_utilization    por AP
+    radio_utilization  por AP y radio (`radios[].utilization`)
+    health             media de `health` de los clientes de cada AP (snapshots de clientes)
+
+Cada serie mantiene una media/varianza EWMA y una línea base estacional por
+día de la semana × hora (también EWMA). Cada observación se puntúa contra la
+estacional si ya tiene historia suficiente y, si no, contra la EWMA; después
+actualiza ambas. Todo son operaciones vectorizadas sobre arrays indexados por
+serie: O(1) por registro. Además, una radio por encima de STUCK_UTILIZATION
+durante STUCK_SNAPSHOTS snapshots seguidos se marca como atascada.
+
+Las anomalías se acumulan en una tabla (`data/processed/anomalies/`) que sirve
+la API del backend.
+
+Uso:
+    python -m analytics.anomalies build
+    python -m analytics.anomalies show --metric cpu_utilization --limit 20
+"""
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+import pandas as pd
+
+from analytics.snapshots import (
+    AP_DIR,
+    AP_PATTERN,
+    CLIENT_DIR,
+    CLIENT_PATTERN,
+    PROCESSED_DIR,
+    column,
+    list_snapshots,
+    load_records,
+    load_table,
+    parse_snapshot_timestamp,
+    save_table,
+)
+
+STATE_FILE: Final = PROCESSED_DIR / "anomalies" / "detector.npz"
+
+ALPHA: Final = 0.1  # EWMA reciente (~10 snapshots, unas 2,5 h)
+SEASONAL_ALPHA: Final = 0.1  # línea base de cada franja día × hora
+WARMUP: Final = 8  # observaciones antes de puntuar con la EWMA
+SEASONAL_MIN: Final = 8  # observaciones de la franja para usar la estacional
+Z_THRESHOLD: Final = 4.0
+STUCK_UTILIZATION: Final = 90.0
+STUCK_SNAPSHOTS: Final = 8  # 2 h con snapshots cada 15 min
+MAX_RADIOS: Final = 4
+MAX_EVENTS: Final = 200_000
+SLOTS: Final = 7 * 24
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    direction: int  # +1 solo picos, -1 solo caídas, 0 ambos
+    min_std: float  # desviación mínima para no disparar con series casi constantes
+
+
+METRICS: Final = {
+    "client_count": MetricSpec(direction=0, min_std=2.0),
+    "cpu_utilization": MetricSpec(direction=1, min_std=5.0),
+    "radio_utilization": MetricSpec(direction=1, min_std=5.0),
+    "health": MetricSpec(direction=-1, min_std=5.0),
+}
+STATE_FIELDS: Final = ("mean", "var", "n", "s_mean", "s_var", "s_n", "streak")
+EVENT_COLUMNS: Final = ("time", "metric", "ap", "radio", "value", "expected", "z", "kind")
+
+
+class BaselineState:
+    """Estado EWMA + estacional de un conjunto de series (una por índice)."""
+
+    def __init__(self, arrays: dict[str, np.ndarray] | None = None):
+        arrays = arrays or {}
+        self.mean = arrays.get("mean", np.zeros(0))
+        self.var = arrays.get("var", np.zeros(0))
+        self.n = arrays.get("n", np.zeros(0, np.uint32))
+        self.s_mean = arrays.get("s_mean", np.zeros((0, SLOTS)))
+        self.s_var = arrays.get("s_var", np.zeros((0, SLOTS)))
+        self.s_n = arrays.get("s_n", np.zeros((0, SLOTS), np.uint16))
+        self.streak = arrays.get("streak", np.zeros(0, np.uint16))
+
+    def ensure(self, size: int) -> None:
+        if size <= len(self.mean):
+            return
+        size = max(size, 2 * len(self.mean), 64)
+        for name in STATE_FIELDS:
+            current = getattr(self, name)
+            grown = np.zeros((size,) + current.shape[1:], current.dtype)
+            grown[: len(current)] = current
+            setattr(self, name, grown)
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in STATE_FIELDS}
+
+    def observe(self, ids: np.ndarray, x: np.ndarray, slot: int, spec: MetricSpec) -> tuple[np.ndarray, np.ndarray]:
+        """Puntúa `x` contra el estado previo y actualiza. Devuelve (esperado, z)."""
+        self.ensure(int(ids.max()) + 1 if len(ids) else 0)
+        mean, var, n = self.mean[ids], self.var[ids], self.n[ids]
+        s_mean, s_var, s_n = self.s_mean[ids, slot], self.s_var[ids, slot], self.s_n[ids, slot]
+
+        seasonal = s_n >= SEASONAL_MIN
+        expected = np.where(seasonal, s_mean, mean)
+        std = np.maximum(np.sqrt(np.where(seasonal, s_var, var)), spec.min_std)
+        z = np.where(seasonal | (n >= WARMUP), (x - expected) / std, 0.0)
+
+        # EWMA (la primera observación inicializa la media)
+        diff = np.where(n > 0, x - mean, 0.0)
+        incr = ALPHA * diff
+        self.mean[ids] = np.where(n > 0, mean + incr, x)
+        self.var[ids] = (1 - ALPHA) * (var + diff * incr)
+        self.n[ids] = np.minimum(n.astype(np.int64) + 1, np.iinfo(np.uint32).max)
+
+        diff = np.where(s_n > 0, x - s_mean, 0.0)
+        incr = SEASONAL_ALPHA * diff
+        self.s_mean[ids, slot] = np.where(s_n > 0, s_mean + incr, x)
+        self.s_var[ids, slot] = (1 - SEASONAL_ALPHA) * (s_var + diff * incr)
+        self.s_n[ids, slot] = np.minimum(s_n.astype(np.int64) + 1, np.iinfo(np.uint16).max)
+        return expected, z
+
+
+class AnomalyDetector:
+    def __init__(self, path: Path = STATE_FILE):
+        self.path = path
+        self.ap_names: list[str] = []
+        self.sources: set[str] = set()
+        self.states = {metric: BaselineState() for metric in METRICS}
+        self.events: dict[str, list] = {name: [] for name in EVENT_COLUMNS}
+        if path.exists():
+            self._load()
+        self._ap_index = {name: i for i, name in enumerate(self.ap_names)}
+
+    def _load(self) -> None:
+        arrays, _ = load_table(self.path)
+        self.ap_names = arrays["ap_names"].tolist()
+        self.sources = set(arrays["sources"].tolist())
+        for metric in METRICS:
+            self.states[metric] = BaselineState(
+                {name: arrays[f"{metric}__{name}"] for name in STATE_FIELDS if f"{metric}__{name}" in arrays}
+            )
+        for name in EVENT_COLUMNS:
+            self.events[name] = arrays[f"event_{name}"].tolist()
+
+    def save(self) -> None:
+        arrays = {
+            "ap_names": np.array(self.ap_names, dtype=str),
+            "sources": np.array(sorted(self.sources), dtype=str),
+        }
+        for metric, state in self.states.items():
+            for name, array in state.arrays().items():
+                arrays[f"{metric}__{name}"] = array
+        for name in EVENT_COLUMNS:
+            values = self.events[name][-MAX_EVENTS:]
+            self.events[name] = values
+            dtype = str if name in ("time", "metric", "ap", "kind") else np.float64
+            arrays[f"event_{name}"] = np.array(values, dtype=dtype)
+        save_table(self.path, arrays)
+
+    def _ap_codes(self, names: list[str]) -> np.ndarray:
+        codes = np.empty(len(names), dtype=np.intp)
+        for i, name in enumerate(names):
+            code = self._ap_index.get(name)
+            if code is None:
+                code = self._ap_index[name] = len(self.ap_names)
+                self.ap_names.append(name)
+            codes[i] = code
+        return codes
+
+    # --- Ingesta ---
+
+    def _observe(self, metric: str, ts: datetime, ids: np.ndarray, values: np.ndarray, radios: np.ndarray | None = None) -> int:
+        ok = ~np.isnan(values)
+        ids, values = ids[ok], values[ok]
+        radios = radios[ok] if radios is not None else None
+        spec = METRICS[metric]
+        slot = ts.weekday() * 24 + ts.hour
+        expected, z = self.states[metric].observe(ids, values, slot, spec)
+
+        if spec.direction > 0:
+            flagged = z > Z_THRESHOLD
+        elif spec.direction < 0:
+            flagged = z < -Z_THRESHOLD
+        else:
+            flagged = np.abs(z) > Z_THRESHOLD
+        kinds = np.where(z > 0, "spike", "drop").astype(object)
+
+        if metric == "radio_utilization":
+            state = self.states[metric]
+            high = values >= STUCK_UTILIZATION
+            streak = np.where(high, state.streak[ids].astype(np.int64) + 1, 0)
+            state.streak[ids] = np.minimum(streak, np.iinfo(np.uint16).max)
+            stuck = streak == STUCK_SNAPSHOTS  # solo al entrar en el estado
+            kinds[stuck & ~flagged] = "stuck"
+            flagged |= stuck
+
+        hits = np.flatnonzero(flagged)
+        if not len(hits):
+            return 0
+        time_str = ts.isoformat()
+        ap_codes = ids[hits] // MAX_RADIOS if radios is not None else ids[hits]
+        self.events["time"].extend([time_str] * len(hits))
+        self.events["metric"].extend([metric] * len(hits))
+        self.events["ap"].extend(self.ap_names[code] for code in ap_codes)
+        self.events["radio"].extend(radios[hits].tolist() if radios is not None else [-1] * len(hits))
+        self.events["value"].extend(values[hits].tolist())
+        self.events["expected"].extend(np.round(expected[hits], 2).tolist())
+        self.events["z"].extend(np.round(z[hits], 2).tolist())
+        self.events["kind"].extend(kinds[hits].tolist())
+        return len(hits)
+
+    def add_ap_snapshot(self, path: Path) -> bool:
+        if path.name in self.sources:
+            return False
+        ts = parse_snapshot_timestamp(path)
+        records = [r for r in load_records(path) if r.get("name")]
+        codes, first = np.unique(self._ap_codes([r["name"] for r in records]), return_index=True)
+        records = [records[i] for i in first]
+        self._observe("client_count", ts, codes, column(records, "client_count"))
+        self._observe("cpu_utilization", ts, codes, column(records, "cpu_utilization"))
+
+        radio_ids, radio_index, utilization = [], [], []
+        for code, record in zip(codes, records):
+            for radio in record.get("radios") or []:
+                index = radio.get("index")
+                value = radio.get("utilization")
+                if isinstance(index, int) and 0 <= index < MAX_RADIOS and value is not None:
+                    radio_ids.append(code * MAX_RADIOS + index)
+                    radio_index.append(index)
+                    utilization.append(value)
+        if radio_ids:
+            self._observe(
+                "radio_utilization",
+                ts,
+                np.array(radio_ids, dtype=np.intp),
+                np.array(utilization, dtype=float),
+                np.array(radio_index, dtype=np.int64),
+            )
+        self.sources.add(path.name)
+        return True
+
+    def add_client_snapshot(self, path: Path) -> bool:
+        if path.name in self.sources:
+            return False
+        records = [r for r in load_records(path) if r.get("associated_device_name")]
+        codes, inverse = np.unique(self._ap_codes([r["associated_device_name"] for r in records]), return_inverse=True)
+        health = column(records, "health")
+        ok = ~np.isnan(health)
+        counts = np.bincount(inverse[ok], minlength=len(codes))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_health = np.bincount(inverse[ok], health[ok], minlength=len(codes)) / counts
+        self._observe("health", parse_snapshot_timestamp(path), codes, mean_health)
+        self.sources.add(path.name)
+        return True
+
+    def events_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.events, columns=list(EVENT_COLUMNS))
+
+
+_events_cache: dict[Path, tuple[int, pd.DataFrame]] = {}
+
+
+def load_events(path: Path = STATE_FILE) -> pd.DataFrame:
+    """Tabla de anomalías guardada, recargada solo si el fichero ha cambiado."""
+    if not path.exists():
+        return pd.DataFrame(columns=list(EVENT_COLUMNS))
+    mtime = path.stat().st_mtime_ns
+    cached = _events_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with np.load(path, allow_pickle=False) as data:
+            frame = pd.DataFrame({name: data[f"event_{name}"] for name in EVENT_COLUMNS})
+        frame["radio"] = frame["radio"].astype(np.int64)
+        cached = _events_cache[path] = (mtime, frame)
+    return cached[1]
+
+
+def query_events(
+    since=None, metric: str | None = None, ap: str | None = None, kind: str | None = None, limit: int = 100, path: Path = STATE_FILE
+) -> pd.DataFrame:
+    """Anomalías más recientes primero, filtradas."""
+    df = load_events(path)
+    mask = np.ones(len(df), dtype=bool)
+    if since is not None:
+        # Comparación en hora local: los instantes son ISO con el offset al final
+        mask &= (df["time"].str[:19] >= pd.Timestamp(since).strftime("%Y-%m-%dT%H:%M:%S")).to_numpy()
+    if metric is not None:
+        mask &= (df["metric"] == metric).to_numpy()
+    if ap is not None:
+        mask &= (df["ap"] == ap).to_numpy()
+    if kind is not None:
+        mask &= (df["kind"] == kind).to_numpy()
+    return df[mask].iloc[::-1].head(limit)
+
+
+def build_detector(max_files: int | None = None) -> AnomalyDetector:
+    """Procesa los snapshots nuevos de APs y clientes en orden temporal."""
+    detector = AnomalyDetector()
+    files = [(parse_snapshot_timestamp(p), "aps", p) for p in list_snapshots(AP_DIR, AP_PATTERN) if p.name not in detector.sources]
+    files += [(parse_snapshot_timestamp(p), "clients", p) for p in list_snapshots(CLIENT_DIR, CLIENT_PATTERN) if p.name not in detector.sources]
+    files.sort(key=lambda item: item[0])
+    if max_files is not None:
+        files = files[:max_files]
+    before = len(detector.events["time"])
+    print(f"Procesando {len(files)} snapshots nuevos...")
+    for i, (_, kind, path) in enumerate(files, start=1):
+        (detector.add_ap_snapshot if kind == "aps" else detector.add_client_snapshot)(path)
+        if i % 500 == 0:
+            print(f"  {i}/{len(files)}")
+    detector.save()
+    print(f"{len(detector.events['time']) - before} anomalías nuevas; estado guardado en {detector.path}.")
+    return detector
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detector de anomalías por AP (EWMA + estacional).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Procesa los snapshots nuevos.")
+    build.add_argument("--max-files", type=int, default=None)
+    show = sub.add_parser("show", help="Muestra las anomalías más recientes.")
+    show.add_argument("--metric", choices=list(METRICS))
+    show.add_argument("--ap")
+    show.add_argument("--since")
+    show.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_detector(args.max_files)
+    else:
+        print(query_events(args.since, args.metric, args.ap, limit=args.limit).to_string(index=False))
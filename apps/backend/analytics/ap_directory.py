@@ -0,0 +1,66 @@
+"""
+Mapeo AP -> edificio/planta a partir del GeoJSON del paquete de geolocalización.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+
+from analytics.snapshots import ROOT_DIR
+
+GEO_FILE: Final = ROOT_DIR / "packages" / "geolocation" / "data" / "aps_geolocalizados_wgs84.geojson"
+UNKNOWN: Final = "N/A"
+
+
+@dataclass(frozen=True)
+class APLocation:
+    building_code: str  # Nom_Edific
+    building_name: str  # USER_EDIFI
+    floor: int | None  # Num_Planta
+    lat: float | None
+    lon: float | None
+
+
+@lru_cache(maxsize=None)
+def load_ap_directory(geo_file: Path = GEO_FILE) -> dict[str, APLocation]:
+    """{nombre de AP: APLocation}. Vacío si no existe el GeoJSON."""
+    if not geo_file.exists():
+        return {}
+    with geo_file.open("r", encoding="utf-8") as f:
+        payload = json.load(f)
+
+    directory = {}
+    for feature in payload.get("features", []):
+        props = feature.get("properties") or {}
+        name = props.get("USER_NOM_A")
+        if not name:
+            continue
+        coords = (feature.get("geometry") or {}).get("coordinates") or [None, None]
+        floor = props.get("Num_Planta")
+        directory[name] = APLocation(
+            building_code=props.get("Nom_Edific") or UNKNOWN,
+            building_name=props.get("USER_EDIFI") or UNKNOWN,
+            floor=int(floor) if floor is not None else None,
+            lon=coords[0],
+            lat=coords[1],
+        )
+    return directory
+
+
+def lookup_arrays(ap_names: list[str]) -> dict[str, np.ndarray]:
+    """Columnas `building_code`, `building_name` y `floor` alineadas con `ap_names`."""
+    directory = load_ap_directory()
+    locations = [directory.get(name) for name in ap_names]
+    return {
+        "building_code": np.array([loc.building_code if loc else UNKNOWN for loc in locations], dtype=object),
+        "building_name": np.array([loc.building_name if loc else UNKNOWN for loc in locations], dtype=object),
+        "floor": np.array(
+            [loc.floor if loc and loc.floor is not None else np.nan for loc in locations], dtype=float
+        ),
+    }
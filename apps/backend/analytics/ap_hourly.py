@@ -0,0 +1,215 @@
+"""
+Rollup horario de los snapshots de APs: hora × AP.
+
+Matrices densas [horas, APs] con sumas y máximos de `client_count` y
+`cpu_utilization`, cuántas veces se ha visto cada AP en la hora y cuántas
+estaba `Up`. Como todo son sumas/máximos, los snapshots pueden llegar tarde o
+desordenados; cada fichero se cuenta una sola vez (`sources`).
+
+Uso:
+    python -m analytics.ap_hourly build
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Final, Iterable
+
+import numpy as np
+import pandas as pd
+
+from analytics.ap_directory import lookup_arrays
+from analytics.snapshots import (
+    AP_DIR,
+    AP_PATTERN,
+    PROCESSED_DIR,
+    column,
+    list_snapshots,
+    load_records,
+    load_table,
+    parse_snapshot_timestamp,
+    save_table,
+)
+
+ROLLUP_FILE: Final = PROCESSED_DIR / "ap_hourly" / "ap_hourly.npz"
+EPOCH: Final = datetime(2020, 1, 1)
+
+# Matrices [hora, AP] y su tipo
+MATRICES: Final = {
+    "seen": np.uint16,  # snapshots de la hora en los que aparece el AP
+    "up": np.uint16,  # ... y con status == "Up"
+    "clients_sum": np.float64,
+    "clients_max": np.float32,
+    "cpu_n": np.uint16,
+    "cpu_sum": np.float64,
+    "cpu_max": np.float32,
+}
+
+
+def hour_bucket(ts: datetime) -> int:
+    """Horas desde EPOCH en la hora local del snapshot."""
+    return int((ts.replace(tzinfo=None) - EPOCH) // timedelta(hours=1))
+
+
+class APHourlyRollup:
+    def __init__(self):
+        self.ap_names: list[str] = []
+        self.buckets: list[int] = []  # bucket horario de cada fila, en orden de llegada
+        self.snapshots: list[int] = []  # nº de snapshots de APs de cada fila
+        self.sources: set[str] = set()
+        self.data = {name: np.zeros((0, 0), dtype) for name, dtype in MATRICES.items()}
+        self._ap_index: dict[str, int] = {}
+        self._row_index: dict[int, int] = {}
+
+    def _resize(self, rows: int, cols: int) -> None:
+        cur_rows, cur_cols = self.data["seen"].shape
+        if rows <= cur_rows and cols <= cur_cols:
+            return
+        # Crecimiento geométrico en filas; las columnas (APs) apenas cambian
+        new_shape = (max(rows, 2 * cur_rows) if rows > cur_rows else cur_rows, max(cols, cur_cols))
+        for name, dtype in MATRICES.items():
+            grown = np.zeros(new_shape, dtype)
+            grown[:cur_rows, :cur_cols] = self.data[name]
+            self.data[name] = grown
+
+    def _row(self, bucket: int) -> int:
+        row = self._row_index.get(bucket)
+        if row is None:
+            row = self._row_index[bucket] = len(self.buckets)
+            self.buckets.append(bucket)
+            self.snapshots.append(0)
+        return row
+
+    def _ap_codes(self, names: list[str]) -> np.ndarray:
+        codes = np.empty(len(names), dtype=np.intp)
+        for i, name in enumerate(names):
+            code = self._ap_index.get(name)
+            if code is None:
+                code = self._ap_index[name] = len(self.ap_names)
+                self.ap_names.append(name)
+            codes[i] = code
+        return codes
+
+    def add_ap_snapshot(self, path: Path) -> bool:
+        return self.add_ap_records(load_records(path), parse_snapshot_timestamp(path), path.name)
+
+    def add_ap_records(self, records: list[dict], snapshot_ts: datetime, source: str) -> bool:
+        if source in self.sources:
+            return False
+        records = [r for r in records if r.get("name")]
+        row = self._row(hour_bucket(snapshot_ts))
+        self.sources.add(source)
+        self.snapshots[row] += 1
+
+        codes = self._ap_codes([r["name"] for r in records])
+        self._resize(len(self.buckets), len(self.ap_names))
+        if not len(codes):
+            return True
+
+        clients = column(records, "client_count")
+        cpu = column(records, "cpu_utilization")
+        up = np.array([r.get("status") == "Up" for r in records])
+        d = self.data
+        # Un AP aparece una vez por snapshot: los índices de fancy indexing no se repiten
+        codes, first = np.unique(codes, return_index=True)
+        clients, cpu, up = clients[first], cpu[first], up[first]
+        d["seen"][row, codes] += 1
+        d["up"][row, codes] += up.astype(np.uint16)
+        ok = ~np.isnan(clients)
+        d["clients_sum"][row, codes[ok]] += clients[ok]
+        d["clients_max"][row, codes[ok]] = np.maximum(d["clients_max"][row, codes[ok]], clients[ok])
+        ok = ~np.isnan(cpu)
+        d["cpu_n"][row, codes[ok]] += 1
+        d["cpu_sum"][row, codes[ok]] += cpu[ok]
+        d["cpu_max"][row, codes[ok]] = np.maximum(d["cpu_max"][row, codes[ok]], cpu[ok])
+        return True
+
+    def add_ap_snapshots(self, paths: Iterable[Path], verbose: bool = False) -> int:
+        added = 0
+        for i, path in enumerate(paths, start=1):
+            added += self.add_ap_snapshot(path)
+            if verbose and i % 100 == 0:
+                print(f"  {i} ficheros procesados ({len(self.buckets)} horas)")
+        return added
+
+    # --- Persistencia ---
+
+    def save(self, path: Path = ROLLUP_FILE) -> None:
+        rows, cols = len(self.buckets), len(self.ap_names)
+        arrays = {name: matrix[:rows, :cols] for name, matrix in self.data.items()}
+        arrays["ap_names"] = np.array(self.ap_names, dtype=str)
+        arrays["buckets"] = np.array(self.buckets, dtype=np.int64)
+        arrays["snapshots"] = np.array(self.snapshots, dtype=np.uint16)
+        arrays["sources"] = np.array(sorted(self.sources), dtype=str)
+        save_table(path, arrays, {"epoch": EPOCH.isoformat()})
+
+    @classmethod
+    def load(cls, path: Path = ROLLUP_FILE) -> "APHourlyRollup":
+        arrays, _ = load_table(path)
+        rollup = cls()
+        rollup.ap_names = arrays["ap_names"].tolist()
+        rollup._ap_index = {name: i for i, name in enumerate(rollup.ap_names)}
+        rollup.buckets = arrays["buckets"].tolist()
+        rollup._row_index = {bucket: i for i, bucket in enumerate(rollup.buckets)}
+        rollup.snapshots = arrays["snapshots"].tolist()
+        rollup.sources = set(arrays["sources"].tolist())
+        rollup.data = {name: arrays[name] for name in MATRICES}
+        return rollup
+
+    # --- Consultas ---
+
+    def frame(self, since=None, until=None) -> pd.DataFrame:
+        """Tabla larga hora × AP (solo pares con datos), ordenada por hora."""
+        rows, cols = len(self.buckets), len(self.ap_names)
+        buckets = np.array(self.buckets, dtype=np.int64)
+        keep = np.ones(rows, dtype=bool)
+        if since is not None:
+            keep &= buckets >= hour_bucket(pd.Timestamp(since).to_pydatetime())
+        if until is not None:
+            keep &= buckets < hour_bucket((pd.Timestamp(until) + pd.Timedelta(days=1)).to_pydatetime())
+        order = np.flatnonzero(keep)[np.argsort(buckets[keep], kind="stable")]
+
+        seen = self.data["seen"][order, :cols]
+        r, c = np.nonzero(seen)
+        rows_idx = order[r]
+        location = lookup_arrays(self.ap_names)
+        n_seen = seen[r, c].astype(float)
+        cpu_n = self.data["cpu_n"][rows_idx, c].astype(float)
+        return pd.DataFrame(
+            {
+                "hour": pd.Timestamp(EPOCH) + pd.to_timedelta(buckets[rows_idx], unit="h"),
+                "ap": np.array(self.ap_names, dtype=object)[c],
+                "building": location["building_code"][c],
+                "floor": location["floor"][c],
+                "snapshots": np.array(self.snapshots, dtype=np.int64)[rows_idx],
+                "seen": n_seen.astype(np.int64),
+                "up_ratio": self.data["up"][rows_idx, c] / n_seen,
+                "clients_mean": self.data["clients_sum"][rows_idx, c] / n_seen,
+                "clients_max": self.data["clients_max"][rows_idx, c],
+                "cpu_mean": self.data["cpu_sum"][rows_idx, c] / np.where(cpu_n > 0, cpu_n, np.nan),
+                "cpu_max": np.where(cpu_n > 0, self.data["cpu_max"][rows_idx, c], np.nan),
+            }
+        )
+
+
+def build_rollup(max_files: int | None = None, rebuild: bool = False, path: Path = ROLLUP_FILE) -> APHourlyRollup:
+    rollup = APHourlyRollup.load(path) if path.exists() and not rebuild else APHourlyRollup()
+    files = [p for p in list_snapshots(AP_DIR, AP_PATTERN) if p.name not in rollup.sources]
+    if max_files is not None:
+        files = files[:max_files]
+    print(f"Procesando {len(files)} snapshots de APs nuevos...")
+    rollup.add_ap_snapshots(files, verbose=True)
+    rollup.save(path)
+    print(f"Rollup guardado en {path} ({len(rollup.buckets)} horas × {len(rollup.ap_names)} APs).")
+    return rollup
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rollup horario de los snapshots de APs.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--max-files", type=int, default=None)
+    parser.add_argument("--rebuild", action="store_true", help="Ignora el rollup existente.")
+    args = parser.parse_args()
+    build_rollup(args.max_files, args.rebuild)
@@ -0,0 +1,82 @@
+"""
+Estadísticas por edificio y por AP como texto para la base de conocimiento de AINA.
+
+Escribe `data/context/ai/generated/estadisticas_aps.txt` a partir del último
+snapshot de APs: un párrafo por edificio y otro por AP. El chatbot no lo envía
+entero, sino los fragmentos relevantes para cada pregunta
+(`services/retrieval.py`), así que puede crecer sin inflar los prompts.
+
+Uso:
+    python -m analytics.context_stats
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+import pandas as pd
+
+from analytics.ap_directory import lookup_arrays
+from analytics.snapshots import AP_DIR, AP_PATTERN, ROOT_DIR, column, list_snapshots, load_records, parse_snapshot_timestamp
+
+OUTPUT_FILE: Final = ROOT_DIR / "data" / "context" / "ai" / "generated" / "estadisticas_aps.txt"
+
+
+def _floor(value: float) -> str:
+    return "planta desconocida" if np.isnan(value) else f"planta {int(value)}"
+
+
+def snapshot_frame(path: Path) -> pd.DataFrame:
+    records = [r for r in load_records(path) if r.get("name")]
+    names = [r["name"] for r in records]
+    location = lookup_arrays(names)
+    return pd.DataFrame(
+        {
+            "ap": names,
+            "building_code": location["building_code"],
+            "building_name": location["building_name"],
+            "floor": location["floor"],
+            "clients": column(records, "client_count"),
+            "cpu": column(records, "cpu_utilization"),
+            "up": [r.get("status") == "Up" for r in records],
+        }
+    )
+
+
+def render(df: pd.DataFrame, when: str) -> str:
+    paragraphs = [f"Estadísticas de APs por edificio (snapshot de {when})."]
+    for (code, name), group in df.groupby(["building_code", "building_name"], sort=True):
+        busiest = group.sort_values("clients", ascending=False).iloc[0]
+        paragraphs.append(
+            f"Edificio {name} (código {code}): {len(group)} APs, {int(group['up'].sum())} Up y "
+            f"{int((~group['up']).sum())} Down; {int(group['clients'].sum())} clientes conectados; "
+            f"CPU media {group['cpu'].mean():.1f} %. AP con más clientes: {busiest['ap']} ({int(busiest['clients'])})."
+        )
+        for row in group.sort_values("ap").itertuples():
+            paragraphs.append(
+                f"{row.ap} ({name}, edificio {code}, {_floor(row.floor)}): {int(row.clients)} clientes, "
+                f"CPU {row.cpu:.0f} %, estado {'Up' if row.up else 'Down'}."
+            )
+    return "\n\n".join(paragraphs) + "\n"
+
+
+def export_context_stats(output: Path = OUTPUT_FILE) -> Path:
+    latest = list_snapshots(AP_DIR, AP_PATTERN)[-1]
+    df = snapshot_frame(latest).fillna({"clients": 0, "cpu": 0})
+    when = parse_snapshot_timestamp(latest).strftime("%Y-%m-%d %H:%M")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output.with_name(output.name + ".tmp")
+    tmp_path.write_text(render(df, when), encoding="utf-8")
+    tmp_path.replace(output)
+    print(f"{len(df)} APs de {df['building_code'].nunique()} edificios escritos en {output}")
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta estadísticas de APs como contexto para AINA.")
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    args = parser.parse_args()
+    export_context_stats(args.output)
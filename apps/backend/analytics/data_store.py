@@ -0,0 +1,300 @@
+"""
+Almacén columnar en memoria para los endpoints de datos de la API.
+
+Carga al arrancar el rollup horario de APs (`analytics.ap_hourly`) y el último
+snapshot de APs, y los deja listos para consultas de lectura:
+
+- matrices densas [hora, AP] ordenadas por hora, con sumas acumuladas sobre
+  las horas: cualquier ventana temporal son dos filas y una resta por AP;
+- índice por AP (columna), por edificio (APs de cada `Nom_Edific` y totales
+  horarios por edificio) y por tiempo (horas ordenadas + `searchsorted`);
+- el snapshot actual en columnas numpy, con índice por edificio.
+
+`refresh()` recarga lo que haya cambiado en disco (la ingesta actualiza el
+rollup), como mucho cada `REFRESH_SECONDS`. Cada parte se construye entera en
+un objeto inmutable (`RollupState`, `SnapshotState`) y se publica con una sola
+asignación; las consultas no toman el lock y leen ese objeto una vez, así que
+nunca mezclan matrices de dos recargas. `version` cambia con cada recarga
+y sirve para ETags. `load_seconds` acumula (segundos, recargas) por parte para
+las métricas del backend.
+
+Horas en hora local del snapshot; `since` incluido y `until` excluido.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+
+from analytics.ap_directory import UNKNOWN, lookup_arrays
+from analytics.ap_hourly import EPOCH, ROLLUP_FILE, APHourlyRollup, build_rollup, hour_bucket
+from analytics.snapshots import AP_DIR, AP_PATTERN, column, list_snapshots, load_records, parse_snapshot_timestamp
+
+REFRESH_SECONDS: Final = 60.0
+SUM_FIELDS: Final = ("seen", "up", "clients_sum", "cpu_n", "cpu_sum")
+TOP_METRICS: Final = ("clients_mean", "clients_max", "cpu_mean", "cpu_max")
+
+
+def page(columns: dict[str, np.ndarray], offset: int, limit: int) -> tuple[int, list[dict]]:
+    """(total, filas) de la página pedida; solo se convierte a JSON lo que se devuelve."""
+    total = len(next(iter(columns.values()))) if columns else 0
+    sliced = {}
+    for name, values in columns.items():
+        values = values[offset : offset + limit]
+        if values.dtype.kind == "M":
+            sliced[name] = values.astype("datetime64[s]").astype(str).tolist()
+        elif values.dtype.kind == "f":
+            sliced[name] = [None if np.isnan(v) else v for v in np.round(values, 3).tolist()]
+        else:
+            sliced[name] = values.tolist()
+    return total, [dict(zip(sliced, row)) for row in zip(*sliced.values())]
+
+
+@dataclass(frozen=True)
+class RollupState:
+    """Rollup horario listo para consultar: matrices [hora, AP] e índices."""
+
+    hours: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    ap_names: list[str] = field(default_factory=list)
+    ap_index: dict[str, int] = field(default_factory=dict)
+    ap_building: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=object))
+    ap_floor: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    buildings: list[str] = field(default_factory=list)
+    building_aps: dict[str, np.ndarray] = field(default_factory=dict)
+    snapshots: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    matrices: dict[str, np.ndarray] = field(default_factory=dict)
+    prefix: dict[str, np.ndarray] = field(default_factory=dict)
+    snapshots_prefix: np.ndarray = field(default_factory=lambda: np.zeros(1))
+    building_hourly: np.ndarray = field(default_factory=lambda: np.zeros((0, 0)))
+
+    def window(self, since: datetime | None, until: datetime | None) -> tuple[int, int]:
+        lo = 0 if since is None else int(np.searchsorted(self.hours, hour_bucket(since)))
+        hi = len(self.hours) if until is None else int(np.searchsorted(self.hours, hour_bucket(until)))
+        return lo, max(lo, hi)
+
+    def sums(self, lo: int, hi: int) -> dict[str, np.ndarray]:
+        return {name: self.prefix[name][hi] - self.prefix[name][lo] for name in SUM_FIELDS}
+
+
+@dataclass(frozen=True)
+class SnapshotState:
+    """Último snapshot de APs en columnas (ordenadas por AP) y su hora."""
+
+    columns: dict[str, np.ndarray] = field(default_factory=dict)
+    time: str | None = None
+
+    def select(self, building: str | None = None, status: str | None = None) -> dict[str, np.ndarray]:
+        snap = self.columns
+        if not snap:
+            return {}
+        mask = np.ones(len(snap["ap"]), dtype=bool)
+        if building is not None:
+            mask &= snap["building"] == building
+        if status is not None:
+            mask &= snap["status"] == status
+        return {name: values[mask] for name, values in snap.items()}
+
+
+class DataStore:
+    def __init__(self, rollup_file: Path = ROLLUP_FILE):
+        self.rollup_file = rollup_file
+        self.version = 0
+        # Versiones publicadas: se sustituyen enteras, nunca se modifican
+        self.rollup = RollupState()
+        self.latest = SnapshotState()
+        self._lock = threading.Lock()
+        self._rollup_mtime = -1
+        self._snapshot_name: str | None = None
+        self._checked_at = 0.0
+        self.load_seconds: dict[str, tuple[float, int]] = {"rollup": (0.0, 0), "snapshot": (0.0, 0)}
+        self.last_load_seconds: dict[str, float] = {}
+
+    # Atajos a la versión publicada (para varias lecturas coherentes, leer `rollup` una vez)
+
+    @property
+    def ap_names(self) -> list[str]:
+        return self.rollup.ap_names
+
+    @property
+    def buildings(self) -> list[str]:
+        return self.rollup.buildings
+
+    @property
+    def building_aps(self) -> dict[str, np.ndarray]:
+        return self.rollup.building_aps
+
+    @property
+    def snapshot_time(self) -> str | None:
+        return self.latest.time
+
+    # --- Carga ---
+
+    def load(self) -> None:
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Recarga rollup y snapshot actual si han cambiado. Devuelve True si hubo cambios."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < REFRESH_SECONDS:
+            return False
+        with self._lock:
+            self._checked_at = now
+            changed = self._timed("rollup", self._refresh_rollup) | self._timed("snapshot", self._refresh_snapshot)
+            if changed:
+                self.version += 1
+            return changed
+
+    def _timed(self, part: str, load) -> bool:
+        start = time.perf_counter()
+        changed = load()
+        if changed:
+            elapsed = time.perf_counter() - start
+            total, count = self.load_seconds[part]
+            self.load_seconds[part] = (total + elapsed, count + 1)
+            self.last_load_seconds[part] = elapsed
+        return changed
+
+    def _refresh_rollup(self) -> bool:
+        if not self.rollup_file.exists():
+            print(f"  No existe {self.rollup_file}; se construye a partir de los snapshots de APs.")
+            build_rollup(path=self.rollup_file)
+        mtime = self.rollup_file.stat().st_mtime_ns
+        if mtime == self._rollup_mtime:
+            return False
+        rollup = APHourlyRollup.load(self.rollup_file)
+
+        order = np.argsort(np.array(rollup.buckets, dtype=np.int64), kind="stable")
+        ap_names = rollup.ap_names
+        location = lookup_arrays(ap_names)
+        ap_building = location["building_code"]
+        buildings = sorted(set(ap_building.tolist()) - {UNKNOWN})
+        building_aps = {code: np.flatnonzero(ap_building == code) for code in buildings}
+
+        data = {name: matrix[order] for name, matrix in rollup.data.items()}
+        snapshots = np.array(rollup.snapshots, dtype=np.float64)[order]
+        # Sumas acumuladas por hora (fila 0 = nada): ventana [i, j) = prefix[j] - prefix[i]
+        prefix = {
+            name: np.vstack([np.zeros((1, data[name].shape[1])), np.cumsum(data[name], axis=0, dtype=np.float64)])
+            for name in SUM_FIELDS
+        }
+        # Clientes medios por hora y edificio (para picos de edificio)
+        onehot = np.zeros((len(ap_names), len(buildings)))
+        for j, code in enumerate(buildings):
+            onehot[building_aps[code], j] = 1.0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            building_hourly = (data["clients_sum"] @ onehot) / snapshots[:, None]
+
+        self.rollup = RollupState(
+            hours=np.array(rollup.buckets, dtype=np.int64)[order],
+            ap_names=ap_names,
+            ap_index={name: i for i, name in enumerate(ap_names)},
+            ap_building=ap_building,
+            ap_floor=location["floor"],
+            buildings=buildings,
+            building_aps=building_aps,
+            snapshots=snapshots,
+            matrices=data,
+            prefix=prefix,
+            snapshots_prefix=np.r_[0.0, np.cumsum(snapshots)],
+            building_hourly=building_hourly,
+        )
+        self._rollup_mtime = mtime
+        return True
+
+    def _refresh_snapshot(self) -> bool:
+        files = list_snapshots(AP_DIR, AP_PATTERN)
+        if not files or files[-1].name == self._snapshot_name:
+            return False
+        latest = files[-1]
+        records = [r for r in load_records(latest) if r.get("name")]
+        names = [r["name"] for r in records]
+        location = lookup_arrays(names)
+        order = np.argsort(np.array(names, dtype=object), kind="stable")
+        columns = {
+            "ap": np.array(names, dtype=object)[order],
+            "building": location["building_code"][order],
+            "floor": location["floor"][order],
+            "status": np.array([r.get("status") or "" for r in records], dtype=object)[order],
+            "clients": column(records, "client_count")[order],
+            "cpu": column(records, "cpu_utilization")[order],
+        }
+        self.latest = SnapshotState(columns, parse_snapshot_timestamp(latest).isoformat())
+        self._snapshot_name = latest.name
+        return True
+
+    # --- Consultas ---
+
+    def ap_hourly(self, ap: str, since=None, until=None) -> dict[str, np.ndarray] | None:
+        """Serie horaria de un AP (solo horas en las que aparece). None si no existe."""
+        r = self.rollup
+        col = r.ap_index.get(ap)
+        if col is None:
+            return None
+        lo, hi = r.window(since, until)
+        m = r.matrices
+        seen = m["seen"][lo:hi, col].astype(np.float64)
+        rows = np.flatnonzero(seen > 0)
+        seen = seen[rows]
+        cpu_n = m["cpu_n"][lo:hi, col][rows].astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "hour": np.datetime64(EPOCH, "h") + r.hours[lo:hi][rows],
+                "clients_mean": m["clients_sum"][lo:hi, col][rows] / seen,
+                "clients_max": m["clients_max"][lo:hi, col][rows].astype(np.float64),
+                "cpu_mean": m["cpu_sum"][lo:hi, col][rows] / cpu_n,
+                "cpu_max": np.where(cpu_n > 0, m["cpu_max"][lo:hi, col][rows], np.nan),
+                "up_ratio": m["up"][lo:hi, col][rows] / seen,
+            }
+
+    def building_summary(self, since=None, until=None) -> dict[str, np.ndarray]:
+        r = self.rollup
+        lo, hi = r.window(since, until)
+        sums = r.sums(lo, hi)
+        snapshots = r.snapshots_prefix[hi] - r.snapshots_prefix[lo]
+        codes = np.array([r.building_aps[code] for code in r.buildings], dtype=object)
+
+        def per_building(values: np.ndarray) -> np.ndarray:
+            return np.array([values[aps].sum() for aps in codes], dtype=np.float64)
+
+        seen, cpu_n = per_building(sums["seen"]), per_building(sums["cpu_n"])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            peak = np.fmax.reduce(r.building_hourly[lo:hi], axis=0) if hi > lo else np.full(len(r.buildings), np.nan)
+            return {
+                "building": np.array(r.buildings, dtype=object),
+                "aps": per_building(sums["seen"] > 0).astype(np.int64),
+                "clients_mean": per_building(sums["clients_sum"]) / (snapshots or np.nan),
+                "clients_peak": peak,
+                "cpu_mean": per_building(sums["cpu_sum"]) / cpu_n,
+                "up_ratio": per_building(sums["up"]) / seen,
+            }
+
+    def top_aps(self, metric: str, since=None, until=None, building: str | None = None) -> dict[str, np.ndarray]:
+        """APs ordenados de mayor a menor por `metric` en la ventana."""
+        r = self.rollup
+        lo, hi = r.window(since, until)
+        sums = r.sums(lo, hi)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if metric == "clients_mean":
+                values = sums["clients_sum"] / sums["seen"]
+            elif metric == "cpu_mean":
+                values = sums["cpu_sum"] / sums["cpu_n"]
+            else:
+                values = r.matrices[metric][lo:hi].max(axis=0).astype(np.float64) if hi > lo else np.full(len(r.ap_names), np.nan)
+        candidates = r.building_aps.get(building, np.zeros(0, np.int64)) if building else np.arange(len(r.ap_names))
+        candidates = candidates[sums["seen"][candidates] > 0]
+        ranked = candidates[np.argsort(-np.nan_to_num(values[candidates], nan=-np.inf), kind="stable")]
+        return {
+            "ap": np.array(r.ap_names, dtype=object)[ranked],
+            "building": r.ap_building[ranked],
+            "floor": r.ap_floor[ranked],
+            metric: values[ranked],
+        }
+
+    def current_snapshot(self, building: str | None = None, status: str | None = None) -> dict[str, np.ndarray]:
+        return self.latest.select(building, status)
@@ -0,0 +1,415 @@
+"""
+Servicio de ingesta continua de snapshots.
+
+Vigila `data/raw/anonymized_data/{aps,clients}` y pasa cada fichero nuevo a
+los sinks registrados (cubo de clientes, rollup horario de APs...). Lo ya
+procesado se apunta en un manifest, así que reiniciar el servicio no repite
+trabajo; y como los sinks son idempotentes por fichero y sus agregados
+conmutativos, los snapshots tardíos o desordenados se integran igual.
+
+La excepción es la movilidad (y con ella las matrices OD): sus sesiones
+necesitan los snapshots en orden, así que un snapshot de clientes anterior al
+último procesado no se aplica. Queda pendiente para ese sink en el manifest,
+marcado como fallo y avisado en el log; se incorpora reconstruyendo con
+`python -m analytics.mobility build --rebuild`.
+
+Detecta ficheros nuevos con inotify si está instalado `inotify_simple` y, si
+no, por polling cada `--interval` segundos.
+
+Uso:
+    python -m analytics.ingest                 # servicio
+    python -m analytics.ingest --once          # una pasada y salir
+    python -m analytics.ingest --sink cube     # solo algunos sinks
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import signal
+import time
+from pathlib import Path
+from typing import Final, Protocol
+
+from analytics.anomalies import STATE_FILE as ANOMALY_FILE
+from analytics.anomalies import AnomalyDetector
+from analytics.ap_hourly import ROLLUP_FILE, APHourlyRollup
+from analytics.cube import CUBE_FILE, WifiCube
+from analytics.mobility import MOBILITY_DIR, MobilityEngine
+from analytics.od import OD_FILE, BuildingOD
+from analytics.pyramid import PYRAMID_DIR, TimePyramid
+from analytics.radios import RADIOS_DIR, RadioTable
+from analytics.snapshots import AP_DIR, AP_PATTERN, CLIENT_DIR, CLIENT_PATTERN, PROCESSED_DIR, parse_snapshot_timestamp
+from peak_usage import TOTALS_FILE, PeakUsageEngine
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # pragma: no cover - dependencia opcional
+    INotify = None
+
+MANIFEST_FILE: Final = PROCESSED_DIR / "ingest" / "manifest.json"
+SOURCES: Final = {"aps": (AP_DIR, AP_PATTERN), "clients": (CLIENT_DIR, CLIENT_PATTERN)}
+SETTLE_SECONDS: Final = 5.0  # un fichero más reciente puede estar aún escribiéndose
+MAX_ATTEMPTS: Final = 3
+
+
+class Sink(Protocol):
+    """
+    Destino de la ingesta. `process` debe ser idempotente por fichero. Un sink
+    que difiere el trabajo a `flush` puede dejar en `rejected` los ficheros que
+    al final no ha podido aplicar; no se marcan como hechos.
+    """
+
+    name: str
+    kinds: tuple[str, ...]
+
+    def process(self, kind: str, path: Path) -> bool: ...
+
+    def flush(self) -> None: ...
+
+
+class CubeSink:
+    name = "cube"
+    kinds = ("clients",)
+
+    def __init__(self, path: Path = CUBE_FILE):
+        self.path = path
+        self.cube = WifiCube.load(path) if path.exists() else WifiCube()
+        self.dirty = False
+
+    def process(self, kind: str, path: Path) -> bool:
+        added = self.cube.add_client_snapshot(path)
+        self.dirty |= added
+        return added
+
+    def flush(self) -> None:
+        if self.dirty:
+            self.cube.save(self.path)
+            self.dirty = False
+
+
+class APHourlySink:
+    name = "ap_hourly"
+    kinds = ("aps",)
+
+    def __init__(self, path: Path = ROLLUP_FILE):
+        self.path = path
+        self.rollup = APHourlyRollup.load(path) if path.exists() else APHourlyRollup()
+        self.dirty = False
+
+    def process(self, kind: str, path: Path) -> bool:
+        added = self.rollup.add_ap_snapshot(path)
+        self.dirty |= added
+        return added
+
+    def flush(self) -> None:
+        if self.dirty:
+            self.rollup.save(self.path)
+            self.dirty = False
+
+
+class PeakUsageSink:
+    name = "peak_usage"
+    kinds = ("aps",)
+
+    def __init__(self, path: Path = TOTALS_FILE):
+        self.engine = PeakUsageEngine(path)
+        self.dirty = False
+
+    def process(self, kind: str, path: Path) -> bool:
+        added = self.engine.add_snapshot(path)
+        self.dirty |= added
+        return added
+
+    def flush(self) -> None:
+        if self.dirty:
+            self.engine.save()
+            self.dirty = False
+
+
+class PyramidSink:
+    name = "pyramid"
+    kinds = ("aps", "clients")
+
+    def __init__(self, root: Path = PYRAMID_DIR):
+        self.pyramid = TimePyramid(root)
+        self.dirty = False
+
+    def process(self, kind: str, path: Path) -> bool:
+        add = self.pyramid.add_ap_snapshot if kind == "aps" else self.pyramid.add_client_snapshot
+        added = add(path)
+        self.dirty |= added
+        return added
+
+    def flush(self) -> None:
+        if self.dirty:
+            self.pyramid.save()
+            self.dirty = False
+
+
+class AnomalySink:
+    name = "anomalies"
+    kinds = ("aps", "clients")
+
+    def __init__(self, path: Path = ANOMALY_FILE):
+        self.detector = AnomalyDetector(path)
+        self.dirty = False
+
+    def process(self, kind: str, path: Path) -> bool:
+        add = self.detector.add_ap_snapshot if kind == "aps" else self.detector.add_client_snapshot
+        added = add(path)
+        self.dirty |= added
+        return added
+
+    def flush(self) -> None:
+        if self.dirty:
+            self.detector.save()
+            self.dirty = False
+
+
+class RadioSink:
+    name = "radios"
+    kinds = ("aps",)
+
+    def __init__(self, root: Path = RADIOS_DIR):
+        self.table = RadioTable(root)
+        self.dirty = False
+
+    def process(self, kind: str, path: Path) -> bool:
+        added = self.table.add_ap_snapshot(path)
+        self.dirty |= added
+        return added
+
+    def flush(self) -> None:
+        if self.dirty:
+            self.table.save()
+            self.dirty = False
+
+
+class MobilitySink:
+    """
+    Sesiones, transiciones y matrices OD entre edificios. Las sesiones necesitan
+    los snapshots en orden: se acumulan y se barren juntos en `flush`.
+    """
+
+    name = "mobility"
+    kinds = ("clients",)
+
+    def __init__(self, root: Path = MOBILITY_DIR, od_path: Path = OD_FILE):
+        self.engine = MobilityEngine(root)
+        self.od = BuildingOD(od_path)
+        self.od.sync(self.engine)
+        self.pending: list[Path] = []
+        self.rejected: list[str] = []
+
+    def process(self, kind: str, path: Path) -> bool:
+        if path.name in self.engine.sources:
+            return False
+        self.pending.append(path)
+        return True
+
+    def flush(self) -> None:
+        self.rejected = []
+        if self.pending:
+            known = len(self.engine.late)
+            stats = self.engine.update(self.pending, workers=1)
+            self.rejected = self.engine.late[known:]  # anteriores a la marca de agua: sin aplicar
+            self.od.add_transitions(stats["delta"], self.engine.ap_names)
+            self.engine.save()
+            self.od.save()
+            self.pending.clear()
+
+
+# Sinks disponibles por nombre; los nuevos agregados se registran aquí
+SINKS: Final[dict[str, type]] = {
+    CubeSink.name: CubeSink,
+    APHourlySink.name: APHourlySink,
+    PeakUsageSink.name: PeakUsageSink,
+    PyramidSink.name: PyramidSink,
+    AnomalySink.name: AnomalySink,
+    RadioSink.name: RadioSink,
+    MobilitySink.name: MobilitySink,
+}
+
+
+class Manifest:
+    """
+    Ficheros ya ingeridos por cada sink (sink -> nombre -> tamaño, mtime) y fallos
+    por sink y fichero ("sink/nombre" -> intentos). Al añadir un sink nuevo, solo
+    él recibe el histórico.
+    """
+
+    def __init__(self, path: Path = MANIFEST_FILE):
+        self.path = path
+        self.done: dict[str, dict[str, list[int]]] = {}
+        self.failures: dict[str, int] = {}
+        if path.exists():
+            with path.open("r", encoding="utf-8") as f:
+                payload = json.load(f)
+            self.done = payload.get("done", {})
+            # Los fallos antiguos (solo por fichero) se olvidan: se reintentan una vez más
+            self.failures = {key: n for key, n in payload.get("failures", {}).items() if "/" in key}
+
+    @staticmethod
+    def failure_key(sink: str, name: str) -> str:
+        return f"{sink}/{name}"
+
+    def fail(self, sink: str, name: str, attempts: int = 1) -> None:
+        key = self.failure_key(sink, name)
+        self.failures[key] = self.failures.get(key, 0) + attempts
+
+    def gave_up(self, sink: str, name: str) -> bool:
+        return self.failures.get(self.failure_key(sink, name), 0) >= MAX_ATTEMPTS
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump({"done": self.done, "failures": self.failures}, f)
+        tmp_path.replace(self.path)
+
+
+class IngestService:
+    def __init__(self, sinks: list[Sink], manifest: Manifest, settle: float = SETTLE_SECONDS):
+        self.sinks = sinks
+        self.manifest = manifest
+        self.settle = settle
+        self.running = True
+
+    def pending(self) -> list[tuple[str, Path, list[Sink]]]:
+        """Ficheros nuevos y ya estables con los sinks que les faltan, por instante de captura."""
+        now = time.time()
+        found = []
+        for kind, (directory, pattern) in SOURCES.items():
+            sinks = [sink for sink in self.sinks if kind in sink.kinds]
+            if not sinks or not directory.exists():
+                continue
+            for path in directory.glob(pattern):
+                missing = [
+                    sink for sink in sinks
+                    if path.name not in self.manifest.done.get(sink.name, {}) and not self.manifest.gave_up(sink.name, path.name)
+                ]
+                if not missing:
+                    continue
+                try:
+                    ts = parse_snapshot_timestamp(path)
+                    if now - path.stat().st_mtime < self.settle:
+                        continue
+                except (ValueError, OSError):
+                    continue
+                found.append((ts, kind, path, missing))
+        found.sort(key=lambda item: item[0])
+        return [(kind, path, missing) for _, kind, path, missing in found]
+
+    def run_once(self) -> int:
+        """
+        Procesa todo lo pendiente y persiste sinks + manifest. Devuelve nº de ficheros.
+        Un sink que falla al procesar un fichero o al guardar no avanza en el
+        manifest para ese fichero (se reintenta en la siguiente pasada, hasta
+        MAX_ATTEMPTS) ni impide a los demás seguir.
+        """
+        batch = self.pending()
+        processed = 0
+        done: dict[str, dict[str, list[int]]] = {}  # sink -> ficheros aplicados en esta pasada
+        for kind, path, sinks in batch:
+            if not self.running:
+                break
+            try:
+                stat = path.stat()
+            except OSError as exc:  # borrado entre el listado y la lectura
+                print(f"  Error procesando {path.name}: {exc}")
+                continue
+            applied = False
+            for sink in sinks:
+                try:
+                    sink.process(kind, path)
+                except Exception as exc:  # JSON truncado, registro malformado...: falla solo este sink
+                    self.manifest.fail(sink.name, path.name)
+                    print(f"  Error procesando {path.name} en {sink.name}: {exc!r}")
+                    continue
+                self.manifest.failures.pop(Manifest.failure_key(sink.name, path.name), None)
+                done.setdefault(sink.name, {})[path.name] = [stat.st_size, stat.st_mtime_ns]
+                applied = True
+            processed += applied
+        if batch:
+            # Primero los sinks: si se corta aquí, el manifest aún no marca los ficheros
+            # y se reprocesan sin duplicar (los sinks ignoran fuentes repetidas).
+            for sink in self.sinks:
+                try:
+                    sink.flush()
+                except Exception as exc:  # un sink roto no debe parar el servicio ni a los demás
+                    print(f"  Error guardando {sink.name}: {exc!r}; se reintentará en la siguiente pasada.")
+                    continue
+                applied = done.get(sink.name, {})
+                for name in getattr(sink, "rejected", ()):
+                    # Reintentarlo no cambia nada: queda pendiente y fallido hasta reconstruir el sink
+                    applied.pop(name, None)
+                    self.manifest.fail(sink.name, name, MAX_ATTEMPTS)
+                    print(f"  {sink.name}: {name} es anterior a lo ya procesado y no se ha aplicado; queda pendiente hasta reconstruir el sink.")
+                self.manifest.done.setdefault(sink.name, {}).update(applied)
+            self.manifest.save()
+        return processed
+
+    def stop(self, *_args) -> None:
+        self.running = False
+
+    def serve(self, interval: float) -> None:
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        watcher = _watcher()
+        print(f"Ingesta en marcha ({'inotify' if watcher else f'polling cada {interval:.0f}s'}).")
+        while self.running:
+            start = time.perf_counter()
+            processed = self.run_once()
+            if processed:
+                print(f"  {processed} snapshots ingeridos en {time.perf_counter() - start:.1f}s")
+            if watcher:
+                # Espera eventos, pero revisa igualmente cada `interval` (ficheros en espera de asentarse)
+                _wait_events(watcher, interval, lambda: self.running)
+            else:
+                _sleep(interval, lambda: self.running)
+
+
+def _watcher():
+    if INotify is None:
+        return None
+    watcher = INotify()
+    mask = inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO
+    for directory, _ in SOURCES.values():
+        if directory.exists():
+            watcher.add_watch(str(directory), mask)
+    return watcher
+
+
+def _wait_events(watcher, seconds: float, keep_going) -> None:
+    """Como `_sleep`, pero vuelve en cuanto llega un evento de inotify."""
+    deadline = time.monotonic() + seconds
+    while keep_going() and time.monotonic() < deadline:
+        if watcher.read(timeout=int(min(1.0, deadline - time.monotonic()) * 1000)):
+            return
+
+
+def _sleep(seconds: float, keep_going) -> None:
+    deadline = time.monotonic() + seconds
+    while keep_going() and time.monotonic() < deadline:
+        time.sleep(min(1.0, deadline - time.monotonic()))
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ingesta continua de snapshots de APs y clientes.")
+    parser.add_argument("--sink", action="append", choices=sorted(SINKS), help="Sinks a alimentar (por defecto, todos).")
+    parser.add_argument("--interval", type=float, default=float(os.getenv("INGEST_INTERVAL", 30)), help="Segundos entre revisiones.")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS, help="Antigüedad mínima (s) de un fichero para leerlo.")
+    parser.add_argument("--once", action="store_true", help="Procesa lo pendiente y termina.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    sinks = [SINKS[name]() for name in (args.sink or SINKS)]
+    service = IngestService(sinks, Manifest(), settle=args.settle)
+    if args.once:
+        print(f"{service.run_once()} snapshots ingeridos.")
+    else:
+        service.serve(args.interval)
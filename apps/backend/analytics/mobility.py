@@ -0,0 +1,374 @@
+"""
+Motor de movilidad: sesiones por dispositivo y transiciones entre APs.
+
+Cada snapshot de clientes aporta observaciones (dispositivo, instante, AP).
+Por lote se hace UN orden lexicográfico por (dispositivo, instante,
+last_connection_time) y un barrido lineal vectorizado:
+
+- una sesión se corta cuando entre dos observaciones del mismo dispositivo
+  pasan más de `gap` segundos;
+- dentro de una sesión, un cambio de AP es una transición. Si el
+  `last_connection_time` del cliente cae entre las dos observaciones se usa
+  como instante de la transición (es cuándo se asoció al AP nuevo).
+
+Los dispositivos se reparten en particiones por hash de `macaddr`, que se
+barren en paralelo. Entre lotes solo se guarda la "cola" de cada dispositivo
+con sesión abierta, así que las actualizaciones son incrementales y no hace
+falta el histórico crudo en memoria. Las transiciones se agregan por
+(hora, AP origen, AP destino): una matriz dispersa COO por hora.
+
+Todos los instantes están en hora local del snapshot, en segundos "como si
+fuera UTC" (así las horas coinciden con las del nombre del fichero).
+
+Los snapshots deben llegar en orden: un fichero anterior a la última hora
+procesada no se puede encajar en las sesiones ya cerradas y se descarta
+(`late`); para incorporarlo hay que reconstruir con `--rebuild`.
+
+Uso:
+    python -m analytics.mobility build [--workers 4] [--gap 5400]
+    python -m analytics.mobility top --limit 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timezone
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+import pandas as pd
+
+from analytics import sketches
+from analytics.snapshots import CLIENT_DIR, CLIENT_PATTERN, PROCESSED_DIR, column, list_snapshots, load_records, load_table, parse_snapshot_timestamp, save_table
+
+MOBILITY_DIR: Final = PROCESSED_DIR / "mobility"
+SESSION_GAP: Final = 90 * 60  # 1,5 veces la cadencia horaria de captura
+PARTITIONS: Final = 16
+BATCH_FILES: Final = 500
+
+ROW_FIELDS: Final = ("dev", "seen", "conn", "ap")
+TAIL_FIELDS: Final = ("dev", "last_seen", "last_ap", "start", "n_obs", "first_ap", "n_trans")
+SESSION_FIELDS: Final = ("dev", "start", "end", "n_obs", "first_ap", "last_ap", "n_trans")
+TRANSITION_FIELDS: Final = ("hour", "src", "dst", "count")
+
+
+def _empty(fields) -> dict[str, np.ndarray]:
+    return {name: np.zeros(0, np.uint64 if name == "dev" else np.int64) for name in fields}
+
+
+def local_seconds(ts) -> int:
+    """Hora local del snapshot expresada en segundos desde 1970 como si fuera UTC."""
+    return int(ts.replace(tzinfo=timezone.utc).timestamp())
+
+
+def read_client_rows(path: Path) -> tuple[list[str], dict[str, np.ndarray]]:
+    """Observaciones de un snapshot de clientes (con códigos de AP locales al fichero)."""
+    ts = parse_snapshot_timestamp(path)
+    offset = int(ts.utcoffset().total_seconds()) if ts.utcoffset() else 0
+    records = [r for r in load_records(path) if r.get("macaddr") and r.get("associated_device_name")]
+    names, inverse = np.unique(np.array([r["associated_device_name"] for r in records], dtype=object), return_inverse=True)
+    conn_ms = column(records, "last_connection_time")
+    conn = np.where(np.isnan(conn_ms), -1, np.floor_divide(np.nan_to_num(conn_ms), 1000) + offset).astype(np.int64)
+    rows = {
+        "dev": sketches.hash_values([r["macaddr"] for r in records]).astype(np.uint64),
+        "seen": np.full(len(records), local_seconds(ts), dtype=np.int64),
+        "conn": conn,
+        "ap": inverse.astype(np.int64),
+    }
+    return names.tolist(), rows
+
+
+def sweep_partition(args) -> tuple[dict, dict, dict, int]:
+    """
+    Barrido de una partición: (observaciones, cola, gap, marca de agua) ->
+    (sesiones cerradas, transiciones por hora, cola nueva, nº de observaciones tardías).
+    """
+    rows, tail, gap, watermark = args
+    dev, seen, conn, ap = (rows[name] for name in ROW_FIELDS)
+
+    # Observaciones no posteriores a la última vista del dispositivo: tardías, se descartan
+    late = np.zeros(len(dev), dtype=bool)
+    if len(tail["dev"]) and len(dev):
+        order = np.argsort(tail["dev"])
+        tail_dev, tail_last = tail["dev"][order], tail["last_seen"][order]
+        pos = np.minimum(np.searchsorted(tail_dev, dev), len(tail_dev) - 1)
+        late = (tail_dev[pos] == dev) & (seen <= tail_last[pos])
+    keep = ~late
+
+    n_tail = len(tail["dev"])
+    d = np.concatenate([tail["dev"], dev[keep]])
+    s = np.concatenate([tail["last_seen"], seen[keep]])
+    c = np.concatenate([np.full(n_tail, -1, np.int64), conn[keep]])
+    a = np.concatenate([tail["last_ap"], ap[keep]])
+    tail_idx = np.concatenate([np.arange(n_tail), np.full(keep.sum(), -1)])
+
+    order = np.lexsort((c, s, d))
+    d, s, c, a, tail_idx = d[order], s[order], c[order], a[order], tail_idx[order]
+
+    # Un dispositivo repetido en el mismo snapshot cuenta una vez
+    dup = np.r_[False, (d[1:] == d[:-1]) & (s[1:] == s[:-1])]
+    if dup.any():
+        d, s, c, a, tail_idx = d[~dup], s[~dup], c[~dup], a[~dup], tail_idx[~dup]
+
+    n = len(d)
+    if n == 0:
+        return _empty(SESSION_FIELDS), _empty(TRANSITION_FIELDS), _empty(TAIL_FIELDS), int(late.sum())
+
+    same_dev = np.r_[False, d[1:] == d[:-1]]
+    new_session = ~same_dev | (np.r_[0, np.diff(s)] > gap)
+    session_id = np.cumsum(new_session) - 1
+    starts = np.flatnonzero(new_session)
+    ends = np.r_[starts[1:], n] - 1
+    n_sessions = len(starts)
+
+    # Transiciones: cambio de AP dentro de la misma sesión
+    moves = np.flatnonzero(~new_session & (a != np.r_[-1, a[:-1]]))
+    prev_seen = s[moves - 1]
+    when = np.where((c[moves] > prev_seen) & (c[moves] <= s[moves]), c[moves], s[moves])
+    key = ((when // 3600) << 32) | (a[moves - 1] << 16) | a[moves]
+    keys, counts = np.unique(key, return_counts=True)
+    transitions = {"hour": keys >> 32, "src": (keys >> 16) & 0xFFFF, "dst": keys & 0xFFFF, "count": counts.astype(np.int64)}
+
+    # Agregados por sesión; si empieza en una fila de cola, hereda lo acumulado
+    first_tail = tail_idx[starts]
+    from_tail = first_tail >= 0
+    ti = np.where(from_tail, first_tail, 0)
+    tail_or = lambda field, default: np.where(from_tail, tail[field][ti] if n_tail else 0, default)  # noqa: E731
+    observed = (tail_idx < 0).astype(np.int64)
+    sessions = {
+        "dev": d[starts],
+        "start": tail_or("start", s[starts]),
+        "end": s[ends],
+        "n_obs": np.add.reduceat(observed, starts) + tail_or("n_obs", 0),
+        "first_ap": tail_or("first_ap", a[starts]),
+        "last_ap": a[ends],
+        "n_trans": np.bincount(session_id[moves], minlength=n_sessions) + tail_or("n_trans", 0),
+    }
+
+    # La última sesión de cada dispositivo sigue abierta si no ha pasado `gap` desde su final
+    last_of_device = np.r_[sessions["dev"][1:] != sessions["dev"][:-1], True]
+    still_open = last_of_device & (watermark - sessions["end"] <= gap)
+    new_tail = {
+        "dev": sessions["dev"][still_open],
+        "last_seen": sessions["end"][still_open],
+        "last_ap": sessions["last_ap"][still_open],
+        "start": sessions["start"][still_open],
+        "n_obs": sessions["n_obs"][still_open],
+        "first_ap": sessions["first_ap"][still_open],
+        "n_trans": sessions["n_trans"][still_open],
+    }
+    closed = {name: values[~still_open] for name, values in sessions.items()}
+    return closed, transitions, new_tail, int(late.sum())
+
+
+class MobilityEngine:
+    def __init__(self, root: Path = MOBILITY_DIR, gap: int = SESSION_GAP, partitions: int = PARTITIONS):
+        self.root = root
+        self.gap = gap
+        self.partitions = partitions
+        self.ap_names: list[str] = []
+        self.sources: set[str] = set()
+        self.watermark = -1
+        self.tail = _empty(TAIL_FIELDS)
+        self.transitions = _empty(TRANSITION_FIELDS)
+        self.late: list[str] = []
+        state = root / "state.npz"
+        if state.exists():
+            arrays, meta = load_table(state)
+            self.gap, self.partitions = meta["gap"], meta["partitions"]
+            self.watermark = meta["watermark"]
+            self.ap_names = arrays["ap_names"].tolist()
+            self.sources = set(arrays["sources"].tolist())
+            self.tail = {name: arrays[f"tail_{name}"] for name in TAIL_FIELDS}
+            self.transitions = {name: arrays[f"tr_{name}"] for name in TRANSITION_FIELDS}
+        self._ap_index = {name: i for i, name in enumerate(self.ap_names)}
+        self._sessions: list[dict[str, np.ndarray]] = []
+
+    def _global_codes(self, names: list[str]) -> np.ndarray:
+        codes = np.empty(len(names), dtype=np.int64)
+        for i, name in enumerate(names):
+            code = self._ap_index.get(name)
+            if code is None:
+                code = self._ap_index[name] = len(self.ap_names)
+                self.ap_names.append(name)
+            codes[i] = code
+        if len(self.ap_names) > 0xFFFF:
+            raise OverflowError("Demasiados APs para las claves de transición")
+        return codes
+
+    def update(self, paths: list[Path], workers: int | None = None) -> dict:
+        """Procesa snapshots nuevos (en orden temporal), por lotes y particiones en paralelo."""
+        fresh = sorted((parse_snapshot_timestamp(p), p) for p in paths if p.name not in self.sources)
+        stats = {"files": 0, "late_files": 0, "late_rows": 0, "sessions": 0, "transitions": 0}
+        deltas: list[dict[str, np.ndarray]] = []
+        workers = workers or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        mapper = pool.map if pool else map
+        try:
+            for batch_start in range(0, len(fresh), BATCH_FILES):
+                batch = []
+                for ts, path in fresh[batch_start : batch_start + BATCH_FILES]:
+                    if local_seconds(ts) <= self.watermark:
+                        self.late.append(path.name)
+                        stats["late_files"] += 1
+                    else:
+                        batch.append(path)
+                if batch:
+                    deltas.append(self._update_batch(batch, mapper, stats))
+        finally:
+            if pool:
+                pool.shutdown()
+        # Transiciones añadidas en esta llamada, para agregados derivados (p. ej. analytics.od)
+        stats["delta"] = self._merge_transitions(deltas) if deltas else _empty(TRANSITION_FIELDS)
+        return stats
+
+    def _update_batch(self, paths: list[Path], mapper, stats: dict) -> dict[str, np.ndarray]:
+        parts = []
+        for path, (names, rows) in zip(paths, mapper(read_client_rows, paths)):
+            rows["ap"] = self._global_codes(names)[rows["ap"]] if len(names) else rows["ap"]
+            parts.append(rows)
+            self.sources.add(path.name)
+        rows = {name: np.concatenate([p[name] for p in parts]) for name in ROW_FIELDS}
+        self.watermark = max(self.watermark, int(rows["seen"].max()) if len(rows["seen"]) else self.watermark)
+
+        row_part = (rows["dev"] % np.uint64(self.partitions)).astype(np.int64)
+        tail_part = (self.tail["dev"] % np.uint64(self.partitions)).astype(np.int64)
+        jobs = [
+            (
+                {name: values[row_part == p] for name, values in rows.items()},
+                {name: values[tail_part == p] for name, values in self.tail.items()},
+                self.gap,
+                self.watermark,
+            )
+            for p in range(self.partitions)
+        ]
+        tails, batch_transitions = [], []
+        for closed, trans, tail, late in mapper(sweep_partition, jobs):
+            self._sessions.append(closed)
+            batch_transitions.append(trans)
+            tails.append(tail)
+            stats["late_rows"] += late
+            stats["sessions"] += len(closed["dev"])
+            stats["transitions"] += int(trans["count"].sum())
+        stats["files"] += len(paths)
+        self.tail = {name: np.concatenate([t[name] for t in tails]) for name in TAIL_FIELDS}
+        delta = self._merge_transitions(batch_transitions)
+        self.transitions = self._merge_transitions([self.transitions, delta])
+        return delta
+
+    @staticmethod
+    def _merge_transitions(tables: list[dict]) -> dict[str, np.ndarray]:
+        key = np.concatenate([(t["hour"] << 32) | (t["src"] << 16) | t["dst"] for t in tables])
+        count = np.concatenate([t["count"] for t in tables])
+        keys, inverse = np.unique(key, return_inverse=True)
+        return {
+            "hour": keys >> 32,
+            "src": (keys >> 16) & 0xFFFF,
+            "dst": keys & 0xFFFF,
+            "count": np.bincount(inverse, count, minlength=len(keys)).astype(np.int64),
+        }
+
+    def save(self) -> None:
+        # Sesiones cerradas: particiones diarias por día de inicio
+        if self._sessions:
+            closed = {name: np.concatenate([s[name] for s in self._sessions]) for name in SESSION_FIELDS}
+            days = closed["start"] // 86400
+            for day in np.unique(days):
+                label = str(np.datetime64(int(day), "D"))
+                path = self.root / "sessions" / f"{label}.npz"
+                existing = load_table(path)[0] if path.exists() else {}
+                arrays = {
+                    name: np.concatenate(([existing[name]] if name in existing else []) + [closed[name][days == day]])
+                    for name in SESSION_FIELDS
+                }
+                save_table(path, arrays)
+            self._sessions.clear()
+
+        arrays = {"ap_names": np.array(self.ap_names, dtype=str), "sources": np.array(sorted(self.sources), dtype=str)}
+        arrays.update({f"tail_{name}": values for name, values in self.tail.items()})
+        arrays.update({f"tr_{name}": values for name, values in self.transitions.items()})
+        meta = {"gap": self.gap, "partitions": self.partitions, "watermark": self.watermark}
+        save_table(self.root / "state.npz", arrays, meta)
+        if self.late:
+            with (self.root / "late_files.json").open("w", encoding="utf-8") as f:
+                json.dump(sorted(set(self.late)), f)
+
+    # --- Consultas ---
+
+    def transition_matrix(self, since=None, until=None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Matriz dispersa AP×AP (COO: origen, destino, nº) entre `since` y `until` (días incluidos)."""
+        hour = self.transitions["hour"]
+        mask = np.ones(len(hour), dtype=bool)
+        if since is not None:
+            mask &= hour >= pd.Timestamp(since).value // 10**9 // 3600
+        if until is not None:
+            mask &= hour < (pd.Timestamp(until) + pd.Timedelta(days=1)).value // 10**9 // 3600
+        key = (self.transitions["src"][mask] << 16) | self.transitions["dst"][mask]
+        keys, inverse = np.unique(key, return_inverse=True)
+        counts = np.bincount(inverse, self.transitions["count"][mask], minlength=len(keys)).astype(np.int64)
+        return keys >> 16, keys & 0xFFFF, counts
+
+    def top_transitions(self, limit: int = 20, since=None, until=None) -> pd.DataFrame:
+        src, dst, counts = self.transition_matrix(since, until)
+        order = np.argsort(-counts, kind="stable")[:limit]
+        names = np.array(self.ap_names, dtype=object)
+        return pd.DataFrame({"src": names[src[order]], "dst": names[dst[order]], "count": counts[order]})
+
+    def sessions(self, since=None, until=None) -> pd.DataFrame:
+        """Sesiones cerradas (por día de inicio), con instantes como Timestamp local."""
+        files = sorted((self.root / "sessions").glob("????-??-??.npz"))
+        if since is not None:
+            files = [f for f in files if f.stem >= str(pd.Timestamp(since).date())]
+        if until is not None:
+            files = [f for f in files if f.stem <= str(pd.Timestamp(until).date())]
+        parts = [load_table(f)[0] for f in files]
+        df = pd.DataFrame({name: np.concatenate([p[name] for p in parts]) if parts else np.zeros(0) for name in SESSION_FIELDS})
+        names = np.array(self.ap_names, dtype=object)
+        for field in ("start", "end"):
+            df[field] = pd.to_datetime(df[field].astype(np.int64), unit="s")
+        for field in ("first_ap", "last_ap"):
+            df[field] = names[df[field].astype(np.int64)] if len(df) else df[field]
+        return df
+
+
+def build_mobility(workers: int | None = None, gap: int = SESSION_GAP, rebuild: bool = False, max_files: int | None = None) -> MobilityEngine:
+    if rebuild and MOBILITY_DIR.exists():
+        shutil.rmtree(MOBILITY_DIR)
+    engine = MobilityEngine(gap=gap)
+    if engine.gap != gap:
+        print(f"  El estado existente usa gap={engine.gap}s; usa --rebuild para cambiarlo.")
+    files = list_snapshots(CLIENT_DIR, CLIENT_PATTERN)
+    if max_files is not None:
+        files = files[:max_files]
+    stats = engine.update(files, workers)
+    engine.save()
+    print(
+        f"{stats['files']} snapshots: {stats['sessions']} sesiones cerradas, {stats['transitions']} transiciones, "
+        f"{len(engine.tail['dev'])} sesiones abiertas. Tardíos descartados: {stats['late_files']} ficheros, {stats['late_rows']} filas."
+    )
+    return engine
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sesiones y transiciones entre APs por dispositivo.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Procesa los snapshots de clientes nuevos.")
+    build.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, nº de CPUs).")
+    build.add_argument("--gap", type=int, default=SESSION_GAP, help="Segundos sin ver un dispositivo que cierran su sesión.")
+    build.add_argument("--rebuild", action="store_true")
+    build.add_argument("--max-files", type=int, default=None)
+    top = sub.add_parser("top", help="Transiciones más frecuentes.")
+    top.add_argument("--limit", type=int, default=20)
+    top.add_argument("--since")
+    top.add_argument("--until")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_mobility(args.workers, args.gap, args.rebuild, args.max_files)
+    else:
+        print(MobilityEngine().top_transitions(args.limit, args.since, args.until).to_string(index=False))
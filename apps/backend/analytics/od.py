@@ -0,0 +1,192 @@
+"""
+Matrices origen-destino entre edificios por hora.
+
+Se alimentan de las transiciones AP -> AP del motor de movilidad
+(`analytics.mobility`), mapeando cada AP a su edificio del GeoJSON
+(`Nom_Edific`). Cada hora es una matriz dispersa; todas se guardan juntas en
+formato COO ordenado por (par origen-destino, hora), con una suma acumulada
+global. Así la suma de cualquier rango de horas para todos los pares son dos
+`searchsorted` y una resta, sin recorrer las horas intermedias.
+
+Las actualizaciones reciben solo las transiciones nuevas de cada lote del
+motor de movilidad, así que no hace falta releer el histórico de clientes.
+Las transiciones con algún AP sin geolocalizar se descartan.
+
+Uso:
+    python -m analytics.od build
+    python -m analytics.od flows --to B --hours 7-10 --since 2025-04-01
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+import pandas as pd
+
+from analytics.ap_directory import UNKNOWN, lookup_arrays
+from analytics.mobility import MobilityEngine
+from analytics.snapshots import CLIENT_DIR, CLIENT_PATTERN, PROCESSED_DIR, list_snapshots, load_table, save_table
+
+OD_FILE: Final = PROCESSED_DIR / "od" / "building_od.npz"
+
+
+def _hour(value, end: bool = False) -> int:
+    """Hora (desde 1970, hora local) de una fecha; con `end`, la hora siguiente al final de ese día."""
+    ts = pd.Timestamp(value)
+    if end:
+        ts = ts.normalize() + pd.Timedelta(days=1)
+    return int(ts.value // 10**9 // 3600)
+
+
+class BuildingOD:
+    def __init__(self, path: Path = OD_FILE):
+        self.path = path
+        self.buildings: list[str] = []
+        self.key = np.zeros(0, dtype=np.int64)  # (origen << 48) | (destino << 32) | hora, ordenado
+        self.count = np.zeros(0, dtype=np.int64)
+        self.applied = 0  # transiciones recibidas (incluidas las descartadas)
+        if path.exists():
+            arrays, meta = load_table(path)
+            self.buildings = arrays["buildings"].tolist()
+            self.key, self.count = arrays["key"], arrays["count"]
+            self.applied = meta["applied"]
+        self._index = {code: i for i, code in enumerate(self.buildings)}
+        self._prefix: tuple[np.ndarray, np.ndarray] | None = None
+
+    def _building_codes(self, ap_names: list[str]) -> np.ndarray:
+        codes = np.full(len(ap_names), -1, dtype=np.int64)
+        for i, building in enumerate(lookup_arrays(ap_names)["building_code"]):
+            if building == UNKNOWN:
+                continue
+            code = self._index.get(building)
+            if code is None:
+                code = self._index[building] = len(self.buildings)
+                self.buildings.append(building)
+            codes[i] = code
+        return codes
+
+    def add_transitions(self, transitions: dict[str, np.ndarray], ap_names: list[str]) -> None:
+        """Suma transiciones AP -> AP por hora (formato de `MobilityEngine.transitions`)."""
+        self.applied += int(transitions["count"].sum())
+        if not len(transitions["count"]):
+            return
+        to_building = self._building_codes(ap_names)
+        src, dst = to_building[transitions["src"]], to_building[transitions["dst"]]
+        valid = (src >= 0) & (dst >= 0)
+        key = (src[valid] << 48) | (dst[valid] << 32) | transitions["hour"][valid]
+        keys, inverse = np.unique(np.concatenate([self.key, key]), return_inverse=True)
+        counts = np.concatenate([self.count, transitions["count"][valid]])
+        self.key = keys
+        self.count = np.bincount(inverse, counts, minlength=len(keys)).astype(np.int64)
+        self._prefix = None
+
+    def sync(self, engine: MobilityEngine) -> None:
+        """Reconstruye desde el motor si no cuadra (p. ej. un corte entre guardar uno y otro)."""
+        if self.applied != int(engine.transitions["count"].sum()):
+            self.buildings, self._index = [], {}
+            self.key, self.count, self.applied = np.zeros(0, np.int64), np.zeros(0, np.int64), 0
+            self.add_transitions(engine.transitions, engine.ap_names)
+
+    def save(self) -> None:
+        arrays = {"buildings": np.array(self.buildings, dtype=str), "key": self.key, "count": self.count}
+        save_table(self.path, arrays, {"applied": self.applied})
+
+    # --- Consultas ---
+
+    def _pairs(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._prefix is None:
+            self._prefix = (np.unique(self.key >> 32), np.r_[0, np.cumsum(self.count)])
+        return self._prefix
+
+    def range_sums(self, start_hours: np.ndarray, end_hours: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Pares (origen << 16 | destino) y su suma en la unión de los rangos [inicio, fin) de horas."""
+        pairs, cumulative = self._pairs()
+        base = pairs[:, None] << 32
+        hi = np.searchsorted(self.key, base | np.asarray(end_hours)[None, :])
+        lo = np.searchsorted(self.key, base | np.asarray(start_hours)[None, :])
+        return pairs, (cumulative[hi] - cumulative[lo]).sum(axis=1)
+
+    def flows(self, since=None, until=None, hours: tuple[int, int] | None = None, origin=None, destination=None, internal: bool = False) -> pd.DataFrame:
+        """
+        Flujos entre edificios de `since` a `until` (días incluidos). `hours=(7, 10)`
+        limita a esa franja de cada día; `internal` incluye los movimientos dentro
+        de un mismo edificio.
+        """
+        if not len(self.key):
+            return pd.DataFrame(columns=["origin", "destination", "count"])
+        stored = self.key & 0xFFFFFFFF
+        first = int(stored.min()) if since is None else _hour(since)
+        last = int(stored.max()) + 1 if until is None else _hour(until, end=True)
+        if hours is None:
+            starts, ends = np.array([first]), np.array([last])
+        else:
+            days = np.arange(first // 24, (last - 1) // 24 + 1) * 24
+            starts, ends = np.clip(days + hours[0], first, last), np.clip(days + hours[1], first, last)
+        pairs, totals = self.range_sums(starts, ends)
+        names = np.array(self.buildings, dtype=object)
+        df = pd.DataFrame({"origin": names[pairs >> 16], "destination": names[pairs & 0xFFFF], "count": totals.astype(np.int64)})
+        mask = df["count"] > 0
+        if not internal:
+            mask &= df["origin"] != df["destination"]
+        if origin is not None:
+            mask &= df["origin"] == origin
+        if destination is not None:
+            mask &= df["destination"] == destination
+        return df[mask].sort_values(["count", "origin", "destination"], ascending=[False, True, True]).reset_index(drop=True)
+
+    def matrix(self, since=None, until=None, hours: tuple[int, int] | None = None) -> pd.DataFrame:
+        """Matriz densa origen x destino (solo edificios con algún flujo)."""
+        df = self.flows(since, until, hours, internal=True)
+        return df.pivot_table(index="origin", columns="destination", values="count", fill_value=0, aggfunc="sum")
+
+    def hourly(self, origin=None, destination=None) -> pd.Series:
+        """Serie horaria de transiciones entre edificios distintos, filtrable por origen/destino."""
+        src, dst = self.key >> 48, (self.key >> 32) & 0xFFFF
+        mask = src != dst
+        if origin is not None:
+            mask &= src == self._index.get(origin, -1)
+        if destination is not None:
+            mask &= dst == self._index.get(destination, -1)
+        hours = self.key[mask] & 0xFFFFFFFF
+        values = pd.Series(self.count[mask]).groupby(hours).sum()
+        values.index = pd.to_datetime(values.index.to_numpy() * 3600, unit="s")
+        return values.rename("count")
+
+
+def build_od(workers: int | None = None) -> BuildingOD:
+    """Pone al día el motor de movilidad con los snapshots nuevos y aplica sus transiciones."""
+    engine = MobilityEngine()
+    od = BuildingOD()
+    od.sync(engine)
+    stats = engine.update(list_snapshots(CLIENT_DIR, CLIENT_PATTERN), workers)
+    od.add_transitions(stats["delta"], engine.ap_names)
+    engine.save()
+    od.save()
+    print(f"{stats['files']} snapshots nuevos; {len(od.key)} celdas (par, hora) entre {len(od.buildings)} edificios.")
+    return od
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Matrices origen-destino entre edificios por hora.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Actualiza movilidad y matrices con los snapshots nuevos.")
+    build.add_argument("--workers", type=int, default=None)
+    flows = sub.add_parser("flows", help="Flujos agregados en un rango.")
+    flows.add_argument("--since")
+    flows.add_argument("--until")
+    flows.add_argument("--hours", help="Franja diaria, p. ej. 7-10.")
+    flows.add_argument("--from", dest="origin", help="Código de edificio (Nom_Edific) de origen.")
+    flows.add_argument("--to", dest="destination", help="Código de edificio (Nom_Edific) de destino.")
+    flows.add_argument("--internal", action="store_true", help="Incluye movimientos dentro del mismo edificio.")
+    flows.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_od(args.workers)
+    else:
+        hours = tuple(int(h) for h in args.hours.split("-")) if args.hours else None
+        result = BuildingOD().flows(args.since, args.until, hours, args.origin, args.destination, args.internal)
+        print(result.head(args.top).to_string(index=False))
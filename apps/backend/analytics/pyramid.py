@@ -0,0 +1,353 @@
+"""
+Pirámide multirresolución de series por AP: 15 min, 1 h, 1 día y 1 semana.
+
+Para cada nivel y AP se guardan suma y nº de observaciones de `client_count`,
+`cpu_utilization` (snapshots de APs) y de `health` y `signal_db` de sus clientes
+(snapshots de clientes). Cada snapshot se suma a la vez en los cuatro niveles,
+así que nunca hay que reagregar datos crudos. La media es siempre sum / n.
+
+Cada nivel se trocea en bloques de tiempo ([buckets, APs] densos) guardados en
+`data/processed/pyramid/<nivel>/<bloque>.npz`; una consulta solo carga los
+bloques de su rango y elige sola el nivel más grueso que da los puntos pedidos.
+El rango se recorta a los datos guardados de la serie (primer y último minuto
+con datos de cada AP, en `meta.json`), así que sin `since`/`until` el nivel se
+elige por lo que de verdad abarca la serie.
+
+Las series por edificio se obtienen sumando las columnas de sus APs: para
+`client_count` es el total del edificio (suma de las medias por AP) y para el
+resto la media ponderada por observaciones.
+
+Uso:
+    python -m analytics.pyramid build
+    python -m analytics.pyramid series --ap AP-VET71 --metric client_count --points 200
+    python -m analytics.pyramid series --building B --metric health --since 2025-04-01
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+import pandas as pd
+
+from analytics.ap_directory import lookup_arrays
+from analytics.snapshots import (
+    AP_DIR,
+    AP_PATTERN,
+    CLIENT_DIR,
+    CLIENT_PATTERN,
+    PROCESSED_DIR,
+    column,
+    list_snapshots,
+    load_records,
+    load_table,
+    parse_snapshot_timestamp,
+    save_table,
+)
+
+PYRAMID_DIR: Final = PROCESSED_DIR / "pyramid"
+EPOCH: Final = datetime(2019, 12, 30)  # lunes, para que las semanas empiecen en lunes
+
+# Minutos por bucket y buckets por bloque en cada nivel (de más fino a más grueso)
+LEVELS: Final = {"15min": 15, "1h": 60, "1d": 1440, "1w": 10080}
+CHUNK_BUCKETS: Final = {"15min": 672, "1h": 720, "1d": 366, "1w": 260}
+AP_MEASURES: Final = ("client_count", "cpu_utilization")
+CLIENT_MEASURES: Final = ("health", "signal_db")
+MEASURES: Final = AP_MEASURES + CLIENT_MEASURES
+MAX_CACHED_CHUNKS: Final = 16
+NO_DATA: Final = -1
+
+
+def minutes_since_epoch(ts: datetime) -> int:
+    """Minutos desde EPOCH en la hora local del snapshot."""
+    return int((ts.replace(tzinfo=None) - EPOCH) // timedelta(minutes=1))
+
+
+def choose_level(span_minutes: float, points: int) -> str:
+    """Nivel más grueso con al menos `points` buckets en el rango (o el más fino)."""
+    for level in reversed(LEVELS):
+        if span_minutes / LEVELS[level] >= points:
+            return level
+    return next(iter(LEVELS))
+
+
+class TimePyramid:
+    def __init__(self, root: Path = PYRAMID_DIR):
+        self.root = root
+        self.ap_names: list[str] = []
+        self.sources: set[str] = set()
+        # Primer y último minuto con datos por AP (NO_DATA si aún no tiene)
+        self.ap_first = np.zeros(0, dtype=np.int64)
+        self.ap_last = np.zeros(0, dtype=np.int64)
+        meta_file = root / "meta.json"
+        if meta_file.exists():
+            with meta_file.open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.ap_names = meta["ap_names"]
+            self.sources = set(meta["sources"])
+            if "ap_first" in meta:
+                self.ap_first = np.array(meta["ap_first"], dtype=np.int64)
+                self.ap_last = np.array(meta["ap_last"], dtype=np.int64)
+            else:  # pirámide anterior: se usa el rango de todos los snapshots para cada AP
+                minutes = [minutes_since_epoch(parse_snapshot_timestamp(name)) for name in self.sources] or [NO_DATA]
+                self.ap_first = np.full(len(self.ap_names), min(minutes), dtype=np.int64)
+                self.ap_last = np.full(len(self.ap_names), max(minutes), dtype=np.int64)
+        self._ap_index = {name: i for i, name in enumerate(self.ap_names)}
+        self._chunks: OrderedDict[tuple[str, int], dict[str, np.ndarray]] = OrderedDict()
+        self._dirty: set[tuple[str, int]] = set()
+
+    # --- Bloques ---
+
+    def _chunk_path(self, level: str, chunk: int) -> Path:
+        return self.root / level / f"{chunk:05d}.npz"
+
+    def _chunk(self, level: str, chunk: int) -> dict[str, np.ndarray]:
+        """Bloque [buckets, APs] del nivel, ampliado al nº de APs actual."""
+        key = (level, chunk)
+        arrays = self._chunks.get(key)
+        if arrays is None:
+            path = self._chunk_path(level, chunk)
+            if path.exists():
+                arrays, _ = load_table(path)
+            else:
+                arrays = {}
+            self._chunks[key] = arrays
+        self._chunks.move_to_end(key)
+        self._evict(save=False)
+
+        n_aps = len(self.ap_names)
+        for measure in MEASURES:
+            for suffix, dtype in (("sum", np.float64), ("n", np.uint32)):
+                name = f"{measure}_{suffix}"
+                current = arrays.get(name)
+                if current is None or current.shape[1] < n_aps:
+                    grown = np.zeros((CHUNK_BUCKETS[level], n_aps), dtype)
+                    if current is not None:
+                        grown[:, : current.shape[1]] = current
+                    arrays[name] = grown
+        return arrays
+
+    def _evict(self, save: bool = True) -> None:
+        """
+        Suelta los bloques menos usados (nunca el último pedido). Si todos están
+        pendientes de guardar, se guarda antes de soltar memoria, pero solo con
+        `save=True`: a mitad de un snapshot se superan el límite un momento para
+        no guardar niveles con el snapshot aplicado a medias.
+        """
+        while len(self._chunks) > MAX_CACHED_CHUNKS:
+            candidates = list(self._chunks)[:-1]
+            key = next((k for k in candidates if k not in self._dirty), None)
+            if key is None:
+                if not save:
+                    return
+                self.save()
+                continue
+            del self._chunks[key]
+
+    # --- Ingesta ---
+
+    def _ap_codes(self, names: list[str]) -> np.ndarray:
+        codes = np.empty(len(names), dtype=np.intp)
+        for i, name in enumerate(names):
+            code = self._ap_index.get(name)
+            if code is None:
+                code = self._ap_index[name] = len(self.ap_names)
+                self.ap_names.append(name)
+            codes[i] = code
+        missing = len(self.ap_names) - len(self.ap_first)
+        if missing:
+            self.ap_first = np.r_[self.ap_first, np.full(missing, NO_DATA, dtype=np.int64)]
+            self.ap_last = np.r_[self.ap_last, np.full(missing, NO_DATA, dtype=np.int64)]
+        return codes
+
+    def _accumulate(self, ts: datetime, codes: np.ndarray, values: dict[str, np.ndarray]) -> None:
+        """Suma `values` (por AP, ya agregados: sum y n) en los cuatro niveles."""
+        minute = minutes_since_epoch(ts)
+        first = self.ap_first[codes]
+        self.ap_first[codes] = np.where(first == NO_DATA, minute, np.minimum(first, minute))
+        self.ap_last[codes] = np.maximum(self.ap_last[codes], minute)
+        for level, width in LEVELS.items():
+            bucket = minute // width
+            chunk, row = divmod(bucket, CHUNK_BUCKETS[level])
+            arrays = self._chunk(level, chunk)
+            for measure, (sums, counts) in values.items():
+                arrays[f"{measure}_sum"][row, codes] += sums
+                arrays[f"{measure}_n"][row, codes] += counts
+            self._dirty.add((level, chunk))
+
+    def add_ap_snapshot(self, path: Path) -> bool:
+        if path.name in self.sources:
+            return False
+        records = [r for r in load_records(path) if r.get("name")]
+        codes, first = np.unique(self._ap_codes([r["name"] for r in records]), return_index=True)
+        values = {}
+        for measure in AP_MEASURES:
+            raw = column(records, measure)[first]
+            ok = ~np.isnan(raw)
+            values[measure] = (np.where(ok, raw, 0.0), ok.astype(np.uint32))
+        self._accumulate(parse_snapshot_timestamp(path), codes, values)
+        self.sources.add(path.name)
+        self._evict()
+        return True
+
+    def add_client_snapshot(self, path: Path) -> bool:
+        if path.name in self.sources:
+            return False
+        records = [r for r in load_records(path) if r.get("associated_device_name")]
+        codes, inverse = np.unique(self._ap_codes([r["associated_device_name"] for r in records]), return_inverse=True)
+        values = {}
+        for measure in CLIENT_MEASURES:
+            raw = column(records, measure)
+            ok = ~np.isnan(raw)
+            values[measure] = (
+                np.bincount(inverse[ok], raw[ok], minlength=len(codes)),
+                np.bincount(inverse[ok], minlength=len(codes)).astype(np.uint32),
+            )
+        self._accumulate(parse_snapshot_timestamp(path), codes, values)
+        self.sources.add(path.name)
+        self._evict()
+        return True
+
+    def save(self) -> None:
+        for level, chunk in sorted(self._dirty):
+            save_table(self._chunk_path(level, chunk), self._chunks[(level, chunk)], {"level": level, "chunk": chunk})
+        self._dirty.clear()
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / "meta.json.tmp"
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "ap_names": self.ap_names,
+                    "sources": sorted(self.sources),
+                    "ap_first": self.ap_first.tolist(),
+                    "ap_last": self.ap_last.tolist(),
+                },
+                f,
+            )
+        tmp_path.replace(self.root / "meta.json")
+
+    # --- Consultas ---
+
+    def _columns(self, ap: str | None, building: str | None) -> np.ndarray:
+        if ap is not None:
+            code = self._ap_index.get(ap)
+            return np.array([] if code is None else [code], dtype=np.intp)
+        location = lookup_arrays(self.ap_names)
+        wanted = str(building).upper()
+        match = [
+            i for i, (code, name) in enumerate(zip(location["building_code"], location["building_name"]))
+            if code.upper() == wanted or name.upper() == wanted
+        ]
+        return np.array(match, dtype=np.intp)
+
+    def series(
+        self,
+        metric: str,
+        ap: str | None = None,
+        building: str | None = None,
+        since=None,
+        until=None,
+        points: int = 500,
+        level: str | None = None,
+    ) -> tuple[str, pd.DataFrame]:
+        """
+        Serie de `metric` para un AP o un edificio entre `since` y `until` (incluido).
+        Devuelve (nivel usado, DataFrame[time, value, n]) sin los buckets vacíos.
+        """
+        if metric not in MEASURES:
+            raise ValueError(f"Métrica no soportada: {metric} (usa {', '.join(MEASURES)})")
+        if (ap is None) == (building is None):
+            raise ValueError("Indica un AP o un edificio")
+        start = pd.Timestamp(since).to_pydatetime() if since is not None else EPOCH
+        end = (pd.Timestamp(until) + pd.Timedelta(days=1)).to_pydatetime() if until is not None else datetime.now()
+        start_min, end_min = max(minutes_since_epoch(start), 0), minutes_since_epoch(end)
+        cols = self._columns(ap, building)
+        # Recorte al rango con datos de la serie, para que el nivel dependa de lo que abarca de verdad
+        stored = cols[self.ap_first[cols] != NO_DATA] if len(cols) else cols
+        if len(stored):
+            start_min = max(start_min, int(self.ap_first[stored].min()))
+            end_min = max(min(end_min, int(self.ap_last[stored].max()) + 1), start_min)
+        level = level or choose_level(end_min - start_min, points)
+        width, per_chunk = LEVELS[level], CHUNK_BUCKETS[level]
+
+        first, last = start_min // width, max(end_min - 1, start_min) // width
+        # Solo bloques que existen (en disco o pendientes de guardar)
+        chunks = [
+            c for c in range(first // per_chunk, last // per_chunk + 1)
+            if (level, c) in self._chunks or self._chunk_path(level, c).exists()
+        ]
+        frames = []
+        for chunk in chunks:
+            arrays = self._chunk(level, chunk)
+            lo = max(first - chunk * per_chunk, 0)
+            hi = min(last - chunk * per_chunk + 1, per_chunk)
+            sums = arrays[f"{metric}_sum"][lo:hi, cols]
+            counts = arrays[f"{metric}_n"][lo:hi, cols].astype(np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                if metric == "client_count":
+                    value = np.where(counts > 0, sums / counts, 0.0).sum(axis=1)
+                else:
+                    value = sums.sum(axis=1) / counts.sum(axis=1)
+            n = counts.sum(axis=1)
+            buckets = np.arange(chunk * per_chunk + lo, chunk * per_chunk + hi)
+            keep = n > 0
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "time": pd.Timestamp(EPOCH) + pd.to_timedelta(buckets[keep] * width, unit="min"),
+                        "value": value[keep],
+                        "n": n[keep].astype(np.int64),
+                    }
+                )
+            )
+        result = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["time", "value", "n"])
+        return level, result
+
+
+def build_pyramid(max_files: int | None = None) -> TimePyramid:
+    pyramid = TimePyramid()
+    ap_files = [p for p in list_snapshots(AP_DIR, AP_PATTERN) if p.name not in pyramid.sources]
+    client_files = [p for p in list_snapshots(CLIENT_DIR, CLIENT_PATTERN) if p.name not in pyramid.sources]
+    if max_files is not None:
+        ap_files, client_files = ap_files[:max_files], client_files[:max_files]
+    print(f"Procesando {len(ap_files)} snapshots de APs y {len(client_files)} de clientes nuevos...")
+    for i, path in enumerate(ap_files, start=1):
+        pyramid.add_ap_snapshot(path)
+        if i % 500 == 0:
+            print(f"  APs: {i}/{len(ap_files)}")
+    for i, path in enumerate(client_files, start=1):
+        pyramid.add_client_snapshot(path)
+        if i % 500 == 0:
+            print(f"  Clientes: {i}/{len(client_files)}")
+    pyramid.save()
+    print(f"Pirámide guardada en {pyramid.root} ({len(pyramid.ap_names)} APs, {len(pyramid.sources)} snapshots).")
+    return pyramid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pirámide multirresolución de métricas por AP y edificio.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Añade los snapshots nuevos a la pirámide.")
+    build.add_argument("--max-files", type=int, default=None)
+    series = sub.add_parser("series", help="Muestra una serie.")
+    target = series.add_mutually_exclusive_group(required=True)
+    target.add_argument("--ap")
+    target.add_argument("--building")
+    series.add_argument("--metric", default="client_count", choices=MEASURES)
+    series.add_argument("--since")
+    series.add_argument("--until")
+    series.add_argument("--points", type=int, default=500)
+    series.add_argument("--level", choices=list(LEVELS))
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_pyramid(args.max_files)
+    else:
+        used, df = TimePyramid().series(args.metric, args.ap, args.building, args.since, args.until, args.points, args.level)
+        print(f"Nivel {used}: {len(df)} puntos")
+        print(df.to_string(index=False))
@@ -0,0 +1,225 @@
+"""
+Tabla columnar de radios a partir de la lista anidada `radios` de cada AP.
+
+Cada snapshot de APs se aplana en una sola pasada (sin pandas apply ni
+json_normalize) a columnas numpy: instante, AP, índice de radio, banda,
+canal, tx_power, utilization, status y spatial_stream. Las filas se guardan
+en particiones diarias (`data/processed/radios/YYYY-MM-DD.npz`), así que un
+análisis por edificio y banda es un escaneo de columnas de los días pedidos.
+
+Códigos:
+    band       0 = 2.4 GHz, 1 = 5 GHz, 3 = 6 GHz (como en los datos)
+    channel    0 si la radio no tiene canal asignado
+    tx_power   -1 y utilization 255 si faltan
+    status     1 = Up, 0 = otro
+
+Uso:
+    python -m analytics.radios build
+    python -m analytics.radios summary --by building --by band --since 2025-04-01
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+import pandas as pd
+
+from analytics.ap_directory import lookup_arrays
+from analytics.snapshots import AP_DIR, AP_PATTERN, PROCESSED_DIR, list_snapshots, load_records, load_table, parse_snapshot_timestamp, save_table
+
+RADIOS_DIR: Final = PROCESSED_DIR / "radios"
+BAND_NAMES: Final = {0: "2.4 GHz", 1: "5 GHz", 2: "band 2", 3: "6 GHz"}
+COLUMNS: Final = {
+    "time": np.int64,  # segundos UTC del snapshot
+    "ap": np.uint16,
+    "radio": np.uint8,
+    "band": np.uint8,
+    "channel": np.uint16,
+    "tx_power": np.int8,
+    "utilization": np.uint8,
+    "status": np.uint8,
+    "spatial_stream": np.uint8,
+}
+MISSING_UTILIZATION: Final = 255
+HIGH_UTILIZATION: Final = 80
+
+
+def _int(value, missing: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return missing
+
+
+def explode_radios(records: list[dict], ap_codes: np.ndarray, snapshot_ts: datetime, streams: dict[str, int]) -> dict[str, np.ndarray]:
+    """Aplana `radios` de todos los APs de un snapshot. `streams` es el vocabulario de spatial_stream."""
+    flat = [(code, radio) for code, record in zip(ap_codes, records) for radio in record.get("radios") or ()]
+    n = len(flat)
+    aps = [code for code, _ in flat]
+    radios = [radio for _, radio in flat]
+
+    def stream_code(value) -> int:
+        key = str(value)
+        code = streams.get(key)
+        if code is None:
+            code = streams[key] = len(streams)
+        return code
+
+    return {
+        "time": np.full(n, int(snapshot_ts.timestamp()), dtype=np.int64),
+        "ap": np.array(aps, dtype=np.uint16),
+        "radio": np.array([_int(r.get("index"), 0) for r in radios], dtype=np.uint8),
+        "band": np.array([_int(r.get("band"), 2) for r in radios], dtype=np.uint8),
+        "channel": np.array([_int(r.get("channel"), 0) for r in radios], dtype=np.uint16),
+        "tx_power": np.clip([_int(r.get("tx_power"), -1) for r in radios], -1, 127).astype(np.int8),
+        "utilization": np.clip([_int(r.get("utilization"), MISSING_UTILIZATION) for r in radios], 0, 255).astype(np.uint8),
+        "status": np.array([r.get("status") == "Up" for r in radios], dtype=np.uint8),
+        "spatial_stream": np.array([stream_code(r.get("spatial_stream")) for r in radios], dtype=np.uint8),
+    }
+
+
+class RadioTable:
+    def __init__(self, root: Path = RADIOS_DIR):
+        self.root = root
+        self.ap_names: list[str] = []
+        self.streams: dict[str, int] = {}
+        meta_file = root / "meta.json"
+        if meta_file.exists():
+            with meta_file.open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.ap_names = meta["ap_names"]
+            self.streams = meta["spatial_streams"]
+        self._ap_index = {name: i for i, name in enumerate(self.ap_names)}
+        self._partitions: dict[str, dict[str, list]] = {}  # día -> columnas pendientes + fuentes
+        self._sources: dict[str, set[str]] = {}
+
+    def _partition_path(self, day: str) -> Path:
+        return self.root / f"{day}.npz"
+
+    def _partition_sources(self, day: str) -> set[str]:
+        if day not in self._sources:
+            path = self._partition_path(day)
+            sources: set[str] = set()
+            if path.exists():
+                with np.load(path, allow_pickle=False) as data:
+                    sources = set(data["sources"].tolist())
+            self._sources[day] = sources
+        return self._sources[day]
+
+    def add_ap_snapshot(self, path: Path) -> bool:
+        ts = parse_snapshot_timestamp(path)
+        day = ts.date().isoformat()
+        sources = self._partition_sources(day)
+        if path.name in sources:
+            return False
+        records = [r for r in load_records(path) if r.get("name")]
+        codes = np.empty(len(records), dtype=np.intp)
+        for i, record in enumerate(records):
+            code = self._ap_index.get(record["name"])
+            if code is None:
+                code = self._ap_index[record["name"]] = len(self.ap_names)
+                self.ap_names.append(record["name"])
+            codes[i] = code
+        columns = explode_radios(records, codes, ts, self.streams)
+        pending = self._partitions.setdefault(day, {name: [] for name in COLUMNS})
+        for name in COLUMNS:
+            pending[name].append(columns[name])
+        sources.add(path.name)
+        return True
+
+    def save(self) -> None:
+        """Añade las filas pendientes a sus particiones diarias."""
+        for day, pending in self._partitions.items():
+            path = self._partition_path(day)
+            existing = load_table(path)[0] if path.exists() else {}
+            arrays = {
+                name: np.concatenate(([existing[name]] if name in existing else []) + pending[name]).astype(dtype)
+                for name, dtype in COLUMNS.items()
+            }
+            order = np.lexsort((arrays["radio"], arrays["ap"], arrays["time"]))
+            arrays = {name: array[order] for name, array in arrays.items()}
+            arrays["sources"] = np.array(sorted(self._sources[day]), dtype=str)
+            save_table(path, arrays, {"day": day})
+        self._partitions.clear()
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / "meta.json.tmp"
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump({"ap_names": self.ap_names, "spatial_streams": self.streams}, f)
+        tmp_path.replace(self.root / "meta.json")
+
+    def days(self) -> list[str]:
+        return sorted(p.stem for p in self.root.glob("????-??-??.npz"))
+
+    def load(self, since=None, until=None, columns: list[str] | None = None) -> pd.DataFrame:
+        """Filas de las particiones entre `since` y `until` (días incluidos)."""
+        columns = columns or list(COLUMNS)
+        wanted = [
+            day for day in self.days()
+            if (since is None or day >= str(pd.Timestamp(since).date())) and (until is None or day <= str(pd.Timestamp(until).date()))
+        ]
+        parts = []
+        for day in wanted:
+            with np.load(self._partition_path(day), allow_pickle=False) as data:
+                parts.append({name: data[name] for name in columns})
+        return pd.DataFrame({name: np.concatenate([p[name] for p in parts]) if parts else np.zeros(0, COLUMNS[name]) for name in columns})
+
+    def channel_utilization(self, by: tuple[str, ...] = ("building", "band"), since=None, until=None) -> pd.DataFrame:
+        """Utilización media, p95 y % de muestras >= HIGH_UTILIZATION de las radios Up."""
+        df = self.load(since, until, ["time", "ap", "band", "channel", "utilization", "status"])
+        df = df[(df["status"] == 1) & (df["utilization"] != MISSING_UTILIZATION)]
+        if "building" in by or "floor" in by:
+            location = lookup_arrays(self.ap_names)
+            ap = df["ap"].to_numpy()
+            df = df.assign(building=location["building_code"][ap], floor=location["floor"][ap])
+        if "ap" in by:
+            df = df.assign(ap=np.array(self.ap_names, dtype=object)[df["ap"].to_numpy()])
+        if "hour" in by:
+            df = df.assign(hour=pd.to_datetime(df["time"], unit="s", utc=True).dt.tz_convert("Europe/Madrid").dt.hour)
+        df = df.assign(high=(df["utilization"] >= HIGH_UTILIZATION).astype(np.float64) * 100)
+        grouped = df.groupby(list(by))
+        result = pd.concat(
+            {
+                "samples": grouped.size(),
+                "mean": grouped["utilization"].mean().round(1),
+                "p95": grouped["utilization"].quantile(0.95),
+                "high_pct": grouped["high"].mean().round(1),
+            },
+            axis=1,
+        ).reset_index()
+        if "band" in result:
+            result["band"] = result["band"].map(BAND_NAMES)
+        return result
+
+
+def build_radios(max_files: int | None = None) -> RadioTable:
+    table = RadioTable()
+    files = list_snapshots(AP_DIR, AP_PATTERN)
+    if max_files is not None:
+        files = files[:max_files]
+    added = sum(table.add_ap_snapshot(path) for path in files)
+    table.save()
+    print(f"{added} snapshots de APs añadidos a {table.root} ({len(table.days())} días).")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tabla columnar de radios de los APs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Aplana los snapshots de APs nuevos.")
+    build.add_argument("--max-files", type=int, default=None)
+    summary = sub.add_parser("summary", help="Utilización de canal agregada.")
+    summary.add_argument("--by", action="append", choices=["building", "floor", "ap", "band", "channel", "hour"])
+    summary.add_argument("--since")
+    summary.add_argument("--until")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_radios(args.max_files)
+    else:
+        result = RadioTable().channel_utilization(tuple(args.by or ("building", "band")), args.since, args.until)
+        print(result.to_string(index=False))
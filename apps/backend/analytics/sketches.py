@@ -0,0 +1,72 @@
+"""
+HyperLogLog vectorizado con numpy para contar dispositivos distintos.
+
+Los registros de varias celdas se combinan con un máximo elemento a elemento,
+así que los sketches son mergeables (rollups por edificio, día...).
+
+Con la precisión por defecto (4096 registros) un sketch denso por celda
+ocuparía 4 KB aunque la celda tenga diez dispositivos, así que también hay una
+forma dispersa: solo los registros no nulos, como pares (registro, rango).
+`estimate_sparse` combina y estima grupos de celdas sin pasar a denso.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PRECISION = 12  # 4096 registros, error típico 1,04 / sqrt(4096) ~ 1,6 % (casi exacto por debajo de ~10 000)
+
+
+def hash_values(values) -> np.ndarray:
+    """Hash estable de 64 bits (SipHash de pandas con clave fija)."""
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def register_updates(hashes: np.ndarray, precision: int = DEFAULT_PRECISION) -> tuple[np.ndarray, np.ndarray]:
+    """(índice de registro, rango) para cada hash: los `precision` bits altos eligen registro."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - precision)).astype(np.intp)
+    # Rango = posición del primer bit a 1 en los 32 bits bajos (33 si son todo ceros)
+    low = (hashes & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    _, exponent = np.frexp(low)
+    rank = np.where(low == 0, 33, 33 - exponent).astype(np.uint8)
+    return index, rank
+
+
+def _estimate(m: int, harmonic: np.ndarray, zeros: np.ndarray) -> np.ndarray:
+    """Estimador HLL a partir de sum(2^-registro) y del nº de registros a cero."""
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / harmonic
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+def estimate(registers: np.ndarray) -> np.ndarray:
+    """Cardinalidad estimada por fila de `registers` (shape [n, m])."""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    harmonic = np.sum(np.exp2(-registers.astype(np.float64)), axis=1)
+    return _estimate(m, harmonic, np.count_nonzero(registers == 0, axis=1))
+
+
+def merge_sparse(keys: np.ndarray, ranks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Claves únicas (ordenadas) con el rango máximo de cada una."""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    best = np.zeros(len(unique), dtype=np.uint8)
+    np.maximum.at(best, inverse, ranks)
+    return unique, best
+
+
+def estimate_sparse(groups: np.ndarray, registers: np.ndarray, ranks: np.ndarray, n_groups: int, precision: int = DEFAULT_PRECISION) -> np.ndarray:
+    """
+    Cardinalidad por grupo a partir de registros dispersos: (grupo, registro, rango)
+    por cada registro no nulo de cada celda del grupo, con repeticiones.
+    """
+    m = 1 << precision
+    keys, best = merge_sparse(np.asarray(groups, dtype=np.int64) * m + registers, ranks)
+    group = keys // m
+    nonzero = np.bincount(group, minlength=n_groups)
+    harmonic = np.bincount(group, np.exp2(-best.astype(np.float64)), minlength=n_groups) + (m - nonzero)
+    return _estimate(m, harmonic, m - nonzero)
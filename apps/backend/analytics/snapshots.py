@@ -0,0 +1,85 @@
+"""
+Rutas y lectura de los snapshots crudos de la WiFi UAB.
+
+Los ficheros llegan cada 15 minutos con el instante de captura en el nombre:
+
+    AP-info-v2-2025-04-03T00_15_01+02_00.json
+    client-info-2025-04-03T00_01_15+02_00-783.json   (783 = nº de registros)
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+
+ROOT_DIR: Final = Path(__file__).resolve().parents[3]
+RAW_DIR: Final = ROOT_DIR / "data" / "raw" / "anonymized_data"
+AP_DIR: Final = RAW_DIR / "aps"
+CLIENT_DIR: Final = RAW_DIR / "clients"
+PROCESSED_DIR: Final = ROOT_DIR / "data" / "processed"
+
+AP_PATTERN: Final = "AP-info-v2-*.json"
+CLIENT_PATTERN: Final = "client-info-*.json"
+
+_TIMESTAMP_RE = re.compile(r"(\d{4}-\d{2}-\d{2}T\d{2}_\d{2}_\d{2}[+-]\d{2}_\d{2})")
+
+
+def parse_snapshot_timestamp(path: Path | str) -> datetime:
+    """Instante de captura (con zona horaria) a partir del nombre del fichero."""
+    match = _TIMESTAMP_RE.search(Path(path).name)
+    if match is None:
+        raise ValueError(f"Nombre de snapshot sin timestamp: {path}")
+    return datetime.fromisoformat(match.group(1).replace("_", ":"))
+
+
+def list_snapshots(directory: Path, pattern: str) -> list[Path]:
+    """Ficheros de `directory` ordenados por instante de captura (no por nombre)."""
+    files = []
+    for path in directory.glob(pattern):
+        try:
+            files.append((parse_snapshot_timestamp(path), path))
+        except ValueError:
+            continue
+    files.sort()
+    return [path for _, path in files]
+
+
+def load_records(path: Path) -> list[dict]:
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [record for record in data if isinstance(record, dict)] if isinstance(data, list) else []
+
+
+def column(records: list[dict], field: str, dtype=float, missing=np.nan) -> np.ndarray:
+    """Extrae un campo de todos los registros como array, con `missing` para nulos o valores raros."""
+    out = np.empty(len(records), dtype=dtype)
+    for i, record in enumerate(records):
+        value = record.get(field)
+        try:
+            out[i] = missing if value is None else value
+        except (TypeError, ValueError):
+            out[i] = missing
+    return out
+
+
+def save_table(path: Path, arrays: dict[str, np.ndarray], meta: dict | None = None) -> None:
+    """Guarda columnas numpy en un `.npz` comprimido (escritura atómica) con metadatos JSON."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = dict(arrays)
+    payload["__meta__"] = np.array(json.dumps(meta or {}, ensure_ascii=False))
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        np.savez_compressed(f, **payload)
+    tmp_path.replace(path)
+
+
+def load_table(path: Path) -> tuple[dict[str, np.ndarray], dict]:
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files if key != "__meta__"}
+        meta = json.loads(str(data["__meta__"])) if "__meta__" in data.files else {}
+    return arrays, meta
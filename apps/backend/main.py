@@ -1,17 +1,45 @@
+import gzip
+import hashlib
+import json
+import math
 import os
+from contextlib import asynccontextmanager
+from datetime import date, datetime
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 
-from services.aina_client import AinaError, ask_aina
+from analytics.anomalies import METRICS as ANOMALY_METRICS
+from analytics.anomalies import query_events
+from analytics.data_store import TOP_METRICS, DataStore, page
+from peak_usage import PROFILES, PeakUsageEngine
+from services.aina_client import ANSWER_CACHE, AinaError, AinaUnavailable, ask_aina_async, close_async_client, get_async_client, set_toolbox, stream_aina
+from services.aina_tools import analytics_toolbox
+from services.metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware
 
 
 class ChatInput(BaseModel):
     message: str
 
 
-app = FastAPI(title="UAB THE HACK API", version="0.1.0")
+PEAK_STATS = ("mean", "p50", "p95", "max")
+
+
+data_store = DataStore()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    data_store.load()
+    if os.getenv("AINA_TOOLS", "1") != "0":
+        set_toolbox(analytics_toolbox(data_store, peak_engine))
+    yield
+    await close_async_client()
+
+
+app = FastAPI(title="UAB THE HACK API", version="0.1.0", lifespan=lifespan)
 
 raw_origins = os.getenv(
     "FRONTEND_ORIGINS",
@@ -30,6 +58,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/health")
@@ -38,17 +67,234 @@ def health():
 
 
 @app.post("/api/chat")
-def chat(input: ChatInput):
+async def chat(input: ChatInput):
     try:
-        answer = ask_aina(input.message)
+        answer = await ask_aina_async(input.message)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except AinaUnavailable as exc:
+        raise _unavailable(exc) from exc
     except AinaError as exc:
         raise HTTPException(status_code=502, detail=str(exc)) from exc
 
     return {"answer": answer}
 
 
+def _unavailable(exc: AinaUnavailable) -> HTTPException:
+    """503 inmediato con Retry-After cuando AINA está saturada o el circuito está abierto."""
+    return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))})
+
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(input: ChatInput):
+    """Resposta com a Server-Sent Events: `token` per fragment, i `done` o `error` al final."""
+    if not input.message.strip():
+        raise HTTPException(status_code=400, detail="Cal proporcionar una pregunta.")
+    try:
+        get_async_client().check_available()
+    except AinaUnavailable as exc:
+        raise _unavailable(exc) from exc
+
+    async def events():
+        try:
+            async for token in stream_aina(input.message):
+                yield _sse("token", {"token": token})
+        except AinaUnavailable as exc:
+            yield _sse("error", {"detail": str(exc), "retry_after": math.ceil(exc.retry_after)})
+            return
+        except AinaError as exc:
+            yield _sse("error", {"detail": str(exc)})
+            return
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/chat/cache")
+def chat_cache():
+    flights = get_async_client().flights
+    return {**ANSWER_CACHE.stats(), "in_flight": flights.in_flight, "upstream_calls": flights.started, "coalesced": flights.shared}
+
+
+peak_engine = PeakUsageEngine()
+
+
+# --- Métricas (Prometheus): lo que ya cuentan la cache, el cliente y el almacén se lee al consultar ---
+
+REGISTRY.callback("aina_cache_hits_total", "counter", "Respuestas servidas desde la cache.", lambda: ANSWER_CACHE.hits)
+REGISTRY.callback("aina_cache_misses_total", "counter", "Preguntas que no estaban en la cache.", lambda: ANSWER_CACHE.misses)
+REGISTRY.callback("aina_cache_evictions_total", "counter", "Entradas expulsadas de la cache por tamaño.", lambda: ANSWER_CACHE.evictions)
+REGISTRY.callback("aina_cache_entries", "gauge", "Entradas en la cache de respuestas.", lambda: ANSWER_CACHE.stats()["entries"])
+REGISTRY.callback("aina_upstream_in_flight", "gauge", "Llamadas a AINA en curso (tras agrupar las idénticas).", lambda: get_async_client().flights.in_flight)
+REGISTRY.callback("aina_upstream_calls_total", "counter", "Llamadas a AINA iniciadas desde /api/chat (sin contar las agrupadas).", lambda: get_async_client().flights.started)
+REGISTRY.callback("aina_coalesced_requests_total", "counter", "Preguntas que esperaron una llamada idéntica en curso.", lambda: get_async_client().flights.shared)
+
+
+def _tool_calls() -> dict:
+    toolbox = get_async_client().toolbox
+    return {"ok": toolbox.calls - toolbox.failures, "error": toolbox.failures} if toolbox else {}
+
+
+REGISTRY.callback("aina_upstream_active", "gauge", "Preguntas enviadas a AINA ahora mismo (límite AINA_MAX_CONCURRENT).", lambda: get_async_client().admission.active)
+REGISTRY.callback("aina_queue_waiting", "gauge", "Preguntas esperando turno para AINA.", lambda: get_async_client().admission.waiting)
+REGISTRY.callback(
+    "aina_rejected_total",
+    "counter",
+    "Preguntas rechazadas con 503, por motivo.",
+    lambda: {"queue": get_async_client().admission.rejected, "breaker": get_async_client().breaker.rejected},
+    ("reason",),
+)
+REGISTRY.callback(
+    "aina_breaker_open",
+    "gauge",
+    "Estado del circuit breaker de AINA (0 cerrado, 0.5 medio abierto, 1 abierto).",
+    lambda: {"closed": 0, "half_open": 0.5, "open": 1}[get_async_client().breaker.state],
+)
+REGISTRY.callback("aina_breaker_opened_total", "counter", "Veces que se ha abierto el circuit breaker.", lambda: get_async_client().breaker.opened)
+REGISTRY.callback("aina_tool_calls_total", "counter", "Llamadas del modelo a herramientas locales, por resultado.", _tool_calls, ("outcome",))
+REGISTRY.callback(
+    "datastore_load_seconds", "summary", "Tiempo de carga del almacén de datos por parte.", lambda: data_store.load_seconds, ("part",)
+)
+REGISTRY.callback(
+    "datastore_last_load_seconds", "gauge", "Duración de la última carga por parte.", lambda: data_store.last_load_seconds, ("part",)
+)
+REGISTRY.callback("datastore_version", "gauge", "Versión del almacén (sube con cada recarga).", lambda: data_store.version)
+REGISTRY.callback("peak_usage_snapshots", "gauge", "Snapshots incluidos en el motor de horas punta.", lambda: len(peak_engine.files))
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/api/peak-usage")
+def peak_usage(
+    by: str = Query("dow_hour", description=f"Franja: {', '.join(PROFILES)}"),
+    stat: str = Query("mean", description=f"Estadístico para ordenar: {', '.join(PEAK_STATS)}"),
+    top: int = Query(10, ge=0, description="Nº de franjas a devolver (0 = todas, en orden cronológico)"),
+    since: date | None = None,
+    until: date | None = None,
+):
+    if by not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"'by' ha de ser uno de: {', '.join(PROFILES)}")
+    if stat not in PEAK_STATS:
+        raise HTTPException(status_code=400, detail=f"'stat' ha de ser uno de: {', '.join(PEAK_STATS)}")
+
+    peak_engine.refresh()
+    if top:
+        rows = peak_engine.peak_hours(by, top, stat, since, until)
+    else:
+        rows = peak_engine.profile(by, since, until)
+    return {"by": by, "stat": stat, "snapshots": len(peak_engine.files), "rows": rows.to_dict(orient="records")}
+
+
+@app.get("/api/anomalies")
+def anomalies(
+    since: datetime | None = None,
+    metric: str | None = Query(None, description=f"Una de: {', '.join(ANOMALY_METRICS)}"),
+    ap: str | None = None,
+    kind: str | None = Query(None, description="spike, drop o stuck"),
+    limit: int = Query(100, ge=1, le=5000),
+):
+    if metric is not None and metric not in ANOMALY_METRICS:
+        raise HTTPException(status_code=400, detail=f"'metric' ha de ser una de: {', '.join(ANOMALY_METRICS)}")
+    rows = query_events(since, metric, ap, kind, limit)
+    return {"count": len(rows), "rows": rows.to_dict(orient="records")}
+
+
+# --- Endpoints de datos: almacén columnar en memoria, gzip, ETag/304 y paginación ---
+
+GZIP_MIN_BYTES = 1024
+
+
+def _data_response(request: Request, build) -> Response:
+    """
+    El ETag sale de la versión del almacén y la URL, así que un 304 se responde
+    sin calcular nada. El cuerpo se comprime si el cliente acepta gzip.
+    """
+    data_store.refresh()
+    etag = '"' + hashlib.sha1(f"{data_store.version}:{request.url.path}?{request.url.query}".encode()).hexdigest()[:20] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    body = json.dumps(build(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _paged(columns: dict, offset: int, limit: int, **extra) -> dict:
+    total, rows = page(columns, offset, limit)
+    next_offset = offset + limit if offset + limit < total else None
+    return {**extra, "total": total, "offset": offset, "limit": limit, "next_offset": next_offset, "rows": rows}
+
+
+@app.get("/api/data/aps/{ap}/hourly")
+def data_ap_hourly(
+    request: Request,
+    ap: str,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+):
+    def build():
+        columns = data_store.ap_hourly(ap, since, until)
+        if columns is None:
+            raise HTTPException(status_code=404, detail=f"AP desconocido: {ap}")
+        return _paged(columns, offset, limit, ap=ap)
+
+    return _data_response(request, build)
+
+
+@app.get("/api/data/buildings")
+def data_buildings(request: Request, since: datetime | None = None, until: datetime | None = None):
+    def build():
+        summary = data_store.building_summary(since, until)
+        return _paged(summary, 0, len(summary["building"]) or 1)
+
+    return _data_response(request, build)
+
+
+@app.get("/api/data/top-aps")
+def data_top_aps(
+    request: Request,
+    metric: str = Query("clients_mean", description=f"Una de: {', '.join(TOP_METRICS)}"),
+    since: datetime | None = None,
+    until: datetime | None = None,
+    building: str | None = Query(None, description="Código de edificio (Nom_Edific)"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=2000),
+):
+    if metric not in TOP_METRICS:
+        raise HTTPException(status_code=400, detail=f"'metric' ha de ser una de: {', '.join(TOP_METRICS)}")
+    return _data_response(request, lambda: _paged(data_store.top_aps(metric, since, until, building), offset, limit, metric=metric))
+
+
+@app.get("/api/data/snapshot")
+def data_snapshot(
+    request: Request,
+    building: str | None = None,
+    status: str | None = Query(None, description="Up o Down"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(200, ge=1, le=5000),
+):
+    def build():
+        latest = data_store.latest  # columnas y hora del mismo snapshot
+        return _paged(latest.select(building, status), offset, limit, time=latest.time)
+
+    return _data_response(request, build)
+
+
 if __name__ == "__main__":
     import uvicorn
 
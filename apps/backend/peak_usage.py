@@ -1,10 +1,44 @@
-from pathlib import Path
-import json
+"""
+Motor de horas pico: total de clientes conectados por snapshot de APs.
+
+Cada snapshot se reduce a una fila (instante, total de clientes, nº de APs) en
+una tabla persistente (`data/processed/peak_usage/totals.npz`) que solo se
+amplía con los ficheros nuevos. Para sumar `client_count` no se decodifica el
+JSON entero: basta con una expresión regular sobre los bytes del fichero.
+
+Los perfiles (hora, día de la semana × hora) dan media, p50, p95 y máximo, y
+se cachean en memoria hasta que entra un snapshot nuevo.
+
+La API y las herramientas del chatbot consultan el motor desde varios hilos:
+`refresh` construye la tabla nueva bajo un lock y la publica de una sola
+asignación, y las consultas leen siempre esa versión publicada.
+
+Uso:
+    python peak_usage.py            # actualiza la tabla y muestra las horas pico
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
 from datetime import datetime
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 
+from analytics.snapshots import AP_DIR, AP_PATTERN, PROCESSED_DIR, list_snapshots, load_table, parse_snapshot_timestamp, save_table
 
-DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+DATA_DIR = AP_DIR
+TOTALS_FILE = PROCESSED_DIR / "peak_usage" / "totals.npz"
+REFRESH_SECONDS = 60  # como mucho una revisión del directorio por minuto desde la API
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+PROFILES = {"hour": ["hour"], "dow_hour": ["dow", "hour"], "dow": ["dow"]}
+
+# Lector por proyección: solo `client_count` de cada AP (las radios no tienen ese campo)
+_CLIENT_COUNT_RE = re.compile(rb'"client_count"\s*:\s*(\d+|null)')
 
 
 def parse_timestamp_from_ap_filename(path: Path) -> datetime:
@@ -12,41 +46,164 @@ def parse_timestamp_from_ap_filename(path: Path) -> datetime:
     Ejemplo de nombre:
     AP-info-v2-2025-04-03T00_15_01+02_00.json
     """
-    stem = path.stem  # sin .json
-    parts = stem.split("-")
-    # ['AP', 'info', 'v2', '2025', '04', '03T00_15_01+02_00']
-    date_part = "-".join(parts[3:6])  # '2025-04-03T00_15_01+02_00'
-    date_part = date_part.replace("_", ":")  # '2025-04-03T00:15:01+02:00'
-    return datetime.fromisoformat(date_part)
-
-
-def load_ap_snapshots():
-    rows = []
-
-    ap_files = sorted(DATA_DIR.glob("AP-info-v2-*.json"))
-
-    for path in ap_files:
-        ts = parse_timestamp_from_ap_filename(path)
-
-        with path.open("r", encoding="utf-8") as f:
-            aps = json.load(f)  # lista de APs
-
-        # total de clientes conectados en ese snapshot
-        total_clients = sum(ap.get("client_count", 0) for ap in aps)
+    return parse_snapshot_timestamp(path)
+
+
+def read_snapshot_totals(path: Path) -> tuple[int, int]:
+    """(total de clientes, nº de APs) de un snapshot sin parsear el JSON completo."""
+    values = _CLIENT_COUNT_RE.findall(path.read_bytes())
+    return sum(int(v) for v in values if v != b"null"), len(values)
+
+
+class PeakUsageEngine:
+    def __init__(self, path: Path = TOTALS_FILE, data_dir: Path = DATA_DIR):
+        self.path = path
+        self.data_dir = data_dir
+        self.files: list[str] = []
+        self.epoch: list[int] = []  # segundos UTC
+        self.offset: list[int] = []  # minutos respecto a UTC (hora local del fichero)
+        self.total_clients: list[int] = []
+        self.n_aps: list[int] = []
+        self._seen: set[str] = set()
+        # Versión publicada para las consultas: (tabla por snapshot, perfiles cacheados)
+        self._published: tuple[pd.DataFrame, dict[tuple, pd.DataFrame]] | None = None
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+        if path.exists():
+            arrays, _ = load_table(path)
+            self.files = arrays["files"].tolist()
+            self.epoch = arrays["epoch"].tolist()
+            self.offset = arrays["offset"].tolist()
+            self.total_clients = arrays["total_clients"].tolist()
+            self.n_aps = arrays["n_aps"].tolist()
+            self._seen = set(self.files)
+
+    def add_snapshot(self, path: Path) -> bool:
+        with self._lock:
+            added = self._append(path)
+            if added:
+                self._published = None
+            return added
+
+    def _append(self, path: Path) -> bool:
+        """Añade un snapshot a las listas (con el lock tomado)."""
+        if path.name in self._seen:
+            return False
+        ts = parse_snapshot_timestamp(path)
+        total, n_aps = read_snapshot_totals(path)
+        self.files.append(path.name)
+        self.epoch.append(int(ts.timestamp()))
+        self.offset.append(int(ts.utcoffset().total_seconds() // 60) if ts.utcoffset() else 0)
+        self.total_clients.append(total)
+        self.n_aps.append(n_aps)
+        self._seen.add(path.name)
+        return True
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Añade los snapshots nuevos del directorio, guarda la tabla si ha cambiado y
+        publica la versión nueva ya construida. Las consultas en curso siguen con
+        la anterior.
+        """
+        if not force and time.monotonic() - self._last_refresh < REFRESH_SECONDS:
+            return 0
+        with self._lock:
+            if not force and time.monotonic() - self._last_refresh < REFRESH_SECONDS:
+                return 0  # otro hilo acaba de revisar
+            self._last_refresh = time.monotonic()
+            added = sum(self._append(path) for path in list_snapshots(self.data_dir, AP_PATTERN) if path.name not in self._seen)
+            if added:
+                self.save()
+            if added or self._published is None:
+                self._published = (self._build_frame(), {})
+        return added
+
+    def save(self) -> None:
+        save_table(
+            self.path,
+            {
+                "files": np.array(self.files, dtype=str),
+                "epoch": np.array(self.epoch, dtype=np.int64),
+                "offset": np.array(self.offset, dtype=np.int16),
+                "total_clients": np.array(self.total_clients, dtype=np.int64),
+                "n_aps": np.array(self.n_aps, dtype=np.int32),
+            },
+        )
 
-        rows.append(
+    def _build_frame(self) -> pd.DataFrame:
+        local = pd.to_datetime(np.array(self.epoch, dtype=np.int64) + np.array(self.offset, dtype=np.int64) * 60, unit="s")
+        df = pd.DataFrame(
             {
-                "snapshot_file": path.name,
-                "timestamp": ts,
-                "date": ts.date(),
-                "day_of_week": ts.strftime("%A"),  # 'Monday', 'Tuesday', etc.
-                "hour": ts.hour,
-                "total_clients": total_clients,
+                "snapshot_file": list(self.files),
+                "timestamp": local,
+                "total_clients": np.array(self.total_clients, dtype=np.int64),
+                "n_aps": np.array(self.n_aps, dtype=np.int64),
             }
-        )
+        ).sort_values("timestamp", ignore_index=True)
+        df["date"] = df["timestamp"].dt.date
+        df["dow"] = df["timestamp"].dt.dayofweek
+        df["day_of_week"] = np.array(DAY_NAMES, dtype=object)[df["dow"].to_numpy()]
+        df["hour"] = df["timestamp"].dt.hour
+        return df
+
+    def _current(self) -> tuple[pd.DataFrame, dict[tuple, pd.DataFrame]]:
+        published = self._published
+        if published is None:
+            with self._lock:
+                if self._published is None:
+                    self._published = (self._build_frame(), {})
+                published = self._published
+        return published
+
+    def frame(self) -> pd.DataFrame:
+        """Una fila por snapshot, en hora local y ordenada por instante."""
+        return self._current()[0]
+
+    def profile(self, by: str = "dow_hour", since=None, until=None, start=None, end=None) -> pd.DataFrame:
+        """
+        Media, p50, p95 y máximo de clientes simultáneos por franja. `since`/`until`
+        son fechas (ambas incluidas); `start`/`end`, instantes (`end` excluido).
+        """
+        key = (by, str(since), str(until), str(start), str(end))
+        df, profiles = self._current()  # tabla y cache de la misma versión
+        cached = profiles.get(key)
+        if cached is not None:
+            return cached
+        if by not in PROFILES:
+            raise ValueError(f"Perfil no soportado: {by} (usa {', '.join(PROFILES)})")
+
+        if since is not None:
+            df = df[df["timestamp"] >= pd.Timestamp(since)]
+        if until is not None:
+            df = df[df["timestamp"] < pd.Timestamp(until) + pd.Timedelta(days=1)]
+        if start is not None:
+            df = df[df["timestamp"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["timestamp"] < pd.Timestamp(end)]
+        grouped = df.groupby(PROFILES[by])["total_clients"]
+        result = pd.concat(
+            {
+                "snapshots": grouped.size(),
+                "mean": grouped.mean().round(1),
+                "p50": grouped.quantile(0.5),
+                "p95": grouped.quantile(0.95),
+                "max": grouped.max(),
+            },
+            axis=1,
+        ).reset_index()
+        if "dow" in result:
+            result.insert(result.columns.get_loc("dow") + 1, "day_of_week", np.array(DAY_NAMES, dtype=object)[result["dow"].to_numpy()])
+        profiles[key] = result
+        return result
 
-    df = pd.DataFrame(rows)
-    return df
+    def peak_hours(self, by: str = "dow_hour", top: int = 10, stat: str = "mean", since=None, until=None, start=None, end=None) -> pd.DataFrame:
+        return self.profile(by, since, until, start, end).sort_values(stat, ascending=False).head(top)
+
+
+def load_ap_snapshots() -> pd.DataFrame:
+    engine = PeakUsageEngine()
+    engine.refresh(force=True)
+    return engine.frame()
 
 
 def compute_peak_hours(df: pd.DataFrame):
@@ -68,14 +225,13 @@ def compute_peak_hours(df: pd.DataFrame):
 
 
 if __name__ == "__main__":
-    df = load_ap_snapshots()
-    print("Primeras filas:")
-    print(df.head())
-
-    by_hour, by_dow_hour = compute_peak_hours(df)
+    engine = PeakUsageEngine()
+    start = time.perf_counter()
+    added = engine.refresh(force=True)
+    print(f"{added} snapshots nuevos ({len(engine.files)} en total) en {time.perf_counter() - start:.2f}s")
 
-    print("\n>>> HORAS PICO (media de clientes, todos los días mezclados):")
-    print(by_hour.head(10))
+    print("\n>>> HORAS PICO (todos los días mezclados):")
+    print(engine.peak_hours("hour").to_string(index=False))
 
     print("\n>>> TOP FRANJAS (día de la semana + hora):")
-    print(by_dow_hour.head(10))
+    print(engine.peak_hours("dow_hour").to_string(index=False))
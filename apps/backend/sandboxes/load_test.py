@@ -0,0 +1,141 @@
+"""
+Prova de càrrega del backend: envia preguntes a un ritme fix (`--rps`) durant
+`--duration` segons i informa del throughput i dels percentils de latència.
+
+La càrrega és de bucle obert: cada petició surt a la seva hora encara que les
+anteriors no hagin acabat, i la latència es compta des d'aquesta hora prevista.
+Així un backend saturat es veu com a latència alta, en lloc de frenar el client.
+
+`--distinct N` repeteix N preguntes diferents (memòria cau i agrupació de
+crides); amb 0 totes són diferents, també entre execucions. Amb
+`--endpoint stream` també es mesura el temps fins al primer token.
+
+Ús (des de `apps/backend`, amb el backend apuntant a `sandboxes.mock_aina`):
+    python -m sandboxes.load_test --rps 50 --duration 30 --distinct 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+QUESTIONS = (
+    "Quin és l'AP amb més clients a l'edifici {n}?",
+    "Quines zones tenen mala cobertura a la planta {n}?",
+    "Com va la CPU dels APs de la biblioteca a les {n} h?",
+    "Quants dispositius es connecten a les aules a les {n} h?",
+)
+
+
+def question(i: int, distinct: int, rng: random.Random, tag: str) -> str:
+    if distinct:
+        n = rng.randrange(distinct)
+        return QUESTIONS[n % len(QUESTIONS)].format(n=n)
+    return QUESTIONS[i % len(QUESTIONS)].format(n=i) + f" ({tag}-{i})"  # mai a la memòria cau
+
+
+async def one_request(client: httpx.AsyncClient, endpoint: str, text: str, scheduled: float, results: list) -> None:
+    status: int | str = "error"
+    first_token = None
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", "/api/chat/stream", json={"message": text}) as response:
+                status = response.status_code
+                async for line in response.aiter_lines():
+                    if first_token is None and line.startswith("event: token"):
+                        first_token = time.perf_counter() - scheduled
+                    elif line.startswith("event: error"):
+                        status = "sse_error"
+        else:
+            response = await client.post("/api/chat", json={"message": text})
+            status = response.status_code
+    except httpx.TimeoutException:
+        status = "timeout"
+    except httpx.HTTPError:
+        status = "error"
+    results.append((status, time.perf_counter() - scheduled, first_token))
+
+
+async def run(url: str, endpoint: str, rps: float, duration: float, distinct: int, timeout: float, seed: int | None) -> dict:
+    rng = random.Random(seed)
+    total = int(rps * duration)
+    results: list = []
+    tasks = []
+    late = 0
+    tag = f"{time.time_ns() % 10**9:09d}"
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        for i in range(total):
+            scheduled = start + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -0.01:
+                late += 1  # el client no ha pogut sortir a temps
+            tasks.append(asyncio.create_task(one_request(client, endpoint, question(i, distinct, rng, tag), scheduled, results)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return report(results, elapsed, rps, late)
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(p50 * 1000, 1), "p95": round(p95 * 1000, 1), "p99": round(p99 * 1000, 1), "max": round(max(values) * 1000, 1)}
+
+
+def report(results: list, elapsed: float, rps: float, late: int) -> dict:
+    ok = [latency for status, latency, _ in results if status == 200]
+    first = [ttft for status, _, ttft in results if status == 200 and ttft is not None]
+    return {
+        "target_rps": rps,
+        "sent": len(results),
+        "ok": len(ok),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "elapsed_s": round(elapsed, 2),
+        "late_starts": late,
+        "status": dict(Counter(str(status) for status, _, _ in results)),
+        "latency_ms": _percentiles(ok),
+        "first_token_ms": _percentiles(first),
+    }
+
+
+def print_report(summary: dict) -> None:
+    print(
+        f"{summary['sent']} peticions en {summary['elapsed_s']} s (objectiu {summary['target_rps']} rps): "
+        f"{summary['ok']} correctes, {summary['throughput_rps']} rps"
+    )
+    print("  codis: " + ", ".join(f"{code}={count}" for code, count in sorted(summary["status"].items())))
+    for name, label in (("latency_ms", "latència"), ("first_token_ms", "primer token")):
+        if summary[name]:
+            print(f"  {label} (ms): " + "  ".join(f"{key} {value}" for key, value in summary[name].items()))
+    if summary["late_starts"]:
+        print(f"  {summary['late_starts']} peticions han sortit tard: el client no arriba al ritme demanat")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prova de càrrega de /api/chat a un ritme fix.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=("chat", "stream"), default="chat")
+    parser.add_argument("--rps", type=float, default=20.0)
+    parser.add_argument("--duration", type=float, default=30.0, help="Segons")
+    parser.add_argument("--distinct", type=int, default=0, help="Preguntes diferents (0 = totes diferents)")
+    parser.add_argument("--timeout", type=float, default=90.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="Resultat en JSON")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args.url, args.endpoint, args.rps, args.duration, args.distinct, args.timeout, args.seed))
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False))
+    else:
+        print_report(summary)
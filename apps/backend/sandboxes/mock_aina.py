@@ -0,0 +1,199 @@
+"""
+Servidor local que imita l'API de chat completions d'AINA (format OpenAI), per
+mesurar el backend sense gastar el límit de `api.publicai.co`.
+
+- Latència configurable fins al primer token (`--latency`): `fixed:0.5`,
+  `uniform:0.2,1.5`, `normal:0.8,0.2`, `lognormal:0.8,0.5` (mediana, sigma) o
+  `exp:0.8` (mitjana). Després, `--token-delay` segons per token.
+- `stream: true` respon amb Server-Sent Events token a token, com l'API real.
+- Errors injectats (`--error-rate`, `--error-status`) i límit de peticions per
+  segon (`--rate-limit`, 429 amb Retry-After).
+- `GET /stats` dona peticions rebudes, codis retornats (499 si el client tanca
+  un stream abans d'acabar) i màxim de simultànies.
+
+Ús (des de `apps/backend`):
+    python -m sandboxes.mock_aina --port 9100 --latency lognormal:0.8,0.5 --error-rate 0.02
+    AINA_API_URL=http://127.0.0.1:9100/v1/chat/completions uvicorn main:app --port 8000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "La xarxa WiFi de la UAB té cobertura bona a la majoria d'edificis però alguns "
+    "punts d'accés de la biblioteca i de les aules grans arriben a molts clients a les hores punta"
+).split()
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Distribució de latència a partir de `tipus:paràmetres` (segons)."""
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",")] if args else []
+    try:
+        if kind == "fixed":
+            (value,) = values
+            return lambda rng: value
+        if kind == "uniform":
+            low, high = values
+            return lambda rng: rng.uniform(low, high)
+        if kind == "normal":
+            mean, sd = values
+            return lambda rng: max(0.0, rng.gauss(mean, sd))
+        if kind == "lognormal":
+            median, sigma = values
+            return lambda rng: rng.lognormvariate(math.log(median), sigma)
+        if kind == "exp":
+            (mean,) = values
+            return lambda rng: rng.expovariate(1 / mean)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"Paràmetres incorrectes per a '{kind}': {args}") from exc
+    raise argparse.ArgumentTypeError(f"Distribució desconeguda: {kind} (fixed, uniform, normal, lognormal, exp)")
+
+
+@dataclass
+class MockConfig:
+    latency: Callable[[random.Random], float] = field(default_factory=lambda: parse_latency("fixed:0.5"))
+    token_delay: float = 0.02
+    tokens: int = 60
+    error_rate: float = 0.0
+    error_status: tuple[int, ...] = (500,)
+    rate_limit: float = 0.0  # peticions per segon; 0 = sense límit
+    seed: int | None = None
+
+
+class TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class TrackedStream(StreamingResponse):
+    """StreamingResponse que avisa quan s'acaba d'enviar, s'hagi començat o no el cos."""
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="AINA simulada")
+    rng = random.Random(config.seed)
+    bucket = TokenBucket(config.rate_limit) if config.rate_limit > 0 else None
+    stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "status": Counter()}
+
+    def answer_tokens(question: str) -> list[str]:
+        words = [word for word in question.split() if len(word) > 3][:5] or ["pregunta"]
+        pool = words + list(WORDS)
+        return [pool[i % len(pool)] + " " for i in range(config.tokens)]
+
+    def finish(status: int) -> None:
+        stats["status"][str(status)] += 1
+        stats["in_flight"] -= 1
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        status, streaming = 500, False  # si el handler peta abans de respondre, compta com a 500
+        try:
+            try:
+                body = await request.json()
+                question = body["messages"][-1].get("content") or ""
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                status = 400
+                return JSONResponse({"error": "cos no vàlid"}, status_code=400)
+            if bucket is not None and not bucket.take():
+                status = 429
+                return JSONResponse({"error": "rate limit"}, status_code=429, headers={"Retry-After": "1"})
+            await asyncio.sleep(config.latency(rng))
+            if rng.random() < config.error_rate:
+                status = rng.choice(config.error_status)
+                return JSONResponse({"error": "error simulat"}, status_code=status)
+
+            tokens = answer_tokens(question.rsplit("PREGUNTA", 1)[-1])
+            if not body.get("stream"):
+                await asyncio.sleep(config.token_delay * len(tokens))
+                status = 200
+                return {
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()}, "finish_reason": "stop"}],
+                }
+
+            sent = {"done": False}
+
+            async def events():
+                for token in tokens:
+                    yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': token}}]})}\n\n"
+                    await asyncio.sleep(config.token_delay)
+                yield "data: [DONE]\n\n"
+                sent["done"] = True
+
+            # El recompte es tanca quan acaba la resposta, també si el client se'n va abans del primer token
+            response = TrackedStream(events(), lambda: finish(200 if sent["done"] else 499), media_type="text/event-stream")
+            streaming = True
+            return response
+        finally:
+            if not streaming:
+                finish(status)
+
+    @app.get("/stats")
+    def get_stats():
+        return {**stats, "status": dict(stats["status"])}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servidor local que imita l'API de chat d'AINA.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=parse_latency, default="fixed:0.5", help="Latència fins al primer token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Segons entre tokens")
+    parser.add_argument("--tokens", type=int, default=60, help="Tokens per resposta")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracció de peticions que fallen")
+    parser.add_argument("--error-status", default="500", help="Codis d'error, separats per comes (p. ex. 500,503)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Peticions per segon abans de respondre 429")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency,
+        token_delay=args.token_delay,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        error_status=tuple(int(code) for code in args.error_status.split(",")),
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
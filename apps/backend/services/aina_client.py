@@ -4,45 +4,243 @@ Client lleuger per consultar l'IA d'AINA amb el context de WiFi UAB.
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
-from typing import Final
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Final, Iterator
 
+import httpx
 import requests
 
-API_URL: Final = "https://api.publicai.co/v1/chat/completions"
+from services.metrics import observe_upstream
+from services.retrieval import KnowledgeIndex, get_index
+
+if TYPE_CHECKING:  # les eines depenen dels agregats d'analytics; només el backend les carrega
+    from services.aina_tools import Toolbox
+
+API_URL: Final = os.getenv("AINA_API_URL", "https://api.publicai.co/v1/chat/completions")  # p. ex. sandboxes/mock_aina.py
 API_KEY: Final = os.getenv(
     "AINA_API_KEY",
     "zpka_152725c2e6f64a64a9b46a60a1a90cd6_0e09639d",
 )
 MODEL_NAME: Final = "BSC-LT/salamandra-7b-instruct-tools-16k"
 ROOT_DIR: Final = Path(__file__).resolve().parents[3]
-CONTEXT_FILE: Final = ROOT_DIR / "data" / "context" / "ai" / "el_teu_arxiu.txt"
+CONTEXT_DIR: Final = ROOT_DIR / "data" / "context" / "ai"
+CONTEXT_FILE: Final = CONTEXT_DIR / "el_teu_arxiu.txt"
+
+# Context per recuperació (services/retrieval.py): fragments rellevants dins d'un pressupost
+CONTEXT_MODE: Final = os.getenv("AINA_CONTEXT_MODE", "retrieval")  # "retrieval" o "full"
+CONTEXT_TOKENS: Final = int(os.getenv("AINA_CONTEXT_TOKENS", "1500"))
+CONTEXT_TOP_K: Final = int(os.getenv("AINA_CONTEXT_TOP_K", "8"))
+
+# Client asíncron: temps d'espera i mida del pool configurables per entorn
+CONNECT_TIMEOUT: Final = float(os.getenv("AINA_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT: Final = float(os.getenv("AINA_READ_TIMEOUT", "60"))
+MAX_CONNECTIONS: Final = int(os.getenv("AINA_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE: Final = int(os.getenv("AINA_MAX_KEEPALIVE", "20"))
+TOOL_ROUNDS: Final = int(os.getenv("AINA_TOOL_ROUNDS", "3"))  # rondes de crides a eines per pregunta
+
+# Protecció davant d'una API lenta: crides simultànies, cua d'espera i circuit breaker
+MAX_CONCURRENT: Final = int(os.getenv("AINA_MAX_CONCURRENT", "8"))
+QUEUE_SIZE: Final = int(os.getenv("AINA_QUEUE_SIZE", "16"))
+QUEUE_TIMEOUT: Final = float(os.getenv("AINA_QUEUE_TIMEOUT", "5"))
+BREAKER_FAILURES: Final = int(os.getenv("AINA_BREAKER_FAILURES", "5"))
+BREAKER_RESET: Final = float(os.getenv("AINA_BREAKER_RESET", "30"))
+
+# Paràmetres de generació (formen part de la clau de la memòria cau)
+PAYLOAD_PARAMS: Final = {"max_tokens": 500}
+
+# Memòria cau de respostes: AINA_CACHE_TTL=0 la desactiva; AINA_CACHE_FILE la persisteix
+CACHE_SIZE: Final = int(os.getenv("AINA_CACHE_SIZE", "256"))
+CACHE_TTL: Final = float(os.getenv("AINA_CACHE_TTL", "3600"))
+CACHE_FILE: Final = os.getenv("AINA_CACHE_FILE")
+CACHE_SAVE_DELAY: Final = float(os.getenv("AINA_CACHE_SAVE_DELAY", "5"))  # segons entre escriptures del fitxer
 
 
 class AinaError(RuntimeError):
     """Error quan la consulta a l'API falla o la resposta no és vàlida."""
 
 
-def _load_context() -> str:
-    try:
-        return CONTEXT_FILE.read_text(encoding="utf-8").strip()
-    except FileNotFoundError as exc:
-        raise AinaError(f"No s'ha trobat el fitxer de context: {CONTEXT_FILE}") from exc
+class AinaUnavailable(AinaError):
+    """La pregunta no s'envia: cua plena o circuit obert. `retry_after` en segons."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _knowledge_index() -> KnowledgeIndex:
+    index = get_index(CONTEXT_DIR) if CONTEXT_DIR.is_dir() else None
+    if index is None or not index.chunks:
+        raise AinaError(f"No s'ha trobat cap fitxer de context a {CONTEXT_DIR}")
+    return index
+
+
+def get_context(question: str | None = None) -> str:
+    """
+    Context per a una pregunta: els fragments més rellevants dins del pressupost
+    de tokens. Sense pregunta, o amb AINA_CONTEXT_MODE=full, tota la base.
+    """
+    index = _knowledge_index()
+    if question is None or CONTEXT_MODE == "full":
+        return "\n\n".join(chunk.text for chunk in index.chunks)
+    return index.context(question, CONTEXT_TOKENS, CONTEXT_TOP_K)
+
+
+def context_hash() -> str:
+    return _knowledge_index().fingerprint
+
+
+class AnswerCache:
+    """
+    Memòria cau LRU amb caducitat per a respostes d'AINA. Opcionalment es
+    desa en un fitxer JSON perquè sobrevisqui als reinicis.
+
+    Dins del bucle d'esdeveniments el fitxer no s'escriu a cada `put`: es marca
+    com a pendent i una tasca l'escriu en un fil com a molt cada `save_delay`
+    segons. En tancar el client es desa el que quedi (`aflush`).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_SIZE,
+        ttl: float = CACHE_TTL,
+        path: str | Path | None = CACHE_FILE,
+        save_delay: float = CACHE_SAVE_DELAY,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self.save_delay = save_delay
+        self.hits = self.misses = self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()  # clau -> (caduca, resposta)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # una sola escriptura del fitxer alhora
+        self._dirty = False
+        self._save_task: asyncio.Task | None = None
+        if self.path and self.path.exists():
+            try:
+                with self.path.open("r", encoding="utf-8") as f:
+                    stored = json.load(f)
+            except (OSError, ValueError):
+                stored = []
+            now = time.time()
+            for key, expires, answer in stored[-max_entries:]:
+                if expires > now:
+                    self._entries[key] = (expires, answer)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    @staticmethod
+    def key(question: str, tools: tuple[str, ...] = ()) -> str:
+        """Pregunta normalitzada + model + paràmetres + versió de la base de coneixement."""
+        normalized = re.sub(r"\s+", " ", question).strip().casefold()
+        retrieval = [CONTEXT_MODE, CONTEXT_TOKENS, CONTEXT_TOP_K]
+        raw = json.dumps([normalized, MODEL_NAME, PAYLOAD_PARAMS, retrieval, list(tools), context_hash()], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, answer: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+        self._schedule_save()
+
+    def _schedule_save(self) -> None:
+        if not self.path:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # fora del bucle (client síncron): es desa al moment
+            self.flush()
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_later())
+
+    async def _save_later(self) -> None:
+        await asyncio.sleep(self.save_delay)
+        await asyncio.to_thread(self.flush)
+
+    def flush(self) -> None:
+        """Escriu el fitxer si hi ha canvis pendents."""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                rows = [[key, expires, answer] for key, (expires, answer) in self._entries.items()]
+                self._dirty = False
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_name(self.path.name + ".tmp")
+                with tmp_path.open("w", encoding="utf-8") as f:
+                    json.dump(rows, f, ensure_ascii=False)
+                tmp_path.replace(self.path)
+            except OSError:
+                self._dirty = True  # es tornarà a provar a la propera escriptura
+                raise
 
+    async def aflush(self) -> None:
+        """Desa els canvis pendents sense esperar el retard (en tancar el backend)."""
+        if self._save_task is not None and not self._save_task.done():
+            self._save_task.cancel()
+        self._save_task = None
+        await asyncio.to_thread(self.flush)
 
-_CONTEXT_CACHE: str | None = None
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+        self._schedule_save()
 
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 3) if total else None,
+        }
 
-def get_context() -> str:
-    global _CONTEXT_CACHE
-    if _CONTEXT_CACHE is None:
-        _CONTEXT_CACHE = _load_context()
-    return _CONTEXT_CACHE
 
+ANSWER_CACHE: Final = AnswerCache()
 
-def build_payload(question: str) -> dict:
-    context_txt = get_context()
+
+def build_payload(question: str, tools: bool = False) -> dict:
+    context_txt = get_context(question)
+    tools_hint = " Si et calen xifres concretes que no surten al context, fes servir les eines disponibles." if tools else ""
     user_prompt = (
         "Basant-te exclusivament en el següent context respon la pregunta:\n\n"
         f"--- CONTEXT ---\n{context_txt}\n"
@@ -55,37 +253,505 @@ def build_payload(question: str) -> dict:
                 "role": "system",
                 "content": (
                     "Ets un assistent expert de la xarxa WiFi de la UAB. "
-                    "Respon en català i cita dades concretes quan sigui possible."
+                    "Respon en català i cita dades concretes quan sigui possible." + tools_hint
                 ),
             },
             {"role": "user", "content": user_prompt},
         ],
-        "max_tokens": 500,
+        **PAYLOAD_PARAMS,
     }
 
 
+def _headers() -> dict:
+    return {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+
+
+def _extract_message(status_code: int, text: str, data) -> dict:
+    if status_code != 200:
+        raise AinaError(f"Error en la sol·licitud a l'API ({status_code}): {text}")
+    try:
+        message = data()["choices"][0]["message"]
+    except (KeyError, IndexError, TypeError, ValueError) as exc:
+        raise AinaError("Resposta invàlida rebuda de l'API d'AINA.") from exc
+    if not isinstance(message, dict) or (message.get("content") is None and not message.get("tool_calls")):
+        raise AinaError("Resposta invàlida rebuda de l'API d'AINA.")
+    return message
+
+
+def _extract_answer(status_code: int, text: str, data) -> str:
+    return (_extract_message(status_code, text, data).get("content") or "").strip()
+
+
 def ask_aina(question: str) -> str:
     if not question.strip():
         raise ValueError("Cal proporcionar una pregunta.")
 
-    payload = build_payload(question)
-    headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+    key = ANSWER_CACHE.key(question)
+    cached = ANSWER_CACHE.get(key)
+    if cached is not None:
+        return cached
 
+    payload = build_payload(question)
     try:
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=60)
+        response = requests.post(API_URL, headers=_headers(), json=payload, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
     except requests.RequestException as exc:
         raise AinaError(f"No s'ha pogut contactar amb l'API d'AINA: {exc}") from exc
+    answer = _extract_answer(response.status_code, response.text, response.json)
+    ANSWER_CACHE.put(key, answer)
+    return answer
+
+
+def _failure(exc: httpx.HTTPError) -> str:
+    """Etiqueta de mètriques per a una crida sense resposta."""
+    return "timeout" if isinstance(exc, httpx.TimeoutException) else "network"
+
+
+class _StreamFlight:
+    """Resposta en streaming compartida: fragments rebuts fins ara i com ha acabat."""
+
+    def __init__(self):
+        self.tokens: list[str] = []
+        self.finished = False
+        self.error: BaseException | None = None
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def push(self, token: str) -> None:
+        self.tokens.append(token)
+        self._notify()
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.finished, self.error = True, error
+        self._notify()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Tots els fragments des del principi (qui arriba tard els rep de cop) i després els nous."""
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.tokens):
+                yield self.tokens[sent]
+                sent += 1
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class SingleFlight:
+    """
+    Agrupa crides idèntiques simultànies: la primera llança la petició i la resta
+    n'esperen el mateix resultat (o el mateix error). La crida va en una tasca
+    pròpia, així que si qui l'ha iniciada es desconnecta no es cancel·la per als altres.
+
+    `stream` fa el mateix amb respostes en streaming: una tasca llegeix l'API i
+    guarda els fragments, i cada client els segueix al seu ritme.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self._streams: dict[str, _StreamFlight] = {}
+        self.started = 0
+        self.shared = 0
+
+    def pending(self, key: str) -> asyncio.Task | None:
+        """Crida `do` en curs per a la clau, si n'hi ha."""
+        return self._calls.get(key)
 
-    if response.status_code != 200:
-        raise AinaError(
-            f"Error en la sol·licitud a l'API ({response.status_code}): {response.text}"
+    async def do(self, key: str, fn: Callable[[], Awaitable[str]]) -> str:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.started += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # evita l'avís d'excepció no recollida si ningú l'esperava
+
+    def stream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = self._streams[key] = _StreamFlight()
+            flight.task = asyncio.ensure_future(self._pump(key, flight, fn))
+            self.started += 1
+        else:
+            self.shared += 1
+        return flight.follow()
+
+    async def _pump(self, key: str, flight: _StreamFlight, fn: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for token in fn():
+                flight.push(token)
+        except asyncio.CancelledError:
+            flight.finish(AinaError("La consulta a AINA s'ha cancel·lat."))
+            raise
+        except Exception as exc:  # l'error el reben els clients que la segueixen
+            flight.finish(exc)
+        else:
+            flight.finish()
+        finally:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._streams)
+
+
+class Admission:
+    """
+    Límit de crides simultànies a l'API amb una cua curta. Si la cua és plena, o
+    no s'obté torn en `timeout` segons, es rebutja de seguida en lloc d'acumular
+    peticions que esperarien tot el temps d'espera de lectura.
+    """
+
+    def __init__(self, limit: int = MAX_CONCURRENT, queue: int = QUEUE_SIZE, timeout: float = QUEUE_TIMEOUT):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    def check(self) -> None:
+        if self.active + self.waiting >= self.limit + self.queue:  # `waiting` inclou qui encara no ha obtingut torn
+            self.rejected += 1
+            raise AinaUnavailable("AINA està saturada: massa preguntes en curs.", self.timeout)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        self.check()
+        self.waiting += 1
+        try:
+            # `asyncio.timeout` cancel·la l'acquire dins de la mateixa tasca: no pot quedar un torn agafat i perdut
+            async with asyncio.timeout(self.timeout):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            self.rejected += 1
+            raise AinaUnavailable("AINA està saturada: s'ha esgotat el temps d'espera a la cua.", self.timeout) from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+class CircuitBreaker:
+    """
+    S'obre després de `failures` errors seguits i rebutja les preguntes durant
+    `reset` segons. Passat aquest temps queda mig obert: una sola crida de prova
+    el torna a tancar si va bé o el reobre si falla.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET):
+        self.threshold = failures
+        self.reset = reset
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def check(self) -> None:
+        """Rebutja si el circuit és obert (o mig obert amb la prova ja en curs)."""
+        if self.state == self.OPEN:
+            remaining = self._opened_at + self.reset - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise AinaUnavailable("AINA no respon: es tornarà a provar d'aquí a poc.", remaining)
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and self._probing:
+            self.rejected += 1
+            raise AinaUnavailable("AINA no respon: s'està comprovant si s'ha recuperat.", self.reset)
+
+    @contextmanager
+    def call(self) -> Iterator[None]:
+        self.check()
+        self._probing = self.state == self.HALF_OPEN
+        try:
+            yield
+        except AinaError:
+            self._failure()
+            raise
+        except BaseException:  # cancel·lada: no diu res de l'estat de l'API
+            self._probing = False
+            raise
+        else:
+            self.state, self.failures, self._probing = self.CLOSED, 0, False
+
+    def _failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self.opened += 1
+
+
+class AsyncAinaClient:
+    """
+    Client asíncron amb un pool de connexions keep-alive compartit (HTTP/2 si hi
+    ha el paquet `h2`). Una sola instància serveix totes les peticions del procés.
+    `api_url` i `transport` permeten provar-lo contra un servidor local o simulat.
+
+    Amb `toolbox`, el model pot cridar eines locals (`services/aina_tools.py`):
+    fins a TOOL_ROUNDS rondes de crides abans de la resposta final. Si l'API
+    rebutja el camp `tools`, es continua sense eines.
+
+    Cada pregunta que arriba a l'API passa pel circuit breaker i per `Admission`;
+    si no es pot enviar es llança `AinaUnavailable` (el backend respon 503).
+    """
+
+    def __init__(
+        self,
+        api_url: str = API_URL,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_connections: int = MAX_CONNECTIONS,
+        transport: httpx.AsyncBaseTransport | None = None,
+        cache: AnswerCache | None = ANSWER_CACHE,
+        toolbox: Toolbox | None = None,
+        admission: Admission | None = None,
+        breaker: CircuitBreaker | None = None,
+    ):
+        try:
+            import h2  # noqa: F401
+
+            http2 = True
+        except ImportError:
+            http2 = False
+        self.api_url = api_url
+        self.cache = cache
+        self.toolbox = toolbox
+        self.tools_supported = True
+        self.flights = SingleFlight()
+        self.admission = admission or Admission()
+        self.breaker = breaker or CircuitBreaker()
+        self._client = httpx.AsyncClient(
+            headers=_headers(),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=MAX_KEEPALIVE),
+            http2=http2,
+            transport=transport,
         )
 
-    data = response.json()
-    try:
-        return data["choices"][0]["message"]["content"].strip()
-    except (KeyError, IndexError) as exc:
-        raise AinaError("Resposta invàlida rebuda de l'API d'AINA.") from exc
+    @property
+    def tool_names(self) -> tuple[str, ...]:
+        return self.toolbox.names if self.toolbox and self.tools_supported else ()
+
+    def _body(self, payload: dict, messages: list[dict], round_: int) -> dict:
+        body = {**payload, "messages": messages}
+        if self.tool_names and round_ < TOOL_ROUNDS:
+            body.update(tools=self.toolbox.schemas, tool_choice="auto")
+        return body
+
+    async def _run_tools(self, messages: list[dict], calls: list[dict]) -> None:
+        """Afegeix la petició del model i el resultat de cada eina a la conversa."""
+        messages.append({"role": "assistant", "content": None, "tool_calls": calls})
+        results = await asyncio.gather(
+            *(self.toolbox.call(call["function"]["name"], call["function"].get("arguments")) for call in calls)
+        )
+        for call, result in zip(calls, results):
+            messages.append({"role": "tool", "tool_call_id": call.get("id"), "name": call["function"]["name"], "content": result})
+
+    def check_available(self) -> None:
+        """Comprovació prèvia sense reservar torn (per respondre 503 abans d'obrir un stream)."""
+        self.breaker.check()
+        self.admission.check()
+
+    @asynccontextmanager
+    async def _guarded(self) -> AsyncIterator[None]:
+        self.breaker.check()  # amb el circuit obert no cal ni fer cua
+        async with self.admission.slot():
+            with self.breaker.call():
+                yield
+
+    def _tools_rejected(self, body: dict, status_code: int) -> bool:
+        if "tools" in body and status_code in (400, 422):
+            self.tools_supported = False
+            return True
+        return False
+
+    async def ask(self, question: str) -> str:
+        if not question.strip():
+            raise ValueError("Cal proporcionar una pregunta.")
+        key = AnswerCache.key(question, self.tool_names)
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        return await self.flights.do(key, lambda: self._fetch(key, question))
+
+    async def _fetch(self, key: str, question: str) -> str:
+        async with self._guarded():
+            return await self._fetch_answer(key, question)
+
+    async def _fetch_answer(self, key: str, question: str) -> str:
+        payload = build_payload(question, tools=bool(self.tool_names))
+        messages = list(payload["messages"])
+        round_ = 0
+        while round_ <= TOOL_ROUNDS:
+            body = self._body(payload, messages, round_)
+            start = time.perf_counter()
+            try:
+                response = await self._client.post(self.api_url, json=body)
+            except httpx.HTTPError as exc:
+                observe_upstream("chat", start, _failure(exc))
+                raise AinaError(f"No s'ha pogut contactar amb l'API d'AINA: {exc!r}") from exc
+            observe_upstream("chat", start, response.status_code)
+            if self._tools_rejected(body, response.status_code):
+                continue
+            message = _extract_message(response.status_code, response.text, response.json)
+            calls = message.get("tool_calls") if self.toolbox else None
+            if not calls:
+                answer = (message.get("content") or "").strip()
+                if self.cache:
+                    self.cache.put(key, answer)
+                return answer
+            await self._run_tools(messages, calls)
+            round_ += 1
+        raise AinaError("El model no ha donat resposta després de les crides a eines.")
+
+    async def stream(self, question: str) -> AsyncIterator[str]:
+        """
+        Fragments de la resposta a mesura que arriben (`stream: true` a l'API).
+        Una resposta a la memòria cau, o d'un `ask` idèntic en curs, es retorna
+        sencera d'un sol cop. Les preguntes idèntiques simultànies comparteixen
+        una sola crida a l'API, que llegeix una tasca pròpia: el torn d'`Admission`
+        i la prova del circuit es tornen quan acaba l'API, no quan el client
+        acaba de llegir. Les rondes de crides a eines es resolen abans
+        del text, que sí es transmet en directe.
+        """
+        if not question.strip():
+            raise ValueError("Cal proporcionar una pregunta.")
+        key = AnswerCache.key(question, self.tool_names)
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        pending = self.flights.pending(key)
+        if pending is not None:
+            self.flights.shared += 1
+            yield await asyncio.shield(pending)
+            return
+        async for token in self.flights.stream(key, lambda: self._stream_answer(key, question)):
+            yield token
+
+    async def _stream_answer(self, key: str, question: str) -> AsyncIterator[str]:
+        async with self._guarded():
+            payload = build_payload(question, tools=bool(self.tool_names))
+            messages = list(payload["messages"])
+            parts: list[str] = []
+            round_ = 0
+            try:
+                while round_ <= TOOL_ROUNDS:
+                    body = {**self._body(payload, messages, round_), "stream": True}
+                    calls: dict[int, dict] = {}
+                    start = time.perf_counter()
+                    status: int | str = "network"
+                    try:
+                        async with self._client.stream("POST", self.api_url, json=body) as response:
+                            status = response.status_code
+                            if response.status_code != 200:
+                                text = (await response.aread()).decode("utf-8", errors="replace")
+                                if self._tools_rejected(body, response.status_code):
+                                    continue
+                                raise AinaError(f"Error en la sol·licitud a l'API ({response.status_code}): {text}")
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    break
+                                try:
+                                    delta = json.loads(data)["choices"][0].get("delta") or {}
+                                except (ValueError, KeyError, IndexError) as exc:
+                                    raise AinaError("Resposta invàlida rebuda de l'API d'AINA.") from exc
+                                for fragment in delta.get("tool_calls") or ():
+                                    # Les crides arriben a trossos: s'ajunten per índex
+                                    call = calls.setdefault(fragment.get("index", 0), {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                                    call["id"] = fragment.get("id") or call["id"]
+                                    function = fragment.get("function") or {}
+                                    call["function"]["name"] += function.get("name") or ""
+                                    call["function"]["arguments"] += function.get("arguments") or ""
+                                token = delta.get("content")
+                                if token:
+                                    parts.append(token)
+                                    yield token
+                    except httpx.HTTPError as exc:
+                        status = _failure(exc)
+                        raise
+                    finally:
+                        observe_upstream("stream", start, status)
+                    if not calls or not self.toolbox:
+                        break
+                    await self._run_tools(messages, [calls[i] for i in sorted(calls)])
+                    round_ += 1
+            except httpx.HTTPError as exc:
+                raise AinaError(f"No s'ha pogut contactar amb l'API d'AINA: {exc!r}") from exc
+        if self.cache and parts:
+            self.cache.put(key, "".join(parts).strip())
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+        if self.cache:
+            await self.cache.aflush()
+
+
+_ASYNC_CLIENT: AsyncAinaClient | None = None
+
+
+_TOOLBOX: Toolbox | None = None
+
+
+def set_toolbox(toolbox: Toolbox | None) -> None:
+    """Eines per al client compartit (el backend les registra en arrencar)."""
+    global _TOOLBOX
+    _TOOLBOX = toolbox
+    if _ASYNC_CLIENT is not None:
+        _ASYNC_CLIENT.toolbox = toolbox
+
+
+def get_async_client() -> AsyncAinaClient:
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        _ASYNC_CLIENT = AsyncAinaClient(toolbox=_TOOLBOX)
+    return _ASYNC_CLIENT
+
+
+async def close_async_client() -> None:
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is not None:
+        await _ASYNC_CLIENT.aclose()
+        _ASYNC_CLIENT = None
+
+
+async def ask_aina_async(question: str) -> str:
+    return await get_async_client().ask(question)
+
+
+def stream_aina(question: str) -> AsyncIterator[str]:
+    return get_async_client().stream(question)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+"""
+Eines locals per al model (tool calling a l'estil OpenAI).
+
+El model pot demanar dades concretes en lloc de rebre-les totes al prompt:
+cada eina és una funció sobre els agregats en memòria (magatzem columnar de
+`/api/data`, motor d'hores punta i cub de clients). El backend executa les
+crides en un fil amb un temps màxim per crida i retorna el resultat en JSON.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Final
+
+import numpy as np
+
+from analytics.cube import CUBE_FILE, WifiCube
+from analytics.data_store import TOP_METRICS, DataStore, page
+from peak_usage import PROFILES, PeakUsageEngine
+
+TOOL_TIMEOUT: Final = float(os.getenv("AINA_TOOL_TIMEOUT", "3"))
+MAX_ROWS: Final = 20
+
+log = logging.getLogger(__name__)
+
+
+class ToolError(ValueError):
+    """Arguments invàlids o dades no disponibles; el missatge es retorna al model."""
+
+
+@dataclass(frozen=True)
+class Tool:
+    name: str
+    description: str
+    parameters: dict
+    fn: Callable[..., Any]
+
+    def schema(self) -> dict:
+        return {"type": "function", "function": {"name": self.name, "description": self.description, "parameters": self.parameters}}
+
+
+class Toolbox:
+    def __init__(self, tools: list[Tool], timeout: float = TOOL_TIMEOUT):
+        self.tools = {tool.name: tool for tool in tools}
+        self.timeout = timeout
+        self.calls = 0
+        self.failures = 0
+
+    @property
+    def names(self) -> tuple[str, ...]:
+        return tuple(sorted(self.tools))
+
+    @property
+    def schemas(self) -> list[dict]:
+        return [tool.schema() for tool in self.tools.values()]
+
+    async def call(self, name: str, arguments: str | dict | None) -> str:
+        """Executa una crida del model i en retorna el resultat (o l'error) com a JSON."""
+        self.calls += 1
+        try:
+            tool = self.tools.get(name)
+            if tool is None:
+                raise ToolError(f"Eina desconeguda: {name}")
+            try:
+                kwargs = json.loads(arguments) if isinstance(arguments, str) and arguments.strip() else dict(arguments or {})
+            except ValueError as exc:
+                raise ToolError(f"Arguments no vàlids: {exc}") from exc
+            result = await asyncio.wait_for(asyncio.to_thread(tool.fn, **kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            self.failures += 1
+            result = {"error": f"L'eina {name} ha superat el temps màxim de {self.timeout:g} s"}
+        except (ToolError, TypeError, ValueError) as exc:
+            self.failures += 1
+            result = {"error": str(exc)}
+        except Exception as exc:  # un error inesperat d'una eina no ha de fer caure la pregunta
+            self.failures += 1
+            log.exception("L'eina %s ha fallat", name)
+            result = {"error": f"L'eina {name} ha fallat: {type(exc).__name__}"}
+        return json.dumps(result, ensure_ascii=False, default=str)
+
+
+def _time(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError as exc:
+        raise ToolError(f"Data no vàlida (cal ISO 8601): {value}") from exc
+
+
+def _rows(columns: dict, limit: int = MAX_ROWS) -> list[dict]:
+    return page(columns, 0, max(1, min(int(limit), MAX_ROWS)))[1]
+
+
+_WINDOW: Final = {
+    "since": {"type": "string", "description": "Inici de la finestra (ISO 8601, hora local), opcional"},
+    "until": {"type": "string", "description": "Final de la finestra, exclòs (ISO 8601), opcional"},
+}
+# Els agregats són horaris: la finestra es compta per hores senceres (la de `since` inclosa, la de `until` exclosa)
+_HOURLY_WINDOW: Final = {
+    "since": {"type": "string", "description": "Inici de la finestra (ISO 8601, hora local; es compta des de l'inici de l'hora), opcional"},
+    "until": {"type": "string", "description": "Final de la finestra, exclòs (ISO 8601; l'hora que comença aquí ja no compta), opcional"},
+}
+
+
+def analytics_toolbox(data_store: DataStore, peak_engine: PeakUsageEngine, cube_file: Path = CUBE_FILE) -> Toolbox:
+    """Eines sobre els agregats ja carregats pel backend."""
+    cube_cache: dict[str, Any] = {}
+
+    def cube() -> WifiCube:
+        if not cube_file.exists():
+            raise ToolError("El cub de clients no està construït (python -m analytics.cube build).")
+        mtime = cube_file.stat().st_mtime_ns
+        if cube_cache.get("mtime") != mtime:
+            cube_cache.update(mtime=mtime, cube=WifiCube.load(cube_file))
+        return cube_cache["cube"]
+
+    def top_aps(metric: str = "clients_mean", since: str | None = None, until: str | None = None, building: str | None = None, limit: int = 10):
+        if metric not in TOP_METRICS:
+            raise ToolError(f"'metric' ha de ser una de: {', '.join(TOP_METRICS)}")
+        data_store.refresh()
+        return _rows(data_store.top_aps(metric, _time(since), _time(until), building), limit)
+
+    def ap_signal_stats(ap: str, since: str | None = None, until: str | None = None):
+        result = cube().query(["signal_db", "snr", "health"], ["n", "mean", "min", "max"], by=["ap"], start=_time(since), end=_time(until), aps=[ap])
+        if result.empty:
+            raise ToolError(f"No hi ha dades de clients per a {ap}")
+        row = result.iloc[0].to_dict()
+        return {key: (round(value, 2) if isinstance(value, float) and not np.isnan(value) else value) for key, value in row.items()}
+
+    def building_load(building: str, at: str):
+        data_store.refresh()
+        if building not in data_store.building_aps:
+            raise ToolError(f"Edifici desconegut: {building} (cal el codi Nom_Edific)")
+        hour = _time(at)
+        if hour is None:
+            raise ToolError("Cal indicar l'hora ('at').")
+        hour = hour.replace(minute=0, second=0, microsecond=0)
+        summary = data_store.building_summary(hour, hour + timedelta(hours=1))
+        match = np.flatnonzero(summary["building"] == building)  # fila dins del mateix resum
+        if not len(match):
+            raise ToolError(f"Edifici desconegut: {building} (cal el codi Nom_Edific)")
+        i = int(match[0])
+        row = page({name: values[i : i + 1] for name, values in summary.items()}, 0, 1)[1][0]
+        if not row["aps"]:
+            raise ToolError(f"No hi ha dades de {building} a {hour.isoformat()}")
+        return {"hour": hour.isoformat(), **row}
+
+    def peak_hours(by: str = "hour", top: int = 5, since: str | None = None, until: str | None = None):
+        if by not in PROFILES:
+            raise ToolError(f"'by' ha de ser un de: {', '.join(PROFILES)}")
+        peak_engine.refresh()
+        rows = peak_engine.peak_hours(by, max(1, min(int(top), MAX_ROWS)), "mean", start=_time(since), end=_time(until))
+        return rows.round(1).to_dict(orient="records")
+
+    return Toolbox(
+        [
+            Tool(
+                "top_aps",
+                "APs amb més càrrega en una finestra temporal (clients mitjans o màxims, CPU mitjana o màxima).",
+                {
+                    "type": "object",
+                    "properties": {
+                        "metric": {"type": "string", "enum": list(TOP_METRICS)},
+                        **_HOURLY_WINDOW,
+                        "building": {"type": "string", "description": "Codi d'edifici (Nom_Edific), opcional"},
+                        "limit": {"type": "integer", "minimum": 1, "maximum": MAX_ROWS},
+                    },
+                },
+                top_aps,
+            ),
+            Tool(
+                "ap_signal_stats",
+                "Estadístiques de senyal (dBm), SNR i health dels clients d'un AP.",
+                {"type": "object", "properties": {"ap": {"type": "string", "description": "Nom de l'AP, p. ex. AP-BIBSOC08"}, **_HOURLY_WINDOW}, "required": ["ap"]},
+                ap_signal_stats,
+            ),
+            Tool(
+                "building_load",
+                "Càrrega d'un edifici en una hora concreta: APs actius, clients mitjans i pic, CPU i ratio Up.",
+                {
+                    "type": "object",
+                    "properties": {
+                        "building": {"type": "string", "description": "Codi d'edifici (Nom_Edific), p. ex. B"},
+                        "at": {"type": "string", "description": "Hora (ISO 8601, hora local)"},
+                    },
+                    "required": ["building", "at"],
+                },
+                building_load,
+            ),
+            Tool(
+                "peak_hours",
+                "Franges amb més clients connectats a tot el campus (per hora, dia de la setmana o dia i hora).",
+                {
+                    "type": "object",
+                    "properties": {
+                        "by": {"type": "string", "enum": list(PROFILES)},
+                        "top": {"type": "integer", "minimum": 1, "maximum": MAX_ROWS},
+                        **_WINDOW,
+                    },
+                },
+                peak_hours,
+            ),
+        ]
+    )
@@ -0,0 +1,215 @@
+"""
+Mètriques del backend en format de text de Prometheus (`GET /metrics`).
+
+Pensades per estar sempre actives: els comptadors són entrades d'un diccionari
+i els histogrames tenen els límits fixats d'entrada (`bisect` + un increment).
+No fan servir locks perquè totes les observacions es fan des del bucle
+d'esdeveniments (middleware i client asíncron d'AINA). El que ja es compta en
+altres objectes (memòria cau, agrupació de crides, magatzem de dades) no es
+duplica: es llegeix en el moment de la consulta amb `Registry.callback`.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Final
+
+LATENCY_BUCKETS: Final = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UPSTREAM_BUCKETS: Final = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+CONTENT_TYPE: Final = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float) -> None:
+        self._values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}  # etiquetes -> [comptes per cubeta (+Inf al final), suma]
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Callback:
+    """
+    Mètrica calculada en el moment de la consulta. `fn` retorna un valor o un
+    diccionari {etiquetes: valor}; en un `summary`, els valors són (suma, recompte).
+    """
+
+    def __init__(self, name: str, kind: str, help: str, fn: Callable, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.fn = fn
+        self.labelnames = labelnames
+
+    def samples(self) -> list[str]:
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = []
+        for labels, value in sorted(values.items()):
+            labels = labels if isinstance(labels, tuple) else (labels,)
+            if self.kind == "summary":
+                total, count = value
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {_number(count)}")
+            elif value is not None:
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Counter | Histogram | Callback] = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Mètrica duplicada: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, kind: str, help: str, fn: Callable, labelnames: tuple[str, ...] = ()) -> Callback:
+        self.metrics.pop(name, None)  # es poden tornar a registrar (p. ex. en reiniciar l'app)
+        return self.register(Callback(name, kind, help, fn, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY: Final = Registry()
+
+HTTP_LATENCY: Final = REGISTRY.histogram(
+    "http_request_duration_seconds", "Durada de les peticions HTTP (fins a l'últim byte) per ruta.", ("method", "route", "status")
+)
+HTTP_IN_FLIGHT: Final = REGISTRY.gauge("http_requests_in_flight", "Peticions HTTP en curs.")
+UPSTREAM_LATENCY: Final = REGISTRY.histogram(
+    "aina_upstream_duration_seconds", "Durada de les crides a l'API d'AINA (en streaming, fins al final).", ("mode",), UPSTREAM_BUCKETS
+)
+UPSTREAM_RESPONSES: Final = REGISTRY.counter("aina_upstream_responses_total", "Respostes de l'API d'AINA per codi d'estat.", ("status",))
+UPSTREAM_ERRORS: Final = REGISTRY.counter(
+    "aina_upstream_errors_total", "Errors de l'API d'AINA: codi d'estat no 2xx, o timeout/network si no hi ha resposta.", ("status",)
+)
+
+
+def observe_upstream(mode: str, start: float, status: int | str) -> None:
+    """Registra una crida a AINA començada a `start` (`time.perf_counter()`)."""
+    UPSTREAM_LATENCY.observe(time.perf_counter() - start, mode)
+    if isinstance(status, int):
+        UPSTREAM_RESPONSES.inc(str(status))
+        if 200 <= status < 300:
+            return
+    UPSTREAM_ERRORS.inc(str(status))
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: latència fins que s'envia l'últim fragment del cos (inclou
+    les respostes en streaming) i peticions en curs. L'etiqueta `route` és la
+    plantilla de la ruta (`/api/data/aps/{ap}/hourly`), no el camí, per no
+    multiplicar sèries.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], route, str(status))
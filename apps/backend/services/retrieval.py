@@ -0,0 +1,197 @@
+"""
+Recuperació local de context per a AINA.
+
+Tots els fitxers de text de `data/context/ai/` (el resum fet a mà i les
+estadístiques precalculades) es parteixen en fragments i s'indexen amb BM25,
+tot en memòria i sense cap servei extern. Per a cada pregunta només s'envien
+els fragments més rellevants que caben en un pressupost de tokens, de manera
+que la mida del prompt no creix amb la base de coneixement.
+
+L'índex es reconstrueix sol quan canvia algun fitxer.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Final
+
+import numpy as np
+
+KNOWLEDGE_PATTERNS: Final = ("*.txt", "*.md")
+CHUNK_TOKENS: Final = 160
+BM25_K1: Final = 1.5
+BM25_B: Final = 0.75
+RECHECK_SECONDS: Final = 2.0  # cada quant es mira si han canviat els fitxers
+STOPWORDS: Final = frozenset(
+    """
+    a al als amb de del dels el els en es i la les li lo los per que qui quin quina quins quines un una uns unes
+    com on quan hi ha son es el la los las un una unos unas y o u de del al en con por para que cual cuales cuantos
+    cuantas como donde cuando hay es son mas the of and to in is are what which how
+    """.split()
+)
+_WORD = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+_ALPHA_PREFIX = re.compile(r"^([a-z]{3,})\d+$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Aproximació de ~4 caràcters per token (no tenim el tokenitzador del model)."""
+    return max(1, (len(text) + 3) // 4)
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Termes en minúscules i sense accents. Els noms compostos (`AP-BIBSOC08`) donen
+    el nom sencer, les parts i el prefix alfabètic (`bibsoc`).
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    terms = []
+    for word in _WORD.findall(text):
+        parts = re.split(r"[-_.]", word)
+        if len(parts) > 1:
+            terms.append(word)
+        for part in parts:
+            if part in STOPWORDS or (len(part) < 2 and not part.isdigit()):
+                continue
+            terms.append(part)
+            prefix = _ALPHA_PREFIX.match(part)
+            if prefix:
+                terms.append(prefix.group(1))
+    return terms
+
+
+@dataclass(frozen=True)
+class Chunk:
+    source: str
+    position: int  # ordre global (fitxer, posició dins del fitxer)
+    text: str
+    tokens: int
+
+
+def split_chunks(text: str, max_tokens: int = CHUNK_TOKENS) -> list[str]:
+    """Agrupa paràgrafs consecutius fins a `max_tokens`; els paràgrafs massa llargs es tallen per línies."""
+    pieces: list[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(line.strip() for line in paragraph.splitlines() if line.strip())
+
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current and size + piece_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class KnowledgeIndex:
+    """Índex BM25 sobre els fragments, amb llistes invertides en arrays numpy."""
+
+    def __init__(self, chunks: list[Chunk], fingerprint: str = ""):
+        self.chunks = chunks
+        self.fingerprint = fingerprint
+        self.total_tokens = sum(chunk.tokens for chunk in chunks)
+        postings: dict[str, dict[int, int]] = {}
+        lengths = np.zeros(len(chunks), dtype=np.float64)
+        for i, chunk in enumerate(chunks):
+            terms = tokenize(chunk.text)
+            lengths[i] = len(terms)
+            for term in terms:
+                bucket = postings.setdefault(term, {})
+                bucket[i] = bucket.get(i, 0) + 1
+        n = len(chunks)
+        self._norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (lengths.mean() if n and lengths.mean() else 1))
+        self._postings = {
+            term: (
+                np.fromiter(bucket.keys(), dtype=np.int64, count=len(bucket)),
+                np.fromiter(bucket.values(), dtype=np.float64, count=len(bucket)),
+                math.log(1 + (n - len(bucket) + 0.5) / (len(bucket) + 0.5)),
+            )
+            for term, bucket in postings.items()
+        }
+
+    def search(self, query: str, k: int) -> list[tuple[float, Chunk]]:
+        scores = np.zeros(len(self.chunks), dtype=np.float64)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tf, idf = posting
+            scores[ids] += idf * tf * (BM25_K1 + 1) / (tf + self._norm[ids])
+        hits = np.flatnonzero(scores > 0)
+        top = hits[np.argsort(-scores[hits], kind="stable")][:k]
+        return [(float(scores[i]), self.chunks[i]) for i in top]
+
+    def select(self, query: str, budget: int, k: int) -> list[Chunk]:
+        """
+        Els `k` fragments més rellevants que caben a `budget` tokens, en l'ordre
+        original. Si tota la base hi cap, s'envia sencera; si cap terme coincideix,
+        els primers fragments (el resum general).
+        """
+        if self.total_tokens <= budget:
+            return list(self.chunks)
+        candidates = [chunk for _, chunk in self.search(query, k)] or self.chunks[:k]
+        chosen, used = [], 0
+        for chunk in candidates:
+            if used + chunk.tokens > budget:
+                continue
+            chosen.append(chunk)
+            used += chunk.tokens
+        return sorted(chosen, key=lambda chunk: chunk.position)
+
+    def context(self, query: str, budget: int, k: int) -> str:
+        return "\n\n".join(chunk.text for chunk in self.select(query, budget, k))
+
+
+def knowledge_files(directory: Path) -> list[Path]:
+    """Fitxers de la base de coneixement: primer els de l'arrel (el resum), després els subdirectoris."""
+    files = {path for pattern in KNOWLEDGE_PATTERNS for path in directory.rglob(pattern) if path.is_file()}
+    return sorted(files, key=lambda path: (len(path.relative_to(directory).parts), str(path)))
+
+
+def build_index(directory: Path, max_tokens: int = CHUNK_TOKENS) -> KnowledgeIndex:
+    chunks: list[Chunk] = []
+    digest = hashlib.sha256()
+    for path in knowledge_files(directory):
+        text = path.read_text(encoding="utf-8")
+        digest.update(str(path.relative_to(directory)).encode("utf-8") + b"\0" + text.encode("utf-8") + b"\0")
+        for piece in split_chunks(text, max_tokens):
+            chunks.append(Chunk(str(path.relative_to(directory)), len(chunks), piece, estimate_tokens(piece)))
+    return KnowledgeIndex(chunks, digest.hexdigest())
+
+
+_INDEX: tuple[tuple, KnowledgeIndex] | None = None
+_CHECKED_AT = 0.0
+_INDEX_LOCK = threading.Lock()
+
+
+def get_index(directory: Path) -> KnowledgeIndex:
+    """Índex en memòria; es reconstrueix si algun fitxer s'ha afegit, esborrat o modificat."""
+    global _INDEX, _CHECKED_AT
+    with _INDEX_LOCK:
+        now = time.monotonic()
+        if _INDEX is not None and now - _CHECKED_AT < RECHECK_SECONDS:
+            return _INDEX[1]
+        stamp = tuple((str(path), path.stat().st_mtime_ns, path.stat().st_size) for path in knowledge_files(directory))
+        if _INDEX is None or _INDEX[0] != stamp:
+            _INDEX = (stamp, build_index(directory))
+        _CHECKED_AT = now
+        return _INDEX[1]
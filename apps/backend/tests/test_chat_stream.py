@@ -0,0 +1,116 @@
+"""
+Agrupació de `/api/chat/stream`: N peticions idèntiques simultànies han de fer
+una sola crida a l'API (aquí, l'AINA simulada de `sandboxes/mock_aina.py`).
+
+Ús (des de `apps/backend`):
+    python -m pytest -q tests
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+
+import main
+from sandboxes.mock_aina import MockConfig, create_app, parse_latency
+from services import aina_client
+from services.aina_client import AnswerCache, AsyncAinaClient
+
+QUESTION = "Quin és l'AP amb més clients a la biblioteca?"
+
+
+def sse_events(text: str) -> list[tuple[str, str]]:
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], lines["data"]))
+    return events
+
+
+async def ask_concurrently(n: int, cache: AnswerCache) -> tuple[list[httpx.Response], dict]:
+    mock = create_app(MockConfig(latency=parse_latency("fixed:0.2"), token_delay=0.005, tokens=20))
+    upstream = httpx.ASGITransport(app=mock)
+    client = AsyncAinaClient(api_url="http://aina/v1/chat/completions", transport=upstream, cache=cache)
+    aina_client._ASYNC_CLIENT = client
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://backend") as backend:
+            responses = await asyncio.gather(
+                *(backend.post("/api/chat/stream", json={"message": QUESTION}) for _ in range(n))
+            )
+        async with httpx.AsyncClient(transport=upstream, base_url="http://aina") as aina:
+            stats = (await aina.get("/stats")).json()
+    finally:
+        aina_client._ASYNC_CLIENT = None
+        await client.aclose()
+    return responses, stats
+
+
+def test_identical_streams_share_one_upstream_call():
+    responses, stats = asyncio.run(ask_concurrently(20, AnswerCache(ttl=0, path=None)))
+
+    assert stats["requests"] == 1
+    bodies = [sse_events(response.text) for response in responses]
+    assert all(response.status_code == 200 for response in responses)
+    assert all(events[-1][0] == "done" for events in bodies)
+    tokens = [[data for event, data in events if event == "token"] for events in bodies]
+    assert tokens[0] and all(t == tokens[0] for t in tokens)
+
+
+def test_cached_answer_skips_upstream():
+    cache = AnswerCache(ttl=60, path=None)
+    asyncio.run(ask_concurrently(1, cache))
+    responses, stats = asyncio.run(ask_concurrently(5, cache))
+
+    assert stats["requests"] == 0
+    assert all(sse_events(response.text)[-1][0] == "done" for response in responses)
+
+
+def test_late_joiner_replays_tokens():
+    async def scenario():
+        flights = aina_client.SingleFlight()
+        release = asyncio.Event()
+
+        async def upstream():
+            yield "a"
+            yield "b"
+            await release.wait()
+            yield "c"
+
+        async def collect(stream):
+            return [token async for token in stream]
+
+        first = asyncio.create_task(collect(flights.stream("k", upstream)))
+        await asyncio.sleep(0.01)
+        late = asyncio.create_task(collect(flights.stream("k", upstream)))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await first, await late, flights
+
+    first, late, flights = asyncio.run(scenario())
+    assert first == late == ["a", "b", "c"]
+    assert (flights.started, flights.shared, flights.in_flight) == (1, 1, 0)
+
+
+def test_slow_reader_does_not_hold_the_slot():
+    async def scenario():
+        mock = create_app(MockConfig(latency=parse_latency("fixed:0.05"), token_delay=0.0, tokens=10))
+        client = AsyncAinaClient(
+            api_url="http://aina/v1/chat/completions",
+            transport=httpx.ASGITransport(app=mock),
+            cache=AnswerCache(ttl=0, path=None),
+            admission=aina_client.Admission(limit=1, queue=0, timeout=1),
+        )
+        try:
+            stream = client.stream(QUESTION)
+            first = await stream.__anext__()
+            await asyncio.sleep(0.3)  # el client encara no ha llegit la resta
+            active = client.admission.active
+            rest = [token async for token in stream]
+        finally:
+            await client.aclose()
+        return active, [first, *rest]
+
+    active, tokens = asyncio.run(scenario())
+    assert active == 0
+    assert len(tokens) == 10
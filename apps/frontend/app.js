@@ -1,4 +1,55 @@
 const API_URL = "http://127.0.0.1:8000/api/chat";
+const STREAM_URL = `${API_URL}/stream`;
+
+const errorDetail = async (res) => {
+  const errorBody = await res.json().catch(() => ({}));
+  return errorBody?.detail || "No s'ha pogut obtenir resposta de l'IA.";
+};
+
+// Resposta sencera (navegadors sense lectura de streams)
+const askOnce = async (question, answerBox) => {
+  const res = await fetch(API_URL, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ message: question }),
+  });
+  if (!res.ok) throw new Error(await errorDetail(res));
+  const data = await res.json();
+  answerBox.textContent = data?.answer?.trim() || "La IA no ha retornat resposta.";
+};
+
+// Resposta en Server-Sent Events: cada esdeveniment `token` s'afegeix al quadre
+const askStreaming = async (question, answerBox) => {
+  const res = await fetch(STREAM_URL, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+    body: JSON.stringify({ message: question }),
+  });
+  if (!res.ok) throw new Error(await errorDetail(res));
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let answer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split("\n\n");
+    buffer = events.pop();
+    for (const raw of events) {
+      const event = raw.match(/^event: (.*)$/m)?.[1] || "message";
+      const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || "{}");
+      if (event === "token") {
+        answer += data.token;
+        answerBox.textContent = answer.trimStart();
+      } else if (event === "error") {
+        throw new Error(data.detail || "No s'ha pogut obtenir resposta de l'IA.");
+      }
+    }
+  }
+  if (!answer.trim()) answerBox.textContent = "La IA no ha retornat resposta.";
+};
 
 const sendBtn = document.getElementById("send");
 if (sendBtn) {
@@ -20,19 +71,11 @@ if (sendBtn) {
     answerBox.textContent = "Enviant la consulta al motor d'IA…";
 
     try {
-      const res = await fetch(API_URL, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: question }),
-      });
-
-      if (!res.ok) {
-        const errorBody = await res.json().catch(() => ({}));
-        const detail = errorBody?.detail || "No s'ha pogut obtenir resposta de l'IA.";
-        throw new Error(detail);
+      if (window.ReadableStream && window.TextDecoder) {
+        await askStreaming(question, answerBox);
+      } else {
+        await askOnce(question, answerBox);
       }
-      const data = await res.json();
-      answerBox.textContent = data?.answer?.trim() || "La IA no ha retornat resposta.";
     } catch (error) {
       console.error("Error consultant la IA:", error);
       answerBox.textContent =
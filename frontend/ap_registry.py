@@ -0,0 +1,129 @@
+"""
+Registro persistente de ubicaciones de APs (UTM EPSG:25831 -> Lat/Lon EPSG:4326).
+
+Cada AP se guarda por nombre junto a las coordenadas UTM de origen. Si en una
+ejecución posterior el AP llega con las mismas coordenadas, se reutiliza la
+conversión sin volver a llamar a pyproj. Los APs nuevos se resuelven primero
+con el GeoJSON WGS84 del paquete de geolocalización y, si no coinciden, con
+una única llamada vectorizada a `Transformer.transform(xs, ys)`.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+BASE_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BASE_DIR.parent
+REGISTRY_FILE = BASE_DIR / 'cache' / 'ap_registry.json'
+WGS84_FILES = [
+    PROJECT_ROOT / 'packages' / 'geolocation' / 'data' / 'aps_geolocalizados_wgs84.geojson',
+    PROJECT_ROOT / 'geolocation_package' / 'data' / 'aps_geolocalizados_wgs84.geojson',
+]
+
+# Tolerancia (en metros) para considerar que unas coordenadas UTM son las mismas
+COORD_TOLERANCE = 1e-3
+
+
+def _same_coords(entry, x, y):
+    return abs(entry['x'] - x) <= COORD_TOLERANCE and abs(entry['y'] - y) <= COORD_TOLERANCE
+
+
+def load_wgs84_index():
+    """Indexa el GeoJSON WGS84 por nombre de AP: {name: (X, Y, lat, lon)}."""
+    for path in WGS84_FILES:
+        if path.exists():
+            break
+    else:
+        return {}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        payload = json.load(f)
+
+    index = {}
+    for feature in payload.get('features', []):
+        props = feature.get('properties') or {}
+        geometry = feature.get('geometry') or {}
+        name = props.get('USER_NOM_A')
+        if not name or props.get('X') is None or props.get('Y') is None or not geometry.get('coordinates'):
+            continue
+        lon, lat = geometry['coordinates'][:2]
+        index[name] = (float(props['X']), float(props['Y']), lat, lon)
+    return index
+
+
+class APRegistry:
+    """Caché en disco de ubicaciones de APs indexada por nombre y coordenadas UTM."""
+
+    def __init__(self, path=REGISTRY_FILE):
+        self.path = Path(path)
+        self.entries = {}
+        self.dirty = False
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        tmp_path.replace(self.path)
+        self.dirty = False
+
+    def resolve(self, locations):
+        """
+        Recibe un DataFrame con columnas `name` y `location` (dict con x/y/building_name...)
+        y devuelve `name`, `lat`, `lon`, `building_name`, `building_code` y `floor`.
+        """
+        rows = []
+        for name, loc in zip(locations['name'], locations['location']):
+            try:
+                x, y = float(loc['x']), float(loc['y'])
+            except (TypeError, KeyError, ValueError):
+                continue
+            rows.append((name, x, y, loc.get('building_name', 'N/A'), loc.get('building_code'), loc.get('floor')))
+
+        misses = [row for row in rows if row[0] not in self.entries or not _same_coords(self.entries[row[0]], row[1], row[2])]
+
+        if misses:
+            wgs84_index = load_wgs84_index()
+            pending = []
+            for name, x, y, building_name, building_code, floor in misses:
+                entry = {
+                    'x': x, 'y': y,
+                    'building_name': building_name, 'building_code': building_code, 'floor': floor,
+                }
+                geo = wgs84_index.get(name)
+                if geo is not None and abs(geo[0] - x) <= COORD_TOLERANCE and abs(geo[1] - y) <= COORD_TOLERANCE:
+                    entry.update(lat=geo[2], lon=geo[3], source='wgs84')
+                    self.entries[name] = entry
+                else:
+                    pending.append((name, entry))
+
+            if pending:
+                transformer = Transformer.from_crs("epsg:25831", "epsg:4326")
+                xs = np.array([entry['x'] for _, entry in pending])
+                ys = np.array([entry['y'] for _, entry in pending])
+                lats, lons = transformer.transform(xs, ys)
+                for (name, entry), lat, lon in zip(pending, lats, lons):
+                    if not (np.isfinite(lat) and np.isfinite(lon)):
+                        continue
+                    entry.update(lat=float(lat), lon=float(lon), source='pyproj')
+                    self.entries[name] = entry
+
+            self.dirty = True
+
+        resolved = []
+        for name, x, y, *_ in rows:
+            entry = self.entries.get(name)
+            if entry is None or not _same_coords(entry, x, y):
+                continue
+            resolved.append((name, entry['lat'], entry['lon'], entry['building_name'],
+                             entry.get('building_code'), entry.get('floor')))
+
+        return pd.DataFrame(resolved, columns=['name', 'lat', 'lon', 'building_name', 'building_code', 'floor'])
@@ -2,9 +2,20 @@ import pandas as pd
 import folium
 from folium.plugins import TimestampedGeoJson
 from pyproj import Transformer
+import argparse
+import fnmatch
 import json
+import os
+import tempfile
+from datetime import date
+from pathlib import Path
 import branca # Necesario para las escalas de color
 import numpy as np # Necesario para comprobar NaNs
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ap_registry import APRegistry
+from metrics_cache import MetricsCache, source_fingerprint
+import timeline_codec
 
 # --- Constantes ---
 FILE_APS = 'rookie_filtered_aps.json'
@@ -14,6 +25,25 @@ FILE_CLIENTS = 'rookie_filtered_clients.json'
 OUTPUT_MAP_HEALTH = 'mapa_health_dinamico.html'
 OUTPUT_MAP_SIGNAL = 'mapa_signal_dinamico.html'
 OUTPUT_MAP_CLIENTS = 'mapa_clientes_dinamico.html'
+OUTPUT_TIMELINE = 'timeline.bin' # Datos compartidos por los tres mapas en formato compacto
+
+MAPS = [
+    ('health', OUTPUT_MAP_HEALTH, "Mapa Dinámico: Health (Color: 0=Rojo, 100=Verde)"),
+    ('signal', OUTPUT_MAP_SIGNAL, "Mapa Dinámico: Señal (Color: Malo=Rojo, Bueno=Verde)"),
+    ('clients', OUTPUT_MAP_CLIENTS, "Mapa Dinámico: Nº Clientes (Tamaño: Dinámico | Borde: Verde-Rojo)"),
+]
+
+# Marcador que se sustituye por el GeoJSON al escribir el HTML en streaming
+GEOJSON_PLACEHOLDER = '__TIMESTAMPED_GEOJSON_DATA__'
+
+# Columnas que necesita cada worker para generar su mapa
+TIMELINE_COLUMNS = [
+    'name', 'lat', 'lon', 'building_name', 'timestamp_str',
+    'avg_health', 'avg_signal_db', 'num_clients_metricos'
+]
+
+# Filas (AP x hora) por partición de la línea de tiempo que se pasa a los workers por disco
+TIMELINE_PART_ROWS = 200_000
 
 # --- Función de Escala (para el radio) ---
 def linear_scale(value, in_min, in_max, out_min, out_max):
@@ -44,114 +74,146 @@ start_lat, start_lon = transformer.transform(start_x, start_y)
 map_center_coords = [start_lat, start_lon]
 # ------------------------------------
 
-print("Script iniciado...")
+# Estilo INVISIBLE para APs sin datos
+style_invisible = {
+    'color': '#000000', 'fillColor': '#000000',
+    'opacity': 0.0, 'fillOpacity': 0.0, 'weight': 0, 'radius': 0
+}
+
 
 # --- 1. Cargar y Procesar Datos de Clientes ---
-print(f"Cargando y procesando clientes desde {FILE_CLIENTS}...")
-try:
-    df_clients = pd.read_json(FILE_CLIENTS)
-    
-    df_clients['health'] = pd.to_numeric(df_clients['health'], errors='coerce')
-    df_clients['signal_db'] = pd.to_numeric(df_clients['signal_db'], errors='coerce')
-    df_clients = df_clients.dropna(subset=['health', 'signal_db', 'associated_device_name', 'date', 'hour'])
-
-    df_metrics = df_clients.groupby(['date', 'hour', 'associated_device_name']).agg(
-        avg_health=('health', 'mean'),
-        avg_signal_db=('signal_db', 'mean'),
-        num_clients_metricos=('health', 'size')
-    ).reset_index()
-
-    df_metrics.rename(columns={'associated_device_name': 'name'}, inplace=True)
-    print(f"Métricas de clientes calculadas (ej: {len(df_metrics)} registros de AP/hora).")
-
-except FileNotFoundError:
-    print(f"Error: No se encontró el archivo {FILE_CLIENTS}")
-    exit()
-except Exception as e:
-    print(f"Error procesando {FILE_CLIENTS}: {e}")
-    exit()
+def load_client_metrics(clients_file=FILE_CLIENTS, since=None, until=None, ap_names=None):
+    """
+    Métricas por (date, hour, AP). `since`/`until` ('YYYY-MM-DD') y `ap_names`
+    se aplican al leer: solo se agregan y cargan los días y APs pedidos.
+    """
+    print(f"Cargando y procesando clientes desde {clients_file}...")
+    cache = MetricsCache()
+    scoped = since is not None or until is not None
+    try:
+        source = source_fingerprint(clients_file)
+
+        if cache.is_fresh(source):
+            print("El fichero de clientes no ha cambiado: se usan las métricas cacheadas por día.")
+        else:
+            with open(clients_file, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            if scoped:
+                records = [
+                    r for r in records
+                    if r.get('date') and (since is None or r['date'][:10] >= since) and (until is None or r['date'][:10] <= until)
+                ]
+            df_clients = pd.DataFrame.from_records(records, columns=['date', 'hour', 'health', 'signal_db', 'associated_device_name'])
+            del records
+
+            df_clients['date'] = pd.to_datetime(df_clients['date'])
+            df_clients['health'] = pd.to_numeric(df_clients['health'], errors='coerce')
+            df_clients['signal_db'] = pd.to_numeric(df_clients['signal_db'], errors='coerce')
+            df_clients = df_clients.dropna(subset=['health', 'signal_db', 'associated_device_name', 'date', 'hour'])
+
+            # Solo se vuelve a agregar los días cuya huella ha cambiado
+            changed_days = cache.update(df_clients, source, full=not scoped, since=since, until=until)
+            print(f"Días recalculados: {len(changed_days)} (en caché: {len(cache.manifest['partitions'])}).")
+
+        df_metrics = cache.load_partitions(cache.date_keys(since, until))
+        if ap_names is not None:
+            df_metrics = df_metrics[df_metrics['name'].isin(ap_names)]
+        print(f"Métricas de clientes calculadas (ej: {len(df_metrics)} registros de AP/hora).")
+
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo {clients_file}")
+        exit()
+    except Exception as e:
+        print(f"Error procesando {clients_file}: {e}")
+        exit()
+
+    return df_metrics
+
+
+def in_scope(name, location, buildings=None, aps=None):
+    """¿Entra el AP en el filtro? `buildings`: códigos o nombres de edificio; `aps`: nombres o patrones glob."""
+    if aps and not any(fnmatch.fnmatchcase(name or '', pattern) for pattern in aps):
+        return False
+    if buildings:
+        candidates = {str(location.get('building_code') or '').upper(), str(location.get('building_name') or '').upper()}
+        if not candidates & {b.upper() for b in buildings}:
+            return False
+    return True
+
 
 # --- 2. Cargar y Procesar Ubicaciones de APs ---
-print(f"Cargando y procesando APs desde {FILE_APS}...")
-try:
-    with open(FILE_APS, 'r', encoding='utf-8') as f:
-        data_aps = json.load(f)
-    df_aps = pd.DataFrame(data_aps)
-
-    df_aps = df_aps.dropna(subset=['location'])
-    df_ap_locations = df_aps.drop_duplicates(subset=['name'], keep='last').copy()
-
-    def convert_coordinates(row):
-        try:
-            x = row['location']['x']
-            y = row['location']['y']
-            lat, lon = transformer.transform(x, y)
-            return pd.Series([lat, lon, row['location'].get('building_name', 'N/A')])
-        except Exception:
-            return pd.Series([None, None, None])
-
-    print("Convirtiendo coordenadas UTM a Lat/Lon (esto puede tardar un momento)...")
-    df_ap_locations[['lat', 'lon', 'building_name']] = df_ap_locations.apply(convert_coordinates, axis=1)
-    df_ap_locations = df_ap_locations.dropna(subset=['lat', 'lon'])
-    df_ap_locations = df_ap_locations[['name', 'lat', 'lon', 'building_name']]
-    print(f"Ubicaciones únicas de APs procesadas (total: {len(df_ap_locations)} APs).")
-    
-except FileNotFoundError:
-    print(f"Error: No se encontró el archivo {FILE_APS}")
-    exit()
-except Exception as e:
-    print(f"Error procesando {FILE_APS}: {e}")
-    exit()
+def load_ap_locations(aps_file=FILE_APS, buildings=None, aps=None):
+    print(f"Cargando y procesando APs desde {aps_file}...")
+    try:
+        with open(aps_file, 'r', encoding='utf-8') as f:
+            data_aps = json.load(f)
+        # Filtramos antes de crear el DataFrame para no materializar APs que no se van a dibujar
+        data_aps = [r for r in data_aps if r.get('location') and in_scope(r.get('name'), r['location'], buildings, aps)]
+        df_aps = pd.DataFrame(data_aps, columns=['name', 'location'])
+        del data_aps
+
+        df_ap_locations = df_aps.drop_duplicates(subset=['name'], keep='last').copy()
+
+        # Las conversiones ya hechas se reutilizan desde el registro en disco
+        print("Convirtiendo coordenadas UTM a Lat/Lon...")
+        registry = APRegistry()
+        df_ap_locations = registry.resolve(df_ap_locations)
+        registry.save()
+        df_ap_locations = df_ap_locations[['name', 'lat', 'lon', 'building_name']]
+        print(f"Ubicaciones únicas de APs procesadas (total: {len(df_ap_locations)} APs).")
+
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo {aps_file}")
+        exit()
+    except Exception as e:
+        print(f"Error procesando {aps_file}: {e}")
+        exit()
+
+    return df_ap_locations
+
 
 # --- 3. Unir Métricas y Ubicaciones ---
-print("Uniendo métricas de clientes con ubicaciones de APs...")
-df_master = pd.merge(df_metrics, df_ap_locations, on='name', how='inner')
+def merge_metrics_locations(df_metrics, df_ap_locations):
+    print("Uniendo métricas de clientes con ubicaciones de APs...")
+    df_master = pd.merge(df_metrics, df_ap_locations, on='name', how='inner')
 
-if df_master.empty:
-    print("Error: No se ha podido encontrar datos comunes entre clientes y APs.")
-    exit()
+    if df_master.empty:
+        print("Error: No se ha podido encontrar datos comunes entre clientes y APs.")
+        exit()
 
-# Creamos el timestamp string en el dataframe maestro
-df_master['hour_str'] = df_master['hour'].astype(str).str.zfill(2)
-df_master['timestamp_str'] = df_master['date'].dt.strftime('%Y-%m-%d') + 'T' + df_master['hour_str'] + ':00:00'
+    # Creamos el timestamp string en el dataframe maestro
+    df_master['hour_str'] = df_master['hour'].astype(str).str.zfill(2)
+    df_master['timestamp_str'] = pd.to_datetime(df_master['date']).dt.strftime('%Y-%m-%d') + 'T' + df_master['hour_str'] + ':00:00'
 
+    max_clients_global = df_master['num_clients_metricos'].max()
+    if pd.isna(max_clients_global) or max_clients_global == 0: max_clients_global = 1
 
-# --- 4. Preparar Datos para TimestampedGeoJson (¡MODIFICADO!) ---
-print("Creando 'scaffolding' de tiempo/AP para evitar 'stacking'...")
+    return df_master, max_clients_global
 
-# Obtenemos todos los APs únicos y todos los tiempos únicos
-all_aps_data = df_ap_locations[['name', 'lat', 'lon', 'building_name']]
-all_times = df_master['timestamp_str'].unique()
-all_times.sort() # Nos aseguramos de que el tiempo esté ordenado
 
-# 1. Crear el "andamio" (scaffolding) con todas las combinaciones posibles
-df_scaffold_index = pd.MultiIndex.from_product([all_aps_data['name'].unique(), all_times], names=['name', 'timestamp_str'])
-df_scaffold = pd.DataFrame(index=df_scaffold_index).reset_index()
+# --- 4. Preparar Datos para TimestampedGeoJson (solo formato folium) ---
+def build_scaffold(df_master, df_ap_locations):
+    # Obtenemos todos los APs únicos y todos los tiempos únicos
+    all_aps_data = df_ap_locations[['name', 'lat', 'lon', 'building_name']]
+    all_times = sorted(df_master['timestamp_str'].unique()) # Nos aseguramos de que el tiempo esté ordenado
 
-# 2. Unir el andamio con los datos de AP (para tener lat/lon siempre)
-df_master_full = pd.merge(df_scaffold, all_aps_data, on='name', how='left')
+    # 1. Crear el "andamio" (scaffolding) con todas las combinaciones posibles
+    df_scaffold_index = pd.MultiIndex.from_product([all_aps_data['name'].unique(), all_times], names=['name', 'timestamp_str'])
+    df_scaffold = pd.DataFrame(index=df_scaffold_index).reset_index()
 
-# 3. Unir con los datos de métricas (esto creará 'NaN' donde no haya datos)
-df_master_full = pd.merge(
-    df_master_full, 
-    df_master, 
-    on=['name', 'timestamp_str', 'lat', 'lon', 'building_name'], 
-    how='left'
-)
+    # 2. Unir el andamio con los datos de AP (para tener lat/lon siempre)
+    df_master_full = pd.merge(df_scaffold, all_aps_data, on='name', how='left')
 
-print(f"Formateando datos GeoJSON para los mapas dinámicos (Total features: {len(df_master_full)})...")
+    # 3. Unir con los datos de métricas (esto creará 'NaN' donde no haya datos)
+    df_master_full = pd.merge(
+        df_master_full,
+        df_master,
+        on=['name', 'timestamp_str', 'lat', 'lon', 'building_name'],
+        how='left'
+    )
 
-# --- Definir escalas de color y tamaño ---
-cmap_bueno_es_verde = branca.colormap.LinearColormap(['red', 'yellow', 'green'], vmin=0, vmax=100)
-max_clients_global = df_master['num_clients_metricos'].max()
-if pd.isna(max_clients_global) or max_clients_global == 0: max_clients_global = 1 
-cmap_mucho_es_rojo = branca.colormap.LinearColormap(['green', 'yellow', 'red'], vmin=0, vmax=max_clients_global)
+    return df_master_full[TIMELINE_COLUMNS]
 
-# Estilo INVISIBLE para APs sin datos
-style_invisible = {
-    'color': '#000000', 'fillColor': '#000000',
-    'opacity': 0.0, 'fillOpacity': 0.0, 'weight': 0, 'radius': 0
-}
 
 # --- Función para crear las "features" de GeoJSON (corregida) ---
 def create_feature(row, timestamp, iconstyle, popup):
@@ -160,78 +222,102 @@ def create_feature(row, timestamp, iconstyle, popup):
         'type': 'Feature',
         'geometry': {
             'type': 'Point',
-            'coordinates': [row['lon'], row['lat']]
+            'coordinates': [row.lon, row.lat]
         },
         'properties': {
             'time': timestamp,
-            'icon': 'circle',       
-            'iconstyle': iconstyle,   
+            'icon': 'circle',
+            'iconstyle': iconstyle,
             'popup': popup
         }
     }
 
-features_health = []
-features_signal = []
-features_clients = []
-
-# Iteramos sobre el dataframe COMPLETO (df_master_full)
-for _, row in df_master_full.iterrows():
-    ts = row['timestamp_str']
-    
-    # Comprobamos si hay datos para esta hora/AP
-    is_active = not pd.isna(row['avg_health'])
-    
-    if is_active:
-        # --- Si está ACTIVO, creamos estilos VISIBLES ---
-        popup_html = (f"<b>AP:</b> {row['name']}<br>"
-                      f"<b>Edificio:</b> {row['building_name']}<br>"
-                      f"<b>Hora:</b> {ts}<br>"
-                      f"<b>Health:</b> {row['avg_health']:.1f}<br>"
-                      f"<b>Señal:</b> {row['avg_signal_db']:.1f} dBm<br>"
-                      f"<b>Clientes:</b> {row['num_clients_metricos']}")
-        
-        # 1. Estilo Health
-        health_color = cmap_bueno_es_verde(row['avg_health'])
-        style_health = {
-            'color': health_color, 'fillColor': health_color,
-            'opacity': 0.8, 'fillOpacity': 0.6, 'weight': 1, 'radius': 15
-        }
-        
-        # 2. Estilo Signal
-        signal_weight = (100 + row['avg_signal_db']) 
-        signal_color = cmap_bueno_es_verde(signal_weight)
-        style_signal = {
-            'color': signal_color, 'fillColor': signal_color,
-            'opacity': 0.8, 'fillOpacity': 0.6, 'weight': 1, 'radius': 15
-        }
 
-        # 3. Estilo Clientes
-        client_radius = linear_scale(row['num_clients_metricos'], 0, max_clients_global, 5, 40)
-        client_color = cmap_mucho_es_rojo(row['num_clients_metricos'])
-        style_clients = {
-            'color': client_color, 'fillOpacity': 0.0, 'opacity': 0.7,
-            'weight': 3, 'radius': client_radius
-        }
-    
-    else:
-        # --- Si está INACTIVO, creamos estilos INVISIBLES ---
-        popup_html = f"<b>AP:</b> {row['name']}<br><b>Hora:</b> {ts}<br>Sin datos"
-        
-        style_health = style_invisible
-        style_signal = style_invisible
-        style_clients = style_invisible
-    
-    # Añadimos la feature (visible o invisible)
-    features_health.append(create_feature(row, ts, style_health, popup_html))
-    features_signal.append(create_feature(row, ts, style_signal, popup_html))
-    features_clients.append(create_feature(row, ts, style_clients, popup_html))
-
-print(f"Datos GeoJSON preparados.")
+def iter_timeline(part_paths):
+    """Particiones de la línea de tiempo leídas de disco de una en una."""
+    for path in part_paths:
+        yield pd.read_pickle(path)
+
+
+def iter_features(frames, metric, max_clients_global):
+    """
+    Genera las features de UNA métrica ('health', 'signal' o 'clients') de una en una,
+    sin construir nunca la lista completa en memoria. `frames` son las particiones
+    de la línea de tiempo.
+    """
+    # --- Definir escalas de color y tamaño ---
+    cmap_bueno_es_verde = branca.colormap.LinearColormap(['red', 'yellow', 'green'], vmin=0, vmax=100)
+    cmap_mucho_es_rojo = branca.colormap.LinearColormap(['green', 'yellow', 'red'], vmin=0, vmax=max_clients_global)
+
+    # Iteramos sobre todas las particiones (andamio completo AP x hora)
+    rows = (row for frame in frames for row in frame.itertuples(index=False))
+    for row in rows:
+        ts = row.timestamp_str
+
+        # Comprobamos si hay datos para esta hora/AP
+        is_active = not pd.isna(row.avg_health)
+
+        if is_active:
+            # --- Si está ACTIVO, creamos estilos VISIBLES ---
+            popup_html = (f"<b>AP:</b> {row.name}<br>"
+                          f"<b>Edificio:</b> {row.building_name}<br>"
+                          f"<b>Hora:</b> {ts}<br>"
+                          f"<b>Health:</b> {row.avg_health:.1f}<br>"
+                          f"<b>Señal:</b> {row.avg_signal_db:.1f} dBm<br>"
+                          f"<b>Clientes:</b> {row.num_clients_metricos}")
+
+            if metric == 'health':
+                # 1. Estilo Health
+                health_color = cmap_bueno_es_verde(row.avg_health)
+                style = {
+                    'color': health_color, 'fillColor': health_color,
+                    'opacity': 0.8, 'fillOpacity': 0.6, 'weight': 1, 'radius': 15
+                }
+            elif metric == 'signal':
+                # 2. Estilo Signal
+                signal_weight = (100 + row.avg_signal_db)
+                signal_color = cmap_bueno_es_verde(signal_weight)
+                style = {
+                    'color': signal_color, 'fillColor': signal_color,
+                    'opacity': 0.8, 'fillOpacity': 0.6, 'weight': 1, 'radius': 15
+                }
+            else:
+                # 3. Estilo Clientes
+                client_radius = linear_scale(row.num_clients_metricos, 0, max_clients_global, 5, 40)
+                client_color = cmap_mucho_es_rojo(row.num_clients_metricos)
+                style = {
+                    'color': client_color, 'fillOpacity': 0.0, 'opacity': 0.7,
+                    'weight': 3, 'radius': client_radius
+                }
+
+        else:
+            # --- Si está INACTIVO, creamos estilos INVISIBLES ---
+            popup_html = f"<b>AP:</b> {row.name}<br><b>Hora:</b> {ts}<br>Sin datos"
+            style = style_invisible
+
+        # Añadimos la feature (visible o invisible)
+        yield create_feature(row, ts, style, popup_html)
+
+
+def write_feature_collection(f, features):
+    """Serializa una FeatureCollection feature a feature directamente en el fichero."""
+    f.write('{"type": "FeatureCollection", "features": [')
+    for i, feature in enumerate(features):
+        if i:
+            f.write(', ')
+        f.write(json.dumps(feature))
+    f.write(']}')
+
 
 # --- 5. Función para crear y guardar los mapas (¡MODIFICADA!) ---
-def create_dynamic_bubble_map(features_list, ap_locations, output_filename, map_title):
+def create_dynamic_bubble_map(metric, part_paths, ap_locations, output_filename, map_title, max_clients_global):
+    """
+    Se ejecuta en un proceso del pool: lee de disco las particiones de la línea
+    de tiempo de una en una, genera las features de su métrica y las escribe en
+    streaming dentro del HTML, sin pasar por `m.save`.
+    """
     print(f"Creando mapa: {output_filename}...")
-    
+
     # --- ¡CAMBIO! Centramos en las coordenadas dadas con zoom 16 ---
     m = folium.Map(location=map_center_coords, zoom_start=16)
 
@@ -239,22 +325,22 @@ def create_dynamic_bubble_map(features_list, ap_locations, output_filename, map_
     fg_aps = folium.FeatureGroup(name='Mostrar Ubicación de APs')
     offset_lat = 0.00003
     offset_lon = 0.00004
-    for _, ap in ap_locations.iterrows():
+    for ap in ap_locations.itertuples(index=False):
         bounds_rect = [
-            [ap['lat'] - offset_lat, ap['lon'] - offset_lon],
-            [ap['lat'] + offset_lat, ap['lon'] + offset_lon]
+            [ap.lat - offset_lat, ap.lon - offset_lon],
+            [ap.lat + offset_lat, ap.lon + offset_lon]
         ]
         folium.Rectangle(
             bounds=bounds_rect,
             color="#e63946", fill=True, fill_color="#e63946", fill_opacity=0.6,
-            popup=f"<b>AP:</b> {ap['name']}<br><b>Edificio:</b> {ap['building_name']}"
+            popup=f"<b>AP:</b> {ap.name}<br><b>Edificio:</b> {ap.building_name}"
         ).add_to(fg_aps)
     fg_aps.add_to(m)
 
-    # Capa 2: Círculos Dinámicos
+    # Capa 2: Círculos Dinámicos (los datos se inyectan después, en streaming)
     TimestampedGeoJson(
-        {'type': 'FeatureCollection', 'features': features_list},
-        period='PT1H', 
+        GEOJSON_PLACEHOLDER,
+        period='PT1H',
         duration='PT1H', # <-- ¡ARREGLO PARA "STACKING"! (Cada círculo dura 1h)
         add_last_point=False, # <-- No dejar el último punto
         auto_play=False,
@@ -277,29 +363,153 @@ def create_dynamic_bubble_map(features_list, ap_locations, output_filename, map_
     m.get_root().html.add_child(folium.Element(title_html))
 
     folium.LayerControl().add_to(m)
-    m.save(output_filename)
+
+    # Renderizamos el "esqueleto" del HTML y escribimos el GeoJSON en medio
+    html_head, html_tail = m.get_root().render().split(GEOJSON_PLACEHOLDER, 1)
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        f.write(html_head)
+        write_feature_collection(f, iter_features(iter_timeline(part_paths), metric, max_clients_global))
+        f.write(html_tail)
+
     print(f"¡Mapa guardado! -> {output_filename}")
+    return output_filename
+
+
+def spill_timeline(df_master, df_ap_locations, directory):
+    """
+    Construye el andamio por tramos de horas y guarda cada tramo en disco, así
+    que ni el proceso principal ni los workers tienen nunca la línea de tiempo
+    entera en memoria: a los workers solo se les pasan las rutas.
+    """
+    print("Creando 'scaffolding' de tiempo/AP para evitar 'stacking'...")
+    all_times = sorted(df_master['timestamp_str'].unique())
+    times_per_part = max(1, TIMELINE_PART_ROWS // max(1, df_ap_locations['name'].nunique()))
+    paths = []
+    total = 0
+    for i in range(0, len(all_times), times_per_part):
+        times = all_times[i:i + times_per_part]
+        part = build_scaffold(df_master[df_master['timestamp_str'].isin(times)], df_ap_locations)
+        path = Path(directory) / f"timeline_{len(paths):05d}.pkl"
+        part.to_pickle(path)
+        paths.append(path)
+        total += len(part)
+    return paths, total
+
+
+def generate_folium_maps(maps, df_master, df_ap_locations, max_clients_global):
+    with tempfile.TemporaryDirectory(prefix="timeline_") as tmp_dir:
+        part_paths, total = spill_timeline(df_master, df_ap_locations, tmp_dir)
+        print(f"Formateando datos GeoJSON para los mapas dinámicos (Total features: {total}, {len(part_paths)} particiones)...")
+
+        # Un proceso por mapa; cada uno lee las particiones de disco
+        max_workers = min(len(maps), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(
+                    create_dynamic_bubble_map,
+                    metric, part_paths, df_ap_locations, output_filename, map_title, max_clients_global
+                )
+                for metric, output_filename, map_title in maps
+            ]
+            for future in as_completed(futures):
+                future.result()
+
+
+def generate_compact_maps(maps, df_master, df_ap_locations, out_dir, keyframe_interval, tolerance):
+    print("Codificando la línea de tiempo en formato binario compacto (keyframes + deltas)...")
+    data = timeline_codec.encode_timeline(df_master, df_ap_locations, keyframe_interval, tolerance)
+    for path, size in timeline_codec.write_precompressed(out_dir / OUTPUT_TIMELINE, data).items():
+        print(f"  {path} ({size / 1024:.1f} KB)")
+    if timeline_codec.brotli is None:
+        print("  (instala 'brotli' para generar también la variante .br)")
+
+    for metric, output_filename, map_title in maps:
+        html = timeline_codec.render_shell(metric, map_title, OUTPUT_TIMELINE, map_center_coords)
+        with open(output_filename, 'w', encoding='utf-8') as f:
+            f.write(html)
+        print(f"¡Mapa guardado! -> {output_filename}")
+
+
+def iso_date(value):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha no válida (usa YYYY-MM-DD): {value}")
+
+
+def split_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Genera los mapas dinámicos de health, señal y clientes.")
+    parser.add_argument(
+        '--format',
+        choices=['compact', 'folium'],
+        default='compact',
+        help="'compact': HTML ligero + timeline.bin(.gz/.br); 'folium': HTML autocontenido (legacy, muy pesado).",
+    )
+    parser.add_argument('--buildings', type=split_list, help="Códigos o nombres de edificio separados por comas (ej: 'V,BIBLIOTECA HUMANITATS').")
+    parser.add_argument('--aps', type=split_list, help="Nombres de AP o patrones glob separados por comas (ej: 'AP-VET*,AP-LLET32').")
+    parser.add_argument('--since', type=iso_date, help="Primer día incluido (YYYY-MM-DD).")
+    parser.add_argument('--until', type=iso_date, help="Último día incluido (YYYY-MM-DD).")
+    parser.add_argument(
+        '--metric',
+        choices=[metric for metric, _, _ in MAPS],
+        action='append',
+        help="Mapa a generar; se puede repetir. Por defecto, los tres.",
+    )
+    parser.add_argument(
+        '--keyframe-every',
+        type=int,
+        default=timeline_codec.DEFAULT_KEYFRAME_INTERVAL,
+        help="Horas entre estados completos en el formato compacto (el resto son deltas).",
+    )
+    parser.add_argument(
+        '--delta-tolerance',
+        type=int,
+        default=0,
+        help="Variación mínima (en unidades cuantizadas) para emitir un AP en un delta. 0 = exacto.",
+    )
+    parser.add_argument('--out-dir', type=Path, default=Path('.'), help="Carpeta donde escribir los mapas.")
+    parser.add_argument('--aps-file', default=FILE_APS, help=f"JSON de APs (por defecto {FILE_APS}).")
+    parser.add_argument('--clients-file', default=FILE_CLIENTS, help=f"JSON de clientes (por defecto {FILE_CLIENTS}).")
+    args = parser.parse_args()
+    if args.keyframe_every < 1 or args.delta_tolerance < 0:
+        parser.error("--keyframe-every debe ser >= 1 y --delta-tolerance >= 0")
+    if args.since and args.until and args.since > args.until:
+        parser.error("--since no puede ser posterior a --until")
+    return args
+
+
+def main():
+    args = parse_args()
+    print("Script iniciado...")
+
+    df_ap_locations = load_ap_locations(args.aps_file, args.buildings, args.aps)
+    if df_ap_locations.empty:
+        print("Error: Ningún AP coincide con los filtros indicados.")
+        exit()
+
+    # Si hay filtro de edificio/AP, solo se cargan las métricas de esos APs
+    ap_names = set(df_ap_locations['name']) if (args.buildings or args.aps) else None
+    df_metrics = load_client_metrics(args.clients_file, args.since, args.until, ap_names)
+    df_master, max_clients_global = merge_metrics_locations(df_metrics, df_ap_locations)
+
+    # --- 6. Generar los mapas pedidos ---
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    maps = [
+        (metric, str(args.out_dir / output_filename), map_title)
+        for metric, output_filename, map_title in MAPS
+        if not args.metric or metric in args.metric
+    ]
+    if args.format == 'folium':
+        generate_folium_maps(maps, df_master, df_ap_locations, max_clients_global)
+    else:
+        generate_compact_maps(maps, df_master, df_ap_locations, args.out_dir, args.keyframe_every, args.delta_tolerance)
+
+    print(f"\n¡Proceso completado! Revisa los {len(maps)} archivos .html generados en {args.out_dir}.")
+
 
-# --- 6. Generar los TRES mapas ---
-create_dynamic_bubble_map(
-    features_health,
-    df_ap_locations,
-    OUTPUT_MAP_HEALTH,
-    "Mapa Dinámico: Health (Color: 0=Rojo, 100=Verde)"
-)
-
-create_dynamic_bubble_map(
-    features_signal,
-    df_ap_locations,
-    OUTPUT_MAP_SIGNAL,
-    "Mapa Dinámico: Señal (Color: Malo=Rojo, Bueno=Verde)"
-)
-
-create_dynamic_bubble_map(
-    features_clients,
-    df_ap_locations,
-    OUTPUT_MAP_CLIENTS,
-    "Mapa Dinámico: Nº Clientes (Tamaño: Dinámico | Borde: Verde-Rojo)"
-)
-
-print("\n¡Proceso completado! Revisa los TRES archivos .html generados.")
+if __name__ == '__main__':
+    main()
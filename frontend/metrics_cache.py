@@ -0,0 +1,126 @@
+"""
+Caché incremental de `df_metrics` particionada por fecha.
+
+Cada día agregado (date, hour, AP) se guarda en su propio fichero junto a una
+huella (fingerprint) de las filas de clientes de ese día. En cada ejecución:
+
+- Si el fichero de clientes no ha cambiado (tamaño + mtime), se cargan las
+  particiones directamente sin leer el JSON.
+- Si ha cambiado, se lee una vez, se calcula la huella de cada día y solo se
+  vuelve a ejecutar el `groupby` de los días cuya huella no coincide.
+"""
+
+import json
+from pathlib import Path
+
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parent
+CACHE_DIR = BASE_DIR / 'cache' / 'metrics'
+MANIFEST_NAME = 'manifest.json'
+
+# Cambiar si cambia la forma de agregar: invalida todas las particiones
+AGG_VERSION = 1
+
+INPUT_COLUMNS = ['date', 'hour', 'associated_device_name', 'health', 'signal_db']
+
+
+def source_fingerprint(path):
+    stat = Path(path).stat()
+    return {'path': str(Path(path).resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def partition_fingerprints(df_clients):
+    """Huella por día, independiente del orden de las filas: nº de filas + suma de hashes."""
+    row_hashes = pd.util.hash_pandas_object(df_clients[INPUT_COLUMNS], index=False)
+    grouped = row_hashes.groupby(df_clients['date_key'])
+    fingerprints = {}
+    for date_key, hashes in grouped:
+        total = int(hashes.to_numpy().sum(dtype='uint64'))
+        fingerprints[date_key] = f"v{AGG_VERSION}-{len(hashes)}-{total:016x}"
+    return fingerprints
+
+
+def aggregate(df_clients):
+    df_metrics = df_clients.groupby(['date', 'hour', 'associated_device_name']).agg(
+        avg_health=('health', 'mean'),
+        avg_signal_db=('signal_db', 'mean'),
+        num_clients_metricos=('health', 'size')
+    ).reset_index()
+    return df_metrics.rename(columns={'associated_device_name': 'name'})
+
+
+class MetricsCache:
+    """Particiones `YYYY-MM-DD.pkl` + `manifest.json` con la huella de cada una."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.manifest_path = self.cache_dir / MANIFEST_NAME
+        self.manifest = {'source': None, 'partitions': {}}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    def _partition_path(self, date_key):
+        return self.cache_dir / f"{date_key}.pkl"
+
+    def _save_manifest(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        tmp_path.replace(self.manifest_path)
+
+    def is_fresh(self, source):
+        return (
+            self.manifest.get('source') == source
+            and all(self._partition_path(d).exists() for d in self.manifest['partitions'])
+        )
+
+    def date_keys(self, since=None, until=None):
+        """Particiones en caché dentro de [since, until] (fechas 'YYYY-MM-DD', ambos opcionales)."""
+        return sorted(
+            d for d in self.manifest['partitions']
+            if (since is None or d >= since) and (until is None or d <= until)
+        )
+
+    def load_partitions(self, date_keys=None):
+        keys = sorted(self.manifest['partitions'] if date_keys is None else date_keys)
+        frames = [pd.read_pickle(self._partition_path(d)) for d in keys]
+        if not frames:
+            return pd.DataFrame(columns=['date', 'hour', 'name', 'avg_health', 'avg_signal_db', 'num_clients_metricos'])
+        return pd.concat(frames, ignore_index=True)
+
+    def update(self, df_clients, source, full=True, since=None, until=None):
+        """
+        Recalcula solo los días cuya huella ha cambiado. Devuelve la lista de días recalculados.
+
+        Con `full=False` el DataFrame solo contiene el rango [since, until]: solo se
+        borran los días ausentes dentro de ese rango y la fuente no se marca como
+        procesada entera.
+        """
+        df_clients = df_clients.copy()
+        df_clients['date_key'] = pd.to_datetime(df_clients['date']).dt.strftime('%Y-%m-%d')
+        fingerprints = partition_fingerprints(df_clients)
+        partitions = self.manifest['partitions']
+
+        changed = [
+            d for d, fp in fingerprints.items()
+            if partitions.get(d, {}).get('fingerprint') != fp or not self._partition_path(d).exists()
+        ]
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if changed:
+            subset = df_clients[df_clients['date_key'].isin(changed)]
+            for date_key, df_day in subset.groupby('date_key'):
+                df_day_metrics = aggregate(df_day.drop(columns='date_key'))
+                df_day_metrics.to_pickle(self._partition_path(date_key))
+                partitions[date_key] = {'fingerprint': fingerprints[date_key], 'rows': len(df_day_metrics)}
+
+        # Días que ya no existen en la fuente (en una actualización parcial, solo dentro del rango)
+        in_scope = set(partitions) if full else set(self.date_keys(since, until))
+        for date_key in in_scope - set(fingerprints):
+            self._partition_path(date_key).unlink(missing_ok=True)
+            del partitions[date_key]
+        self.manifest['source'] = source if full else None
+        self._save_manifest()
+        return sorted(changed)
@@ -0,0 +1,229 @@
+"""
+Formato binario compacto para la línea de tiempo de los mapas dinámicos.
+
+En lugar de repetir una feature GeoJSON (coordenadas, estilo y popup) por
+cada AP y cada hora, el fichero `timeline.bin` guarda:
+
+- Una cabecera JSON con los nombres de APs, edificios, horas y la posición
+  de cada sección dentro del bloque de datos.
+- Las coordenadas de cada AP UNA sola vez (Float32 lat/lon).
+- Las métricas cuantizadas a tipos pequeños: health -> uint8 (0-100),
+  signal -> int8 (dBm), clientes -> uint16.
+- Los "frames" de la animación como keyframe + deltas: cada
+  `keyframe_interval` horas se guarda el estado completo (solo APs con
+  datos) y en las horas intermedias solo los APs cuyas métricas han cambiado
+  respecto al último valor emitido (más de `tolerance` unidades). El
+  reproductor aplica cada delta sobre el estado anterior y solo repinta los
+  marcadores que cambian.
+
+Layout:  b'UABT' | uint32 versión | uint32 len(cabecera) | cabecera JSON |
+         relleno hasta múltiplo de 4 | secciones (alineadas a 4 bytes)
+
+Junto al `.bin` se escriben las variantes precomprimidas `.gz` y, si está
+instalado el paquete opcional `brotli`, `.br`. El decodificador JS vive en
+`templates/timeline_map.html`.
+"""
+
+import gzip
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:  # Dependencia opcional: sin ella solo se genera la variante .gz
+    brotli = None
+
+BASE_DIR = Path(__file__).resolve().parent
+TEMPLATE_FILE = BASE_DIR / 'templates' / 'timeline_map.html'
+
+MAGIC = b'UABT'
+FORMAT_VERSION = 2
+
+# Cada cuántas horas se guarda un estado completo
+DEFAULT_KEYFRAME_INTERVAL = 24
+
+# (columna de df_master, dtype, valor "sin datos")
+METRICS = {
+    'health': ('avg_health', np.uint8, 255),
+    'signal': ('avg_signal_db', np.int8, -128),
+    'clients': ('num_clients_metricos', np.uint16, 65535),
+}
+DTYPE_NAMES = {np.uint8: 'u8', np.int8: 'i8', np.uint16: 'u16'}
+
+
+def _align4(n):
+    return (n + 3) & ~3
+
+
+def build_frames(matrices, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL, tolerance=0):
+    """
+    Convierte las matrices [hora][AP] en frames keyframe + delta.
+
+    Devuelve (offsets, aps, valores por métrica): las entradas del frame `t`
+    son `aps[offsets[t]:offsets[t + 1]]`. Los keyframes listan todos los APs
+    con datos (el resto se da por "sin datos"); los deltas, solo los APs que
+    aparecen/desaparecen o cuya métrica varía más de `tolerance` respecto al
+    último valor emitido, de modo que el error nunca se acumula.
+    """
+    missing = {metric: METRICS[metric][2] for metric in matrices}
+    n_times, n_aps = matrices['health'].shape
+    offsets = [0]
+    chunks_ap = []
+    chunks_values = {metric: [] for metric in matrices}
+    state = {metric: np.full(n_aps, missing[metric], dtype=m.dtype) for metric, m in matrices.items()}
+
+    for t in range(n_times):
+        current = {metric: m[t] for metric, m in matrices.items()}
+        if t % keyframe_interval == 0:
+            idx = np.flatnonzero(current['health'] != missing['health'])
+            for metric in matrices:
+                state[metric][:] = current[metric]
+        else:
+            changed = np.zeros(n_aps, dtype=bool)
+            for metric in matrices:
+                prev_missing = state[metric] == missing[metric]
+                cur_missing = current[metric] == missing[metric]
+                diff = np.abs(current[metric].astype(np.int32) - state[metric].astype(np.int32)) > tolerance
+                changed |= (prev_missing != cur_missing) | (~cur_missing & diff)
+            idx = np.flatnonzero(changed)
+            for metric in matrices:
+                state[metric][idx] = current[metric][idx]
+
+        chunks_ap.append(idx.astype('<u2'))
+        for metric in matrices:
+            chunks_values[metric].append(current[metric][idx])
+        offsets.append(offsets[-1] + idx.size)
+
+    def concat(chunks, dtype):
+        return np.concatenate(chunks).astype(dtype) if chunks else np.zeros(0, dtype=dtype)
+
+    values = {metric: concat(chunks_values[metric], matrices[metric].dtype) for metric in matrices}
+    return np.array(offsets, dtype='<u4'), concat(chunks_ap, '<u2'), values
+
+
+def quantize(df_master, ap_index, time_index, n_aps, n_times):
+    """Rellena una matriz [hora][AP] por métrica con los valores redondeados."""
+    matrices = {}
+    rows = time_index.to_numpy()
+    cols = ap_index.to_numpy()
+    for metric, (column, dtype, missing) in METRICS.items():
+        info = np.iinfo(dtype)
+        # El valor "sin datos" queda fuera del rango útil
+        lo, hi = (info.min + 1, info.max) if missing == info.min else (info.min, info.max - 1)
+        matrix = np.full((n_times, n_aps), missing, dtype=dtype)
+        values = np.clip(np.rint(df_master[column].to_numpy(dtype=float)), lo, hi).astype(dtype)
+        matrix[rows, cols] = values
+        matrices[metric] = matrix
+    return matrices
+
+
+def encode_timeline(df_master, ap_locations, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL, tolerance=0):
+    """
+    `df_master`: filas (name, timestamp_str, avg_health, avg_signal_db, num_clients_metricos).
+    `ap_locations`: todas las APs a dibujar (name, lat, lon, building_name).
+    Devuelve los bytes de `timeline.bin`.
+    """
+    ap_locations = ap_locations.drop_duplicates(subset='name').reset_index(drop=True)
+    names = ap_locations['name'].tolist()
+    ap_pos = pd.Series(np.arange(len(names)), index=names)
+
+    df = df_master[df_master['name'].isin(ap_pos.index)]
+    times = pd.to_datetime(pd.Series(sorted(df['timestamp_str'].unique())))
+    start = times.iloc[0] if len(times) else pd.Timestamp(0)
+    hours = ((times - start) // pd.Timedelta(hours=1)).astype(int).tolist()
+    time_pos = pd.Series(np.arange(len(times)), index=times.dt.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    matrices = quantize(df, ap_pos.loc[df['name']], time_pos.loc[df['timestamp_str']], len(names), len(times))
+
+    buildings = sorted(ap_locations['building_name'].fillna('N/A').astype(str).unique())
+    building_pos = {b: i for i, b in enumerate(buildings)}
+
+    blobs = []
+    offset = 0
+
+    def add_blob(data):
+        nonlocal offset
+        start_offset = offset
+        blobs.append(data)
+        offset += len(data)
+        padding = _align4(offset) - offset
+        if padding:
+            blobs.append(b'\0' * padding)
+            offset += padding
+        return start_offset
+
+    sections = {
+        'lat': {'offset': add_blob(ap_locations['lat'].to_numpy(dtype='<f4').tobytes()), 'dtype': 'f32'},
+        'lon': {'offset': add_blob(ap_locations['lon'].to_numpy(dtype='<f4').tobytes()), 'dtype': 'f32'},
+        'building': {
+            'offset': add_blob(np.array([building_pos[str(b)] for b in ap_locations['building_name'].fillna('N/A')],
+                                        dtype='<u2').tobytes()),
+            'dtype': 'u16',
+        },
+    }
+    offsets, frame_aps, frame_values = build_frames(matrices, keyframe_interval, tolerance)
+    sections['frame_offsets'] = {'offset': add_blob(offsets.tobytes()), 'dtype': 'u32', 'count': int(offsets.size)}
+    sections['frame_ap'] = {'offset': add_blob(frame_aps.tobytes()), 'dtype': 'u16', 'count': int(frame_aps.size)}
+    for metric, values in frame_values.items():
+        dtype, missing = METRICS[metric][1], METRICS[metric][2]
+        sections[metric] = {
+            'offset': add_blob(values.astype(np.dtype(dtype).newbyteorder('<')).tobytes()),
+            'dtype': DTYPE_NAMES[dtype],
+            'count': int(values.size),
+            'missing': int(missing),
+        }
+
+    header = {
+        'version': FORMAT_VERSION,
+        'n_aps': len(names),
+        'n_times': len(times),
+        'keyframe_interval': keyframe_interval,
+        'start': start.strftime('%Y-%m-%dT%H:%M:%S'),
+        'hours': hours,
+        'names': names,
+        'buildings': buildings,
+        'max_clients': int(matrices['clients'][matrices['clients'] != METRICS['clients'][2]].max(initial=1)),
+        'sections': sections,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    prefix = MAGIC + struct.pack('<II', FORMAT_VERSION, len(header_bytes)) + header_bytes
+    prefix += b'\0' * (_align4(len(prefix)) - len(prefix))
+    return prefix + b''.join(blobs)
+
+
+def write_precompressed(path, data):
+    """Escribe `path` y sus variantes `.gz` / `.br`. Devuelve {ruta: bytes}."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = {path: len(data)}
+    path.write_bytes(data)
+
+    gz_path = path.with_name(path.name + '.gz')
+    gz_data = gzip.compress(data, compresslevel=9, mtime=0)
+    gz_path.write_bytes(gz_data)
+    written[gz_path] = len(gz_data)
+
+    if brotli is not None:
+        br_path = path.with_name(path.name + '.br')
+        br_data = brotli.compress(data, quality=11)
+        br_path.write_bytes(br_data)
+        written[br_path] = len(br_data)
+    return written
+
+
+def render_shell(metric, map_title, data_url, center):
+    """HTML ligero (Leaflet + decodificador JS) que carga `data_url` al abrirse."""
+    template = TEMPLATE_FILE.read_text(encoding='utf-8')
+    replacements = {
+        '{{TITLE}}': map_title,
+        '{{METRIC}}': metric,
+        '{{DATA_URL}}': data_url,
+        '{{CENTER}}': json.dumps([float(c) for c in center]),
+    }
+    for key, value in replacements.items():
+        template = template.replace(key, value)
+    return template
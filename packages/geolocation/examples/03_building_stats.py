@@ -2,17 +2,28 @@
 Ejemplo 3: Estadisticas por Edificio
 UAB THE HACK! 2025 - DTIC WiFi Analysis
 
-Analiza y visualiza estadisticas de uso WiFi por edificio.
+Analiza y visualiza estadisticas de uso WiFi por edificio y planta a lo largo
+de TODO el historico de snapshots de APs (no solo el ultimo).
 
-Ejecutar: python 03_building_stats.py
+Los snapshots se leen de uno en uno (una sola pasada secuencial) y cada AP se
+asigna a su edificio/planta con un mapeo precalculado desde el GeoJSON. Por
+cada snapshot solo se guardan agregados por edificio y por planta (sumas,
+conteos y maximos), asi que la memoria no crece con el numero de APs.
+
+Ejecutar: python 03_building_stats.py [--since 2025-04-01] [--until 2025-06-30]
 """
 
-import geopandas as gpd
-import pandas as pd
+import argparse
 import json
-import matplotlib.pyplot as plt
+import re
+from datetime import datetime
 from pathlib import Path
 
+import geopandas as gpd
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
 print("=" * 70)
 print("ANALISIS POR EDIFICIO - WiFi UAB")
 print("=" * 70)
@@ -23,78 +34,176 @@ PROJECT_ROOT = BASE_DIR.parent.parent
 GEO_FILE = BASE_DIR / 'data' / 'aps_geolocalizados_wgs84.geojson'
 WIFI_DIR = PROJECT_ROOT / 'data' / 'raw' / 'anonymized_data' / 'aps'
 
+TIMESTAMP_RE = re.compile(r'(\d{4}-\d{2}-\d{2}T\d{2}_\d{2}_\d{2})')
+
+parser = argparse.ArgumentParser(description="Estadisticas WiFi por edificio y planta (historico completo).")
+parser.add_argument('--since', help="Primer dia incluido (YYYY-MM-DD).")
+parser.add_argument('--until', help="Ultimo dia incluido (YYYY-MM-DD).")
+args = parser.parse_args()
+
+
+def snapshot_time(path):
+    """Hora local del snapshot a partir del nombre (AP-info-v2-2025-04-03T00_15_01+02_00.json)."""
+    match = TIMESTAMP_RE.search(path.name)
+    return datetime.strptime(match.group(1), '%Y-%m-%dT%H_%M_%S') if match else None
+
+
+def field(records, key):
+    """Columna numerica de una lista de dicts, con NaN para nulos."""
+    values = [r.get(key) for r in records]
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
 # Cargar datos
-print("\n[1/3] Cargando datos...")
+print("\n[1/4] Cargando geolocalizacion y listando snapshots...")
 gdf_geo = gpd.read_file(GEO_FILE)
 
-wifi_files = sorted(WIFI_DIR.glob('*.json'))
+# Mapeo AP -> indice de edificio y de (edificio, planta), calculado una sola vez
+buildings = sorted(gdf_geo['USER_EDIFI'].dropna().unique())
+building_idx = {name: i for i, name in enumerate(buildings)}
+floors = sorted({(row.USER_EDIFI, int(row.Num_Planta)) for row in gdf_geo.itertuples()
+                 if pd.notna(row.USER_EDIFI) and pd.notna(row.Num_Planta)})
+floor_idx = {key: i for i, key in enumerate(floors)}
+ap_building = {}
+ap_floor = {}
+for row in gdf_geo.itertuples():
+    if pd.isna(row.USER_EDIFI):
+        continue
+    ap_building[row.USER_NOM_A] = building_idx[row.USER_EDIFI]
+    if pd.notna(row.Num_Planta):
+        ap_floor[row.USER_NOM_A] = floor_idx[(row.USER_EDIFI, int(row.Num_Planta))]
+num_aps_building = np.bincount(list(ap_building.values()), minlength=len(buildings))
+
+wifi_files = []
+for path in WIFI_DIR.glob('*.json'):
+    ts = snapshot_time(path)
+    if ts is None:
+        continue
+    if args.since and ts.date().isoformat() < args.since:
+        continue
+    if args.until and ts.date().isoformat() > args.until:
+        continue
+    wifi_files.append((ts, path))
+wifi_files.sort()
+
 if not wifi_files:
     print("  ERROR - No se encontraron archivos WiFi")
     exit(1)
+print(f"  OK - {len(gdf_geo)} APs geolocalizados, {len(buildings)} edificios, {len(wifi_files)} snapshots")
+
+# Pasada secuencial: por snapshot, agregados por edificio [T, B] y por planta [T, F]
+print("\n[2/4] Recorriendo snapshots...")
+T, B, F = len(wifi_files), len(buildings), len(floors)
+clients_b = np.zeros((T, B))
+clients_max_b = np.zeros((T, B))  # AP mas cargado del edificio en el snapshot
+cpu_sum_b = np.zeros((T, B))
+cpu_n_b = np.zeros((T, B))
+active_b = np.zeros((T, B))
+clients_f = np.zeros((T, F))
+active_f = np.zeros((T, F))
+times = []
 
-with open(wifi_files[-1], 'r') as f:
-    wifi_data = json.load(f)
-df_wifi = pd.DataFrame(wifi_data)
+for t, (ts, path) in enumerate(wifi_files):
+    times.append(ts)
+    with open(path, 'r') as f:
+        records = [r for r in json.load(f) if isinstance(r, dict)]
 
-# Combinar
-df_merged = df_wifi.merge(
-    gdf_geo[['USER_NOM_A', 'USER_EDIFI', 'Num_Planta', 'geometry']],
-    left_on='name',
-    right_on='USER_NOM_A',
-    how='inner'
-)
+    names = [r.get('name') for r in records]
+    b = np.array([ap_building.get(n, -1) for n in names], dtype=int)
+    fl = np.array([ap_floor.get(n, -1) for n in names], dtype=int)
+    clients = np.nan_to_num(field(records, 'client_count'))
+    cpu = field(records, 'cpu_utilization')
+    up = np.array([r.get('status') == 'Up' for r in records], dtype=float)
 
-gdf_merged = gpd.GeoDataFrame(df_merged, geometry='geometry', crs='EPSG:4326')
-print(f"  OK - {len(gdf_merged)} APs analizados")
+    ok = b >= 0
+    clients_b[t] = np.bincount(b[ok], clients[ok], minlength=B)
+    np.maximum.at(clients_max_b[t], b[ok], clients[ok])
+    active_b[t] = np.bincount(b[ok], up[ok], minlength=B)
+    has_cpu = ok & ~np.isnan(cpu)
+    cpu_sum_b[t] = np.bincount(b[has_cpu], cpu[has_cpu], minlength=B)
+    cpu_n_b[t] = np.bincount(b[has_cpu], minlength=B)
 
-# Analisis por edificio
-print("\n[2/3] Calculando estadisticas por edificio...")
+    ok = fl >= 0
+    clients_f[t] = np.bincount(fl[ok], clients[ok], minlength=F)
+    active_f[t] = np.bincount(fl[ok], up[ok], minlength=F)
 
-stats = gdf_merged.groupby('USER_EDIFI').agg({
-    'name': 'count',
-    'client_count': ['sum', 'mean', 'max'],
-    'cpu_utilization': 'mean',
-    'status': lambda x: (x == 'Up').sum()
-}).round(2)
+    if (t + 1) % 500 == 0:
+        print(f"  {t + 1}/{T} snapshots procesados")
 
-stats.columns = ['num_aps', 'total_clients', 'avg_clients', 'max_clients', 'avg_cpu', 'aps_activos']
-stats = stats.sort_values('total_clients', ascending=False)
+print(f"  OK - {T} snapshots de {times[0]:%Y-%m-%d %H:%M} a {times[-1]:%Y-%m-%d %H:%M}")
+
+# Analisis por edificio sobre todo el historico
+print("\n[3/4] Calculando estadisticas por edificio y planta...")
+
+with np.errstate(invalid='ignore', divide='ignore'):
+    stats = pd.DataFrame({
+        'num_aps': num_aps_building,
+        'aps_activos': active_b.mean(axis=0),
+        'avg_total_clients': clients_b.mean(axis=0),  # clientes simultaneos de media
+        'peak_total_clients': clients_b.max(axis=0),
+        'max_clients_ap': clients_max_b.max(axis=0),
+        'avg_clients': clients_b.sum(axis=0) / active_b.sum(axis=0),  # por AP activo
+        'avg_cpu': cpu_sum_b.sum(axis=0) / cpu_n_b.sum(axis=0),
+    }, index=pd.Index(buildings, name='USER_EDIFI')).round(2)
+stats = stats.sort_values('avg_total_clients', ascending=False)
+
+# Series temporales diarias (medias y picos de los snapshots de cada dia)
+days = pd.DatetimeIndex(times).normalize()
+with np.errstate(invalid='ignore', divide='ignore'):
+    cpu_b = cpu_sum_b / cpu_n_b
+building_daily = pd.concat({
+    'clients_mean': pd.DataFrame(clients_b, columns=buildings).groupby(days).mean().stack(),
+    'clients_peak': pd.DataFrame(clients_b, columns=buildings).groupby(days).max().stack(),
+    'aps_activos': pd.DataFrame(active_b, columns=buildings).groupby(days).mean().stack(),
+    'cpu_mean': pd.DataFrame(cpu_b, columns=buildings).groupby(days).mean().stack(),
+}, axis=1).round(2)
+building_daily.index.names = ['fecha', 'USER_EDIFI']
+
+floor_columns = pd.MultiIndex.from_tuples(floors, names=['USER_EDIFI', 'Num_Planta'])
+floor_daily = pd.concat({
+    'clients_mean': pd.DataFrame(clients_f, columns=floor_columns).groupby(days).mean().stack(['USER_EDIFI', 'Num_Planta']),
+    'clients_peak': pd.DataFrame(clients_f, columns=floor_columns).groupby(days).max().stack(['USER_EDIFI', 'Num_Planta']),
+    'aps_activos': pd.DataFrame(active_f, columns=floor_columns).groupby(days).mean().stack(['USER_EDIFI', 'Num_Planta']),
+}, axis=1).round(2)
+floor_daily.index.names = ['fecha', 'USER_EDIFI', 'Num_Planta']
+
+# Distribucion por planta (todas las plantas con el mismo numero juntas)
+planta_of = np.array([p for _, p in floors])
+planta_stats = pd.DataFrame({
+    'name': pd.Series(planta_of[list(ap_floor.values())]).value_counts(),
+    'client_count': pd.Series(clients_f.mean(axis=0)).groupby(planta_of).sum(),
+}).fillna(0).sort_index()
 
 print("  OK - Estadisticas calculadas")
 
 # Mostrar resultados
 print("\n" + "=" * 70)
-print("TOP 15 EDIFICIOS POR TOTAL DE CLIENTES")
+print("TOP 15 EDIFICIOS POR CLIENTES SIMULTANEOS (MEDIA DEL HISTORICO)")
 print("=" * 70)
-print(f"\n{'Edificio':45s} {'APs':>5s} {'Activos':>7s} {'Clientes':>9s} {'Prom':>5s} {'CPU%':>5s}")
-print("-" * 70)
+print(f"\n{'Edificio':40s} {'APs':>5s} {'Activos':>7s} {'Media':>7s} {'Pico':>6s} {'Prom':>5s} {'CPU%':>5s}")
+print("-" * 80)
 
 for building, row in stats.head(15).iterrows():
-    print(f"{building[:44]:45s} "
+    print(f"{building[:39]:40s} "
           f"{int(row['num_aps']):5d} "
-          f"{int(row['aps_activos']):7d} "
-          f"{int(row['total_clients']):9d} "
+          f"{row['aps_activos']:7.1f} "
+          f"{row['avg_total_clients']:7.1f} "
+          f"{int(row['peak_total_clients']):6d} "
           f"{row['avg_clients']:5.1f} "
           f"{row['avg_cpu']:5.1f}")
 
-# Analisis por planta
 print("\n" + "=" * 70)
 print("DISTRIBUCION POR PLANTA")
 print("=" * 70)
 
-planta_stats = gdf_merged.groupby('Num_Planta').agg({
-    'name': 'count',
-    'client_count': 'sum'
-}).sort_index()
-
-print(f"\n{'Planta':20s} {'APs':>6s} {'Clientes':>10s}")
-print("-" * 40)
+print(f"\n{'Planta':20s} {'APs':>6s} {'Clientes (media)':>17s}")
+print("-" * 45)
 for planta, row in planta_stats.iterrows():
     planta_name = f"Planta {planta}" if planta >= 0 else f"Sotano {abs(planta)}"
-    print(f"{planta_name:20s} {int(row['name']):6d} {int(row['client_count']):10d}")
+    print(f"{planta_name:20s} {int(row['name']):6d} {row['client_count']:17.1f}")
 
 # Visualizacion
-print("\n[3/3] Creando graficos...")
+print("\n[4/4] Creando graficos...")
 
 fig, axes = plt.subplots(2, 2, figsize=(15, 12))
 fig.suptitle('Analisis WiFi por Edificio - UAB Campus', fontsize=16, fontweight='bold')
@@ -102,24 +211,24 @@ fig.suptitle('Analisis WiFi por Edificio - UAB Campus', fontsize=16, fontweight=
 # Grafico 1: Top 10 edificios por clientes
 ax1 = axes[0, 0]
 top10 = stats.head(10)
-ax1.barh(range(len(top10)), top10['total_clients'], color='steelblue')
+ax1.barh(range(len(top10)), top10['avg_total_clients'], color='steelblue')
 ax1.set_yticks(range(len(top10)))
 ax1.set_yticklabels([name[:30] for name in top10.index], fontsize=9)
-ax1.set_xlabel('Total Clientes', fontsize=10)
-ax1.set_title('Top 10 Edificios por Total de Clientes', fontsize=11, fontweight='bold')
+ax1.set_xlabel('Clientes simultaneos (media)', fontsize=10)
+ax1.set_title('Top 10 Edificios por Clientes', fontsize=11, fontweight='bold')
 ax1.grid(axis='x', alpha=0.3)
 ax1.invert_yaxis()
 
-# Grafico 2: APs por edificio
+# Grafico 2: Tendencia diaria de los 5 edificios con mas clientes
 ax2 = axes[0, 1]
-top10_aps = stats.nlargest(10, 'num_aps')
-ax2.barh(range(len(top10_aps)), top10_aps['num_aps'], color='coral')
-ax2.set_yticks(range(len(top10_aps)))
-ax2.set_yticklabels([name[:30] for name in top10_aps.index], fontsize=9)
-ax2.set_xlabel('Numero de APs', fontsize=10)
-ax2.set_title('Top 10 Edificios por Numero de APs', fontsize=11, fontweight='bold')
-ax2.grid(axis='x', alpha=0.3)
-ax2.invert_yaxis()
+trend = building_daily['clients_mean'].unstack('USER_EDIFI')
+for name in stats.head(5).index:
+    ax2.plot(trend.index, trend[name], label=name[:25])
+ax2.set_ylabel('Clientes simultaneos (media diaria)', fontsize=10)
+ax2.set_title('Evolucion diaria - Top 5 Edificios', fontsize=11, fontweight='bold')
+ax2.legend(fontsize=8)
+ax2.grid(alpha=0.3)
+fig.autofmt_xdate()
 
 # Grafico 3: Distribucion por planta
 ax3 = axes[1, 0]
@@ -137,7 +246,7 @@ colors = ['green' if x >= stats['avg_clients'].median() else 'orange' for x in t
 ax4.barh(range(len(top10_avg)), top10_avg['avg_clients'], color=colors)
 ax4.set_yticks(range(len(top10_avg)))
 ax4.set_yticklabels([name[:30] for name in top10_avg.index], fontsize=9)
-ax4.set_xlabel('Clientes Promedio por AP', fontsize=10)
+ax4.set_xlabel('Clientes Promedio por AP activo', fontsize=10)
 ax4.set_title('Top 10 Edificios por Clientes/AP (Media)', fontsize=11, fontweight='bold')
 ax4.axvline(stats['avg_clients'].median(), color='red', linestyle='--', label='Mediana')
 ax4.legend()
@@ -151,18 +260,23 @@ output_file = BASE_DIR / 'estadisticas_edificios.png'
 plt.savefig(output_file, dpi=150, bbox_inches='tight')
 print(f"  OK - Grafico guardado en: {output_file.name}")
 
-# Guardar CSV con estadisticas
+# Guardar CSVs con estadisticas y series temporales
 csv_file = BASE_DIR / 'estadisticas_edificios.csv'
 stats.to_csv(csv_file)
-print(f"  OK - CSV guardado en: {csv_file.name}")
+building_csv = BASE_DIR / 'series_edificios_diarias.csv'
+building_daily.to_csv(building_csv)
+floor_csv = BASE_DIR / 'series_plantas_diarias.csv'
+floor_daily.to_csv(floor_csv)
+print(f"  OK - CSVs guardados en: {csv_file.name}, {building_csv.name}, {floor_csv.name}")
 
 print("\n" + "=" * 70)
 print("RESUMEN")
 print("=" * 70)
-print(f"\nTotal edificios analizados: {len(stats)}")
-print(f"Total APs activos: {int(stats['aps_activos'].sum())}")
-print(f"Total clientes conectados: {int(stats['total_clients'].sum())}")
-print(f"Promedio clientes por edificio: {stats['total_clients'].mean():.1f}")
+print(f"\nPeriodo analizado: {times[0]:%Y-%m-%d} a {times[-1]:%Y-%m-%d} ({T} snapshots)")
+print(f"Total edificios analizados: {len(stats)}")
+print(f"APs activos de media: {stats['aps_activos'].sum():.0f}")
+print(f"Clientes simultaneos de media: {stats['avg_total_clients'].sum():.0f}")
+print(f"Pico de clientes simultaneos: {int(clients_b.sum(axis=1).max())}")
 print(f"Edificio con mas clientes: {stats.index[0]}")
 print(f"Edificio con mas APs: {stats.nlargest(1, 'num_aps').index[0]}")
 
@@ -171,4 +285,5 @@ print("COMPLETADO")
 print("=" * 70)
 print(f"\nArchivos generados:")
 print(f"  - {output_file.name} (grafico)")
-print(f"  - {csv_file.name} (datos)")
+print(f"  - {csv_file.name} (resumen por edificio)")
+print(f"  - {building_csv.name}, {floor_csv.name} (series diarias)")